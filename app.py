@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, render_template, redirect, session
+from flask import Flask, request, jsonify, render_template, redirect, session, stream_with_context
 from functools import wraps
 import sqlite3
 import json
@@ -8,9 +8,35 @@ import requests
 from datetime import datetime
 import os
 from urllib.parse import quote
+from jinja2 import pass_context
+
+# 先把 .env 写入环境变量：下面导入的模块在导入时读取各自的配置
+from config import load_env_file
+load_env_file()
 
 # 导入语言支持
 from language import lang, LANGUAGES
+from language_resolver import LanguageResolver
+from code_dispenser import EXISTING_CODE_SQL, claim_code
+from db import Rollback, pool as db_pool, run_in_transaction
+from claim_writer import ClaimWriter, group_commit_enabled
+from migrations import migrate
+from survey_api import QueryError, query_surveys
+import change_log
+from change_log import record_change
+from counters import read_counters
+from survey_analytics import cross_tabs, problem_counts, record_survey_problems
+from rollup import EventBuffer, daily_surveys, query_series
+from translation_bundles import TranslationBundles
+from page_cache import PageCache
+from code_import import iter_import, parse_lines, spool_stream, strip_lines, text_lines
+from bulk_admin import DELETE_CONDITIONS, delete_codes_where, delete_staged_codes, reset_users
+from code_generator import CodeFactory, CodeRefiller, check_capacity, iter_generate
+from exports import iter_codes, iter_surveys, json_array_stream, ndjson_stream, survey_csv_stream
+from rate_limiter import RateLimiter
+from shared_memory import shm_path_for_database
+from data_version import DataVersion
+from http_cache import ConditionalGet
 
 app = Flask(__name__)
 
@@ -35,6 +61,7 @@ DOMAIN = os.environ.get('DOMAIN', 'https://gift.bihuoai.com')
 SECRET_KEY = os.environ.get('SECRET_KEY', 'your-secret-key-change-me')
 ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'admin123')
 API_TOKEN = os.environ.get('API_TOKEN', 'bihuoai-api-token-2024')  # API访问令牌
+DATABASE_PATH = os.environ.get('DATABASE_PATH', 'gift_codes.db')  # 数据库路径
 
 # IP限制配置
 IP_HOURLY_LIMIT = int(os.environ.get('IP_HOURLY_LIMIT', 3))  # 单IP每小时尝试次数
@@ -43,22 +70,17 @@ IP_DAILY_SUCCESS = int(os.environ.get('IP_DAILY_SUCCESS', 5))  # 单IP每天成
 app.secret_key = SECRET_KEY
 
 # 语言检测和切换
+language_resolver = LanguageResolver(lang, supported=tuple(LANGUAGES))
+
 def get_current_language():
     """获取当前语言"""
-    # 优先使用session中的语言设置
-    if 'language' in session:
-        print(f"使用Session中的语言: {session['language']}")
-        return session['language']
-
-    # 根据IP地址自动检测语言
-    ip_address = get_client_ip()
-    print(f"检测到的IP地址: {ip_address}")
-    detected_lang = lang.detect_language_from_ip(ip_address)
-    print(f"根据IP检测到的语言: {detected_lang}")
+    # 依次尝试 session、Accept-Language、IP缓存、离线IP库、在线查询
+    current_lang, stage = language_resolver.resolve(request, session, get_client_ip)
 
-    # 将检测结果保存到session
-    session['language'] = detected_lang
-    return detected_lang
+    # 将检测结果保存到session（爬虫、健康检查等请求不写session）
+    if stage not in ('session', 'policy', None):
+        session['language'] = current_lang
+    return current_lang
 
 def set_language(language):
     """设置语言"""
@@ -67,111 +89,65 @@ def set_language(language):
         return True
     return False
 
-# 尝试从.env文件读取配置
-def load_env():
-    try:
-        with open('.env', 'r', encoding='utf-8') as f:
-            for line in f:
-                if '=' in line and not line.startswith('#'):
-                    key, value = line.strip().split('=', 1)
-                    os.environ[key] = value
-                    globals()[key] = value
-    except FileNotFoundError:
-        pass
-
-# 加载配置
-load_env()
+# IP限流：计数保存在worker共享内存中，定期写回 ip_limits 表（每个数据库一份计数）
+rate_limiter = RateLimiter(
+    int(IP_HOURLY_LIMIT),
+    int(IP_DAILY_SUCCESS),
+    path=shm_path_for_database('gift_bihuoai_rate_limit', DATABASE_PATH),
+    connect=lambda: get_db_connection()
+)
+
+# 数据版本号：写操作提交后加1，只读接口据此返回304
+data_version = DataVersion(shm_path_for_database('gift_bihuoai_data_version', DATABASE_PATH))
+conditional_get = ConditionalGet()
+# 翻译接口支持的语言与 translations 目录中的文件一致
+translation_bundles = TranslationBundles(languages=lang.available_languages())
+
+# 按语言缓存渲染好的静态页面（/、/check_and_claim）
+page_cache = PageCache()
+
+# 领取尝试和拒绝次数，定期写入按天/小时的统计汇总表；
+# 只影响统计接口的时间序列，使用单独的版本号，不让其他接口的ETag失效
+stats_version = DataVersion(shm_path_for_database('gift_bihuoai_stats_version', DATABASE_PATH))
+rollup_events = EventBuffer(lambda: get_db_connection(), on_flush=lambda: stats_version.bump())
+
+# 领取请求的组提交（CLAIM_GROUP_COMMIT=1 时开启）
+claim_writer = ClaimWriter(lambda: get_db_connection()) if group_commit_enabled() else None
+
+# 剩余兑换码低于低水位（CODE_LOW_WATER）时在后台自动补充
+code_refiller = CodeRefiller(
+    lambda: get_db_connection(),
+    shm_path_for_database('gift_bihuoai_code_refill', DATABASE_PATH),
+    on_refill=lambda: data_version.bump()
+)
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization'
+}
+
+def current_data_version(**view_args):
+    return data_version.current()
+
+def current_stats_version(**view_args):
+    # 时间序列包含尝试/拒绝数，还取决于统计汇总的版本
+    if request.args.get('granularity'):
+        return f'{data_version.current()}.{stats_version.current()}'
+    return data_version.current()
 
 def init_database():
-    """初始化数据库（国际版纯净结构）"""
-    conn = sqlite3.connect('gift_codes.db')
+    """初始化数据库（按版本号执行尚未执行的结构迁移）"""
+    conn = sqlite3.connect(DATABASE_PATH)
     conn.execute("PRAGMA encoding='UTF-8';")
-    cursor = conn.cursor()
-
-    # 创建兑换码表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS codes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            code VARCHAR(32) UNIQUE NOT NULL,
-            is_used BOOLEAN DEFAULT FALSE,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            claimed_at TIMESTAMP NULL,
-            claimed_by_fingerprint VARCHAR(64) NULL
-        )
-    ''')
-
-    # 创建用户表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            device_fingerprint VARCHAR(64) UNIQUE NOT NULL,
-            email VARCHAR(255) UNIQUE NOT NULL,
-            ip_address VARCHAR(45),
-            fingerprint_data TEXT,
-            user_agent TEXT,
-            last_claim_attempt TIMESTAMP,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    # 创建调研表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS surveys (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            device_fingerprint VARCHAR(64) NOT NULL,
-            email VARCHAR(255) NOT NULL,
-            name VARCHAR(100),
-            country VARCHAR(100),
-            has_used_digital_human VARCHAR(10),
-            problems TEXT,
-            profession VARCHAR(50),
-            custom_profession VARCHAR(100),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    # 创建IP限制表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS ip_limits (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            ip_address VARCHAR(45) NOT NULL,
-            attempt_count INTEGER DEFAULT 1,
-            success_count INTEGER DEFAULT 0,
-            first_attempt TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_attempt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    # 创建索引
     try:
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_ip_address ON ip_limits(ip_address)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_last_attempt ON ip_limits(last_attempt)')
-    except sqlite3.OperationalError:
-        pass
-
-    # 数据库迁移：为已存在的surveys表添加name字段
-    try:
-        cursor.execute("ALTER TABLE surveys ADD COLUMN name VARCHAR(100)")
-    except sqlite3.OperationalError:
-        # 字段已存在，忽略
-        pass
-
-    # 数据库迁移：为已存在的surveys表添加country字段
-    try:
-        cursor.execute("ALTER TABLE surveys ADD COLUMN country VARCHAR(100)")
-    except sqlite3.OperationalError:
-        # 字段已存在，忽略
-        pass
-
-    conn.commit()
-    conn.close()
+        migrate(conn)
+    finally:
+        conn.close()
 
 def get_db_connection():
-    """获取数据库连接"""
-    conn = sqlite3.connect('gift_codes.db')
-    conn.execute("PRAGMA encoding='UTF-8';")  # 设置数据库编码为UTF-8
-    conn.row_factory = sqlite3.Row
-    return conn
+    """获取数据库连接（当前线程复用的长连接，close() 只归还不关闭）"""
+    return db_pool.connection(DATABASE_PATH)
 
 def admin_required(f):
     """管理员权限验证装饰器"""
@@ -210,98 +186,179 @@ def get_client_ip():
     return request.remote_addr
 
 def record_ip_attempt(ip_address, success=False):
-    """记录IP尝试"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # 查找今天的记录
-    cursor.execute('''
-        SELECT * FROM ip_limits
-        WHERE ip_address = ?
-        AND date(last_attempt) = date('now', 'localtime')
-    ''', (ip_address,))
-
-    record = cursor.fetchone()
-
-    if record:
-        # 更新现有记录
-        new_attempt_count = record['attempt_count'] + 1
-        new_success_count = record['success_count'] + (1 if success else 0)
-
-        cursor.execute('''
-            UPDATE ip_limits
-            SET attempt_count = ?,
-                success_count = ?,
-                last_attempt = datetime('now', 'localtime')
-            WHERE id = ?
-        ''', (new_attempt_count, new_success_count, record['id']))
+    """记录IP尝试（共享内存计数，不写数据库）"""
+    if success:
+        rate_limiter.record_success(ip_address)
     else:
-        # 创建新记录
-        cursor.execute('''
-            INSERT INTO ip_limits (ip_address, attempt_count, success_count)
-            VALUES (?, 1, ?)
-        ''', (ip_address, 1 if success else 0))
-
-    conn.commit()
-    conn.close()
-
-def validate_claim_eligibility(fingerprint, email, ip):
-    """验证领取资格（四层防护）"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+        rate_limiter.record_attempt(ip_address)
 
+def validate_claim_eligibility(fingerprint, email, ip, conn=None):
+    """验证领取资格（四层防护，传入conn时复用调用方的连接和事务）"""
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    try:
+        is_eligible, error_message = _check_identity(conn.cursor(), fingerprint, email)
+    finally:
+        if own_conn:
+            conn.close()
+    if not is_eligible:
+        return is_eligible, error_message
+    return _check_ip_limits(ip)
+
+# 领取流程中的查询（test_query_plans 检查它们的执行计划）
+FINGERPRINT_USED_SQL = 'SELECT 1 FROM users WHERE device_fingerprint = ?'
+EMAIL_USED_SQL = 'SELECT 1 FROM users WHERE email = ?'
+CODE_BY_EMAIL_SQL = '''
+    SELECT c.code FROM codes c
+    JOIN users u ON c.claimed_by_fingerprint = u.device_fingerprint
+    WHERE u.email = ?
+'''
+
+def _check_identity(cursor, fingerprint, email):
     # 第1层：设备指纹检查
-    cursor.execute('SELECT * FROM users WHERE device_fingerprint = ?', (fingerprint,))
+    cursor.execute(FINGERPRINT_USED_SQL, (fingerprint,))
     if cursor.fetchone():
-        conn.close()
         return False, '该设备已领取过兑换码'
 
     # 第2层：邮箱检查
-    cursor.execute('SELECT * FROM users WHERE email = ?', (email,))
+    cursor.execute(EMAIL_USED_SQL, (email,))
     if cursor.fetchone():
-        conn.close()
         return False, '该邮箱已被使用'
 
-    # 第3层：IP每日成功次数限制
-    cursor.execute('''
-        SELECT success_count
-        FROM ip_limits
-        WHERE ip_address = ?
-        AND date(last_attempt) = date('now', 'localtime')
-    ''', (ip,))
+    return True, 'OK'
 
-    ip_record = cursor.fetchone()
-    if ip_record and ip_record['success_count'] >= IP_DAILY_SUCCESS:
-        conn.close()
+def _check_ip_limits(ip):
+    # 第3层：IP每日成功次数限制；第4层：IP每小时尝试次数限制（均为共享内存O(1)检查）
+    allowed, reason = rate_limiter.check(ip)
+    if reason == 'daily':
         return False, f'该IP今日领取次数已达上限（{IP_DAILY_SUCCESS}次）'
+    if reason == 'hourly':
+        return False, '请求过于频繁，请稍后再试'
+    return True, 'OK'
+
+def find_existing_code(cursor, fingerprint, email):
+    """查询设备或邮箱已领取的兑换码"""
+    # 先尝试通过设备指纹查询
+    cursor.execute(EXISTING_CODE_SQL, (fingerprint,))
+    existing_code = cursor.fetchone()
 
-    # 第4层：IP每小时尝试次数限制
-    cursor.execute('''
-        SELECT COUNT(*) as recent_count
-        FROM ip_limits
-        WHERE ip_address = ?
-        AND datetime(last_attempt) > datetime('now', '-1 hour', 'localtime')
-    ''', (ip,))
+    # 如果设备指纹没找到，通过邮箱查询
+    if not existing_code:
+        cursor.execute(CODE_BY_EMAIL_SQL, (email,))
+        existing_code = cursor.fetchone()
 
-    recent = cursor.fetchone()
-    if recent and recent['recent_count'] >= IP_HOURLY_LIMIT:
+    return existing_code['code'] if existing_code else None
+
+def _existing_claim_result(cursor, fingerprint, email, error_message):
+    """已领取的设备或邮箱：返回已有兑换码"""
+    if error_message in ('该设备已领取过兑换码', '该邮箱已被使用'):
+        existing_code = find_existing_code(cursor, fingerprint, email)
+        if existing_code:
+            return {
+                'success': True,
+                'code': existing_code,
+                'message': '您已经领取过兑换码了！'
+            }
+    return None
+
+def process_claim(fingerprint, email, ip_address, user_agent, survey):
+    """
+    领取流程：保存用户和调研、分配兑换码在同一个 BEGIN IMMEDIATE 事务中完成，
+    只提交一次；任何一步失败整体回滚。IP计数在共享内存中完成，不写数据库。
+
+    返回 (是否符合资格, 错误信息, 结果数据)
+    """
+    def claim(conn):
+        cursor = conn.cursor()
+
+        # 持有写锁后再确认一次设备和邮箱（防止并发提交）
+        is_eligible, error_message = _check_identity(cursor, fingerprint, email)
+        if not is_eligible:
+            return False, error_message, _existing_claim_result(cursor, fingerprint, email, error_message)
+
+        # 保存用户信息到users表
+        cursor.execute('''
+            INSERT INTO users
+            (device_fingerprint, email, ip_address, user_agent, created_at, last_claim_attempt)
+            VALUES (?, ?, ?, ?, datetime('now', 'localtime'), datetime('now', 'localtime'))
+        ''', (fingerprint, email, ip_address, user_agent))
+
+        # 保存调研数据 - 使用北京时间
+        cursor.execute('''
+            INSERT INTO surveys
+            (device_fingerprint, email, name, country, has_used_digital_human, problems, profession, custom_profession, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now', 'localtime'))
+        ''', (fingerprint, email, survey['name'], survey['country'], survey['has_used_digital_human'],
+              survey['problems'], survey['profession'], survey['custom_profession']))
+        survey_id = cursor.lastrowid
+        record_survey_problems(cursor, survey_id, survey['problems'])
+        record_change(cursor, change_log.SURVEY, fingerprint, dict(survey, survey_id=survey_id, email=email))
+
+        # 分配兑换码
+        code, already_claimed = claim_code(conn, fingerprint)
+        if not code:
+            # 兑换码已领完：不保留没有兑换码的用户记录，整体回滚
+            raise Rollback((True, 'OK', {
+                'success': False,
+                'code': '',
+                'message': '抱歉，兑换码已经全部领完了！'
+            }))
+
+        return True, 'OK', {
+            'success': True,
+            'code': code,
+            'message': '您已经领取过兑换码了！' if already_claimed else '恭喜您！成功领取兑换码！'
+        }
+
+    # 四层验证
+    record_ip_attempt(ip_address)  # 记录尝试
+    rollup_events.record('attempts')
+
+    conn = get_db_connection()
+    try:
+        # 先做只读检查，不符合资格的请求不占用写锁
+        result = None
+        is_eligible, error_message = _check_identity(conn.cursor(), fingerprint, email)
+        if not is_eligible:
+            result = _existing_claim_result(conn.cursor(), fingerprint, email, error_message)
+        else:
+            is_eligible, error_message = _check_ip_limits(ip_address)
+            if is_eligible:
+                if claim_writer is not None:
+                    # 组提交：与同一时刻的其他领取请求合并为一个事务
+                    is_eligible, error_message, result = claim_writer.submit(claim)
+                else:
+                    is_eligible, error_message, result = run_in_transaction(conn, claim)
+    finally:
         conn.close()
-        return False, '请求过于频繁，请稍后再试'
 
-    conn.close()
-    return True, 'OK'
+    if not is_eligible:
+        rollup_events.record('rejections')
+    elif result and result['success']:
+        # 记录成功领取
+        record_ip_attempt(ip_address, success=True)
+        data_version.bump()
+        code_refiller.check()
+    return is_eligible, error_message, result
 
 @app.route('/')
 def index():
     """主页"""
     current_lang = get_current_language()
-    return render_template('index.html', lang=current_lang)
+    return render_static_page('index.html', current_lang)
 
 @app.route('/check_and_claim')
 def check_and_claim():
     """调研问卷页面"""
     current_lang = get_current_language()
-    return render_template('survey.html', lang=current_lang)
+    return render_static_page('survey.html', current_lang)
+
+def render_static_page(template, current_lang):
+    """渲染只取决于语言的页面，按语言缓存，模板或翻译修改后重新渲染"""
+    # 翻译的版本号来自 lang（与渲染时使用的翻译一致），翻译文件的检查只在 lang 中进行
+    return page_cache.get(template, current_lang, lang.version(),
+                          lambda: render_template(template, lang=current_lang))
 
 @app.route('/result')
 def result():
@@ -333,19 +390,54 @@ def set_language_route(language):
 
 @app.route('/api/translations/<language>')
 def get_translations(language):
-    """获取翻译数据API"""
-    if language not in ['zh', 'en']:
+    """获取翻译数据API（每次使用前需要验证ETag）"""
+    return _translation_response(language, None)
+
+@app.route('/api/translations/<language>/<version>')
+def get_translations_versioned(language, version):
+    """获取指定版本的翻译数据（内容不变，可长期缓存）
+
+    页面已经在服务端翻译，不再引用这个地址；保留给前端以外的客户端：
+    /api/translations/<language> 返回的 ETag 开头就是版本号，可据此请求带版本号的地址。
+    """
+    return _translation_response(language, version)
+
+def _translation_response(language, version):
+    if language not in translation_bundles.languages:
         return jsonify({'error': 'Language not supported'}), 400
 
-    # 读取翻译文件
-    translations_file = f'translations/{language}.json'
-    if os.path.exists(translations_file):
-        with open(translations_file, 'r', encoding='utf-8') as f:
-            translations = json.load(f)
-        return jsonify(translations)
-    else:
+    bundle = translation_bundles.get(language)
+    if bundle is None:
         return jsonify({'error': 'Translation file not found'}), 404
 
+    encoding, body, etag = bundle.representation(request.headers.get('Accept-Encoding'))
+    if version == bundle.version:
+        cache_control = 'public, max-age=31536000, immutable'
+    else:
+        # 未带版本号或版本号已过期：返回当前内容，但每次都要验证
+        cache_control = 'no-cache'
+
+    if request.if_none_match.contains(etag):
+        translation_bundles.count('not_modified')
+        response = app.response_class(status=304)
+    else:
+        translation_bundles.count('hits')
+        response = app.response_class(body, mimetype='application/json')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+@pass_context
+def translate(context, key):
+    """模板中使用 {{ t('index.title') }} 或 {{ 'index.title'|t }} 输出当前语言的翻译"""
+    return lang.get_translation(key, context.get('lang', 'zh'))
+
+app.add_template_global(translate, 't')
+app.add_template_filter(translate, 't')
+
 @app.route('/api/test-ip-detection')
 def test_ip_detection():
     """测试IP语言检测API"""
@@ -366,64 +458,40 @@ def test_ip_detection():
 def assign_code_to_user(fingerprint):
     """为用户分配兑换码（返回结果数据）"""
     conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # 二次检查：确保用户没有已领取的兑换码（防止并发访问）
-    cursor.execute('SELECT code FROM codes WHERE claimed_by_fingerprint = ?', (fingerprint,))
-    existing_code = cursor.fetchone()
 
-    if existing_code:
-        conn.close()
-        return {
-            'success': True,
-            'code': existing_code['code'],
-            'message': '您已经领取过兑换码了！'
-        }
-
-    # 获取一个未使用的兑换码
-    cursor.execute('SELECT * FROM codes WHERE is_used = FALSE AND claimed_by_fingerprint IS NULL LIMIT 1')
-    available_code = cursor.fetchone()
-
-    if not available_code:
+    # 原子领取：检查已有兑换码与领取新兑换码在同一个写事务内完成，
+    # 并发请求不会抢同一行，锁冲突时自动重试
+    try:
+        code, already_claimed = claim_code(conn, fingerprint)
+    except sqlite3.Error as e:
         conn.close()
+        print(f"分配兑换码失败: {str(e)}")
         return {
             'success': False,
             'code': '',
-            'message': '抱歉，兑换码已经全部领完了！'
+            'message': '系统繁忙，请稍后重试！'
         }
 
-    # 使用事务确保原子性操作
-    try:
-        # 分配兑换码给用户 - 使用北京时间，同时确保兑换码仍然可用
-        cursor.execute('''
-            UPDATE codes
-            SET is_used = TRUE, claimed_at = datetime('now', 'localtime'), claimed_by_fingerprint = ?
-            WHERE id = ? AND is_used = FALSE AND claimed_by_fingerprint IS NULL
-        ''', (fingerprint, available_code['id']))
+    conn.close()
 
-        # 检查是否成功更新（防止其他请求同时占用了这个兑换码）
-        if cursor.rowcount == 0:
-            conn.close()
-            return {
-                'success': False,
-                'code': '',
-                'message': '兑换码已被占用，请重试！'
-            }
+    if already_claimed:
+        return {
+            'success': True,
+            'code': code,
+            'message': '您已经领取过兑换码了！'
+        }
 
-        conn.commit()
-        conn.close()
-    except Exception as e:
-        conn.rollback()
-        conn.close()
+    if not code:
         return {
             'success': False,
             'code': '',
-            'message': '系统繁忙，请稍后重试！'
+            'message': '抱歉，兑换码已经全部领完了！'
         }
 
+    data_version.bump()
     return {
         'success': True,
-        'code': available_code['code'],
+        'code': code,
         'message': '恭喜您！成功领取兑换码！'
     }
 
@@ -479,88 +547,35 @@ def submit_survey():
     if profession == '其它岗位' and not custom_profession:
         return render_template('survey.html', error=error_messages[current_lang]['fill_profession'], lang=current_lang)
 
-    # 四层验证
-    record_ip_attempt(ip_address, success=False)  # 记录尝试
-    is_eligible, error_message = validate_claim_eligibility(fingerprint, email, ip_address)
-
-    if not is_eligible:
-        # 如果是已领取的设备或邮箱，直接跳转到结果页显示已有兑换码
-        if '该设备已领取过兑换码' in error_message or '该邮箱已被使用' in error_message:
-            # 查询已有兑换码
-            conn_check = get_db_connection()
-            cursor_check = conn_check.cursor()
-
-            # 先尝试通过设备指纹查询
-            cursor_check.execute('SELECT code FROM codes WHERE claimed_by_fingerprint = ?', (fingerprint,))
-            existing_code = cursor_check.fetchone()
-
-            # 如果设备指纹没找到，通过邮箱查询
-            if not existing_code:
-                cursor_check.execute('''
-                    SELECT c.code FROM codes c
-                    JOIN users u ON c.claimed_by_fingerprint = u.device_fingerprint
-                    WHERE u.email = ?
-                ''', (email,))
-                existing_code = cursor_check.fetchone()
-
-            conn_check.close()
-
-            if existing_code:
-                # 将已有兑换码存储到session并跳转
-                session['result_success'] = True
-                session['result_code'] = existing_code['code']
-                session['result_message'] = '您已经领取过兑换码了！'
-                return redirect('/result')
-
-        # 其他错误（IP限制等）显示错误信息
-        return render_template('survey.html', error=error_message)
-
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    survey = {
+        'name': name,
+        'country': country,
+        'has_used_digital_human': has_used_digital_human,
+        'problems': ','.join(problems),  # 将多选问题转为字符串存储
+        'profession': profession,
+        'custom_profession': custom_profession
+    }
 
     try:
-        # 将多选问题转为字符串存储
-        problems_str = ','.join(problems)
-
-        # 保存用户信息到users表
-        cursor.execute('''
-            INSERT INTO users
-            (device_fingerprint, email, ip_address, user_agent, created_at, last_claim_attempt)
-            VALUES (?, ?, ?, ?, datetime('now', 'localtime'), datetime('now', 'localtime'))
-        ''', (fingerprint, email, ip_address, user_agent))
-
-        # 保存调研数据 - 使用北京时间
-        cursor.execute('''
-            INSERT INTO surveys
-            (device_fingerprint, email, name, country, has_used_digital_human, problems, profession, custom_profession, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now', 'localtime'))
-        ''', (fingerprint, email, name, country, has_used_digital_human, problems_str, profession, custom_profession))
-
-        conn.commit()
-        conn.close()
-
-        # 记录成功领取
-        record_ip_attempt(ip_address, success=True)
-
-        # 分配兑换码
-        result = assign_code_to_user(fingerprint)
-
-        # 将结果存储到session
-        session['result_success'] = result['success']
-        session['result_code'] = result['code']
-        session['result_message'] = result['message']
-
-        # 重定向到结果页面
-        return redirect('/result')
-
+        is_eligible, error_message, result = process_claim(fingerprint, email, ip_address, user_agent, survey)
     except Exception as e:
-        conn.rollback()
-        conn.close()
         print(f"保存调研数据失败: {str(e)}")
         import traceback
         traceback.print_exc()
         return render_template('survey.html', error='提交失败，请重试')
 
+    if not is_eligible and not result:
+        # 其他错误（IP限制等）显示错误信息
+        return render_template('survey.html', error=error_message)
+
+    # 将结果存储到session（已领取过的设备或邮箱直接显示已有兑换码）
+    session['result_success'] = result['success']
+    session['result_code'] = result['code']
+    session['result_message'] = result['message']
+
+    # 重定向到结果页面
+    return redirect('/result')
+
 @app.route('/admin/login', methods=['GET', 'POST'])
 def admin_login():
     """管理员登录"""
@@ -589,223 +604,201 @@ def admin():
     """管理后台"""
     return render_template('admin.html')
 
+RECENT_CLAIMS_SQL = '''
+    SELECT c.code, c.claimed_at,
+           COALESCE(u.email, '未知用户') as email,
+           u.device_fingerprint
+    FROM codes c
+    LEFT JOIN users u ON c.claimed_by_fingerprint = u.device_fingerprint
+    WHERE c.is_used = TRUE
+    ORDER BY c.claimed_at DESC
+    LIMIT 10
+'''
+
 @app.route('/admin/stats')
 @admin_required
+@conditional_get('admin_stats', current_data_version)
 def admin_stats():
     """获取统计信息"""
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    # 总兑换码数量
-    cursor.execute('SELECT COUNT(*) as total FROM codes')
-    total_codes = cursor.fetchone()['total']
-    
-    # 已领取数量
-    cursor.execute('SELECT COUNT(*) as used FROM codes WHERE is_used = TRUE')
-    used_codes = cursor.fetchone()['used']
-    
-    # 剩余数量
-    remaining_codes = total_codes - used_codes
-    
-    # 调研人数
-    cursor.execute('SELECT COUNT(*) as survey_count FROM surveys')
-    survey_count = cursor.fetchone()['survey_count']
+    # 兑换码总数、已领取数量、剩余数量、调研人数（物化计数器）
+    counters = read_counters(conn)
     
     # 最近领取记录
-    cursor.execute('''
-        SELECT c.code, c.claimed_at,
-               COALESCE(u.email, '未知用户') as email,
-               u.device_fingerprint
-        FROM codes c
-        LEFT JOIN users u ON c.claimed_by_fingerprint = u.device_fingerprint
-        WHERE c.is_used = TRUE
-        ORDER BY c.claimed_at DESC
-        LIMIT 10
-    ''')
+    cursor.execute(RECENT_CLAIMS_SQL)
     recent_claims = cursor.fetchall()
     
     conn.close()
     
     return jsonify({
-        'total_codes': total_codes,
-        'used_codes': used_codes,
-        'remaining_codes': remaining_codes,
-        'survey_count': survey_count,
+        'total_codes': counters['total_codes'],
+        'used_codes': counters['used_codes'],
+        'remaining_codes': counters['remaining_codes'],
+        'survey_count': counters['survey_count'],
         'recent_claims': [dict(row) for row in recent_claims]
     })
 
+@app.route('/admin/metrics')
+@admin_required
+def admin_metrics():
+    """获取系统运行指标（缓存命中率等）"""
+    return jsonify({
+        'geo_cache': lang.cache.stats(),
+        'geo_provider': lang.provider.stats(),
+        'language_resolver': language_resolver.stats(),
+        'db_pool': db_pool.stats(),
+        'rate_limiter': rate_limiter.stats(),
+        'conditional_get': conditional_get.stats(),
+        'translations': translation_bundles.stats(),
+        'page_cache': page_cache.stats(),
+        'code_refiller': code_refiller.stats(),
+        'claim_writer': claim_writer.stats() if claim_writer is not None else None
+    })
+
+def _uploaded_keys():
+    """
+    上传的文件（字段名 file）或 text/csv 请求体按CSV取第一列，text/plain 请求体每行一个；
+    都没有时返回None
+    """
+    if 'file' in request.files:
+        # multipart上传：Werkzeug把大文件写入临时文件，这里按行读取
+        return parse_lines(text_lines(request.files['file'].stream))
+    if request.mimetype in ('text/plain', 'text/csv'):
+        # 和multipart一样先读完请求体，写事务期间不再从网络读取
+        lines = text_lines(spool_stream(request.stream))
+        return parse_lines(lines) if request.mimetype == 'text/csv' else strip_lines(lines)
+    return None
+
+def _key_list(value):
+    """JSON中的列表，或按行分隔的字符串"""
+    if isinstance(value, str):
+        return value.split('\n')
+    return [item for item in value or [] if isinstance(item, str)]
+
 @app.route('/admin/import', methods=['POST'])
 @admin_required
 def import_codes():
-    """导入兑换码"""
-    data = request.get_json()
-    codes_text = data.get('codes', '')
-    
-    if not codes_text.strip():
-        return jsonify({'error': '请提供兑换码列表'}), 400
-    
-    # 将文本按行分割，过滤空行
-    codes = [code.strip() for code in codes_text.strip().split('\n') if code.strip()]
-    
-    if not codes:
+    """导入兑换码（JSON、上传的文本/CSV文件，或直接以 text/plain、text/csv 作为请求体）"""
+    codes = _uploaded_keys()
+    if codes is None:
+        data = request.get_json(silent=True) or {}
+        codes_text = data.get('codes', '')
+        if not codes_text.strip():
+            return jsonify({'error': '请提供兑换码列表'}), 400
+        # JSON中的兑换码每行一个，不按CSV拆分
+        codes = strip_lines(codes_text.split('\n'))
+
+    def summary(result):
+        return {
+            'success': True,
+            'imported_count': result['imported'],
+            'duplicate_count': result['duplicates'],
+            'message': f"成功导入 {result['imported']} 个兑换码，{result['duplicates']} 个重复"
+        }
+
+    def run():
+        conn = get_db_connection()
+        try:
+            for progress in iter_import(conn, codes):
+                if progress.get('done'):
+                    if progress['imported']:
+                        data_version.bump()
+                yield progress
+        finally:
+            conn.close()
+
+    if request.args.get('progress'):
+        # 长时间导入：每写入一批返回一行进度（NDJSON），最后一行是导入结果
+        def progress_stream():
+            for progress in run():
+                line = summary(progress) if progress.get('done') else progress
+                yield json.dumps(line, ensure_ascii=False) + '\n'
+        return app.response_class(stream_with_context(progress_stream()), mimetype='application/x-ndjson')
+
+    result = None
+    for result in run():
+        pass
+    if not result['processed']:
         return jsonify({'error': '请提供有效的兑换码'}), 400
-    
+    return jsonify(summary(result))
+
+@app.route('/admin/generate', methods=['POST'])
+@admin_required
+def generate_codes():
+    """生成随机兑换码：{"count": 数量, "length": 长度, "alphabet": 字符集}（长度和字符集可省略）"""
+    data = request.get_json(silent=True) or {}
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    success_count = 0
-    error_count = 0
-    
-    for code in codes:
+    try:
+        count = int(data.get('count', 0))
+        factory = CodeFactory(data.get('alphabet') or None, int(data.get('length') or 0) or None)
+        check_capacity(conn, factory, count)
+    except (TypeError, ValueError) as e:
+        conn.close()
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    def summary(result):
+        return {
+            'success': True,
+            'generated_count': result['generated'],
+            'message': f"成功生成 {result['generated']} 个兑换码"
+        }
+
+    def run():
+        result = {'generated': 0, 'collisions': 0}
         try:
-            cursor.execute('INSERT INTO codes (code) VALUES (?)', (code.strip(),))
-            success_count += 1
-        except sqlite3.IntegrityError:
-            error_count += 1  # 重复的兑换码
-    
-    conn.commit()
-    conn.close()
-    
-    return jsonify({
-        'success': True,
-        'imported_count': success_count,
-        'duplicate_count': error_count,
-        'message': f'成功导入 {success_count} 个兑换码，{error_count} 个重复'
-    })
+            for result in iter_generate(conn, count, factory):
+                yield result
+        finally:
+            conn.close()
+            if result['generated']:
+                data_version.bump()
+
+    if request.args.get('progress'):
+        # 每提交一批返回一行进度（NDJSON），最后一行是生成结果
+        def progress_stream():
+            result = None
+            for result in run():
+                yield json.dumps(result) + '\n'
+            yield json.dumps(summary(result), ensure_ascii=False) + '\n'
+        return app.response_class(stream_with_context(progress_stream()), mimetype='application/x-ndjson')
+
+    result = None
+    for result in run():
+        pass
+    return jsonify(summary(result))
+
+def _json_export_response(chunks):
+    """流式返回JSON数组（?format=ndjson 时每行一条记录）"""
+    if request.args.get('format') == 'ndjson':
+        return app.response_class(ndjson_stream(chunks), status=200, mimetype='application/x-ndjson; charset=utf-8')
+    return app.response_class(json_array_stream(chunks), status=200, mimetype='application/json; charset=utf-8')
 
 @app.route('/admin/export')
 @admin_required
 def export_codes():
-    """导出兑换码使用情况"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT c.code, c.is_used, c.claimed_at, u.email, u.device_fingerprint, u.ip_address
-        FROM codes c
-        LEFT JOIN users u ON c.claimed_by_fingerprint = u.device_fingerprint
-        ORDER BY c.id
-    ''')
-    
-    codes = cursor.fetchall()
-    conn.close()
-    
-    # 转换为字典并确保字符串正确编码
-    result = []
-    for row in codes:
-        row_dict = dict(row)
-        # 确保邮箱字段正确编码
-        if row_dict['email']:
-            row_dict['email'] = str(row_dict['email'])
-        result.append(row_dict)
-    
-    response = app.response_class(
-        response=json.dumps(result, ensure_ascii=False, indent=2),
-        status=200,
-        mimetype='application/json; charset=utf-8'
-    )
-    return response
+    """导出兑换码使用情况（分批读取，边读边返回）"""
+    return _json_export_response(iter_codes(get_db_connection))
 
 @app.route('/admin/export_surveys')
 @admin_required
 def export_surveys():
-    """导出调研数据"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT s.device_fingerprint, s.email, s.name, s.country, s.has_used_digital_human, s.problems,
-               s.profession, s.custom_profession, s.created_at,
-               u.ip_address, c.code
-        FROM surveys s
-        LEFT JOIN users u ON s.device_fingerprint = u.device_fingerprint
-        LEFT JOIN codes c ON s.device_fingerprint = c.claimed_by_fingerprint
-        ORDER BY s.created_at DESC
-    ''')
-
-    surveys = cursor.fetchall()
-    conn.close()
-
-    # 转换为字典并确保字符串正确编码
-    result = []
-    for row in surveys:
-        row_dict = dict(row)
-        # 确保字符串字段正确编码
-        for key in ['email', 'name', 'country', 'problems', 'profession', 'custom_profession', 'has_used_digital_human']:
-            if row_dict.get(key):
-                row_dict[key] = str(row_dict[key])
-        result.append(row_dict)
-    
-    response = app.response_class(
-        response=json.dumps(result, ensure_ascii=False, indent=2),
-        status=200,
-        mimetype='application/json; charset=utf-8'
-    )
-    return response
+    """导出调研数据（分批读取，边读边返回）"""
+    return _json_export_response(iter_surveys(get_db_connection))
 
 @app.route('/admin/export_surveys_csv')
 @admin_required
 def export_surveys_csv():
-    """导出调研数据为CSV格式"""
-    import csv
-    import io
-    from datetime import datetime
-    
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT s.device_fingerprint, s.email, s.name, s.country, s.has_used_digital_human,
-               s.problems, s.profession, s.custom_profession, s.created_at,
-               u.ip_address, c.code
-        FROM surveys s
-        LEFT JOIN users u ON s.device_fingerprint = u.device_fingerprint
-        LEFT JOIN codes c ON s.device_fingerprint = c.claimed_by_fingerprint
-        ORDER BY s.created_at DESC
-    ''')
-
-    surveys = cursor.fetchall()
-    conn.close()
-
-    # 创建CSV文件内容
-    output = io.StringIO()
-    writer = csv.writer(output)
-
-    # 写入表头
-    headers = ['设备指纹', '邮箱', '昵称', '国家/地区', '是否使用过数字人', '希望解决的问题',
-               '职业', '自定义职业', '提交时间', 'IP地址', '兑换码']
-    writer.writerow(headers)
-
-    # 写入数据
-    for survey in surveys:
-        row = [
-            survey['device_fingerprint'] or '',
-            survey['email'] or '未知用户',
-            survey['name'] or '',
-            survey['country'] or '',
-            survey['has_used_digital_human'] or '',
-            survey['problems'] or '',
-            survey['profession'] or '',
-            survey['custom_profession'] or '',
-            survey['created_at'] or '',
-            survey['ip_address'] or '',
-            survey['code'] or ''
-        ]
-        writer.writerow(row)
-    
-    # 准备响应
-    output.seek(0)
-    csv_content = output.getvalue()
-    output.close()
-    
+    """导出调研数据为CSV格式（分批读取，边读边返回）"""
     # 生成文件名
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     filename = f"survey_data_{timestamp}.csv"
-    
+
     response = app.response_class(
-        response=csv_content.encode('utf-8-sig'),  # 使用UTF-8 BOM确保Excel正确显示中文
+        survey_csv_stream(iter_surveys(get_db_connection)),
         status=200,
-        mimetype='text/csv; charset=utf-8'
+        content_type='text/csv; charset=utf-8'
     )
     response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
     return response
@@ -813,49 +806,43 @@ def export_surveys_csv():
 @app.route('/admin/delete', methods=['POST'])
 @admin_required
 def delete_codes():
-    """删除兑换码"""
-    data = request.get_json()
-    action = data.get('action', '')
-    
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    if action == 'delete_unused':
-        # 删除未使用的兑换码
-        cursor.execute('DELETE FROM codes WHERE is_used = FALSE')
-        deleted_count = cursor.rowcount
-        message = f'已删除 {deleted_count} 个未使用的兑换码'
-        
-    elif action == 'delete_used':
-        # 删除已使用的兑换码
-        cursor.execute('DELETE FROM codes WHERE is_used = TRUE')
-        deleted_count = cursor.rowcount
-        message = f'已删除 {deleted_count} 个已使用的兑换码'
-        
-    elif action == 'delete_all':
-        # 删除所有兑换码
-        cursor.execute('DELETE FROM codes')
-        deleted_count = cursor.rowcount
-        message = f'已删除所有 {deleted_count} 个兑换码'
-        
-    elif action == 'delete_specific':
-        # 删除指定兑换码
-        codes_to_delete = data.get('codes', [])
-        if not codes_to_delete:
-            return jsonify({'success': False, 'message': '请指定要删除的兑换码'}), 400
-        
-        placeholders = ','.join('?' * len(codes_to_delete))
-        cursor.execute(f'DELETE FROM codes WHERE code IN ({placeholders})', codes_to_delete)
-        deleted_count = cursor.rowcount
-        message = f'已删除 {deleted_count} 个指定的兑换码'
-        
+    """删除兑换码（分批删除，批与批之间释放写锁；指定兑换码时可上传文件）"""
+    uploaded = _uploaded_keys()
+    if uploaded is not None:
+        action = request.values.get('action', 'delete_specific')
+        # 上传的文件只能用来删除指定的兑换码，不能附带按条件删除（例如 delete_all）
+        if action != 'delete_specific':
+            return jsonify({'success': False, 'message': '上传文件时只能删除指定的兑换码'}), 400
     else:
-        conn.close()
+        data = request.get_json(silent=True) or {}
+        action = data.get('action', '')
+
+    if action not in DELETE_CONDITIONS and action != 'delete_specific':
         return jsonify({'success': False, 'message': '无效的删除操作'}), 400
-    
-    conn.commit()
-    conn.close()
-    
+
+    if action == 'delete_specific':
+        codes_to_delete = uploaded if uploaded is not None else _key_list(data.get('codes'))
+        if uploaded is None and not any(code.strip() for code in codes_to_delete):
+            return jsonify({'success': False, 'message': '请指定要删除的兑换码'}), 400
+
+    conn = get_db_connection()
+    try:
+        if action == 'delete_specific':
+            # 删除指定兑换码
+            deleted_count = delete_staged_codes(conn, codes_to_delete)
+            message = f'已删除 {deleted_count} 个指定的兑换码'
+        else:
+            deleted_count = delete_codes_where(conn, action)
+            message = {
+                'delete_unused': f'已删除 {deleted_count} 个未使用的兑换码',
+                'delete_used': f'已删除 {deleted_count} 个已使用的兑换码',
+                'delete_all': f'已删除所有 {deleted_count} 个兑换码',
+            }[action]
+    finally:
+        conn.close()
+        # 分批删除中途出错时，已提交的部分也要让缓存失效
+        data_version.bump()
+
     return jsonify({
         'success': True,
         'message': message,
@@ -878,7 +865,6 @@ def reset_user():
 
     # 构建查询条件
     if fingerprint:
-        condition = 'claimed_by_fingerprint = ?'
         param = fingerprint
     else:
         # 通过email查找fingerprint
@@ -887,24 +873,13 @@ def reset_user():
         if not user:
             conn.close()
             return jsonify({'success': False, 'message': '未找到该用户'}), 404
-        condition = 'claimed_by_fingerprint = ?'
         param = user['device_fingerprint']
 
-    # 将该用户的兑换码重置为未使用状态
-    cursor.execute(f'''
-        UPDATE codes
-        SET is_used = FALSE, claimed_at = NULL, claimed_by_fingerprint = NULL
-        WHERE {condition}
-    ''', (param,))
-
-    reset_count = cursor.rowcount
-
-    # 同时清除该用户的调研数据和用户记录
-    cursor.execute(f'DELETE FROM surveys WHERE device_fingerprint = ?', (param,))
-    cursor.execute(f'DELETE FROM users WHERE device_fingerprint = ?', (param,))
-
-    conn.commit()
-    conn.close()
+    try:
+        reset_count = reset_users(conn, [param])['codes']
+    finally:
+        conn.close()
+    data_version.bump()
 
     if reset_count > 0:
         return jsonify({
@@ -917,6 +892,39 @@ def reset_user():
             'message': '未找到该用户的领取记录'
         })
 
+@app.route('/admin/reset_users', methods=['POST'])
+@admin_required
+def reset_users_bulk():
+    """批量重置用户：{"fingerprints": [...], "emails": [...]}，或上传文件（by=fingerprint|email）"""
+    uploaded = _uploaded_keys()
+    if uploaded is not None:
+        by = request.values.get('by', 'fingerprint')
+        if by not in ('fingerprint', 'email'):
+            return jsonify({'success': False, 'message': 'by 参数应为 fingerprint 或 email'}), 400
+        fingerprints, emails = (uploaded, ()) if by == 'fingerprint' else ((), uploaded)
+    else:
+        data = request.get_json(silent=True) or {}
+        fingerprints = _key_list(data.get('fingerprints'))
+        emails = _key_list(data.get('emails'))
+        if not any(key.strip() for key in fingerprints + emails):
+            return jsonify({'success': False, 'message': '请提供设备指纹或邮箱'}), 400
+
+    conn = get_db_connection()
+    try:
+        result = reset_users(conn, fingerprints, emails)
+    finally:
+        conn.close()
+        data_version.bump()
+
+    return jsonify({
+        'success': True,
+        'reset_count': result['reset'],
+        'released_codes': result['codes'],
+        'deleted_surveys': result['surveys'],
+        'deleted_users': result['users'],
+        'message': f"已重置 {result['reset']} 个用户，释放了 {result['codes']} 个兑换码"
+    })
+
 
 @app.route('/init_database_now')
 def init_database_now():
@@ -938,6 +946,7 @@ def init_database_now():
 
 @app.route('/api/surveys', methods=['GET', 'OPTIONS'])
 @api_token_required
+@conditional_get('api_surveys', current_data_version, headers=CORS_HEADERS)
 def api_get_surveys():
     # 处理OPTIONS预检请求
     if request.method == 'OPTIONS':
@@ -946,71 +955,17 @@ def api_get_surveys():
         response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
         response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
         return response
-    """获取问卷数据API接口"""
+    """获取问卷数据API接口（游标分页、字段投影）"""
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 获取查询参数
-        start_date = request.args.get('start_date')  # YYYY-MM-DD格式
-        end_date = request.args.get('end_date')  # YYYY-MM-DD格式
-        
-        # 构建基础查询
-        base_query = '''
-            SELECT s.device_fingerprint, s.email, s.has_used_digital_human,
-                   s.problems, s.profession, s.custom_profession, s.created_at, c.code,
-                   c.claimed_at, c.is_used, u.ip_address
-            FROM surveys s
-            LEFT JOIN users u ON s.device_fingerprint = u.device_fingerprint
-            LEFT JOIN codes c ON s.device_fingerprint = c.claimed_by_fingerprint
-        '''
-        
-        # 添加日期过滤条件
-        conditions = []
-        params = []
-        
-        if start_date:
-            conditions.append("date(s.created_at) >= ?")
-            params.append(start_date)
-        
-        if end_date:
-            conditions.append("date(s.created_at) <= ?")
-            params.append(end_date)
-        
-        if conditions:
-            base_query += " WHERE " + " AND ".join(conditions)
-        
-        base_query += " ORDER BY s.created_at DESC"
-        
-        cursor.execute(base_query, params)
-        surveys = cursor.fetchall()
-        
-        total_count = len(surveys)
-        
-        conn.close()
-        
-        # 转换为字典格式
-        result = []
-        for survey in surveys:
-            survey_dict = {
-                'device_fingerprint': survey['device_fingerprint'],
-                'email': survey['email'],
-                'ip_address': survey['ip_address'],
-                'has_used_digital_human': survey['has_used_digital_human'],
-                'problems': survey['problems'],
-                'profession': survey['profession'],
-                'custom_profession': survey['custom_profession'],
-                'created_at': survey['created_at'],
-                'exchange_code': survey['code'],
-                'exchange_time': survey['claimed_at'],
-                'code_used': bool(survey['is_used']) if survey['is_used'] is not None else None
-            }
-            result.append(survey_dict)
-        
+        try:
+            result = query_surveys(conn, request.args)
+        finally:
+            conn.close()
+
         response = jsonify({
             'success': True,
-            'data': result,
-            'total': total_count,
+            **result,
             'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         })
         
@@ -1020,7 +975,82 @@ def api_get_surveys():
         response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
         
         return response
-        
+
+    except QueryError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }), 500
+
+@app.route('/api/surveys/changes', methods=['GET', 'OPTIONS'])
+@api_token_required
+def api_get_survey_changes():
+    # 处理OPTIONS预检请求
+    if request.method == 'OPTIONS':
+        response = jsonify({})
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
+        response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
+        return response
+    """增量变更接口：返回序号大于 since 的新增调研、领取和重置（NDJSON）"""
+    try:
+        since = int(request.args.get('since') or 0)
+        limit = int(request.args.get('limit') or 0) or None
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'since 和 limit 必须是整数',
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }), 400
+
+    conn = get_db_connection()
+    try:
+        rows = change_log.read_changes(conn, since, limit)
+        latest = change_log.latest_seq(conn) if rows else since
+    finally:
+        conn.close()
+
+    # 下次请求使用的 since；小于最新序号时说明还有未取完的变更
+    next_since = rows[-1][0] if rows else since
+    response = app.response_class(change_log.to_ndjson(rows), status=200, mimetype='application/x-ndjson')
+    response.headers['X-Next-Since'] = str(next_since)
+    response.headers['X-Has-More'] = 'true' if next_since < latest else 'false'
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    response.headers['Access-Control-Expose-Headers'] = 'X-Next-Since, X-Has-More'
+    return response
+
+@app.route('/api/surveys/analytics', methods=['GET', 'OPTIONS'])
+@api_token_required
+@conditional_get('api_survey_analytics', current_data_version, headers=CORS_HEADERS)
+def api_get_survey_analytics():
+    # 处理OPTIONS预检请求
+    if request.method == 'OPTIONS':
+        response = jsonify({})
+        response.headers.update(CORS_HEADERS)
+        return response
+    """问题分析API接口：各选项计数、职业 × 问题、国家 × 问题"""
+    try:
+        conn = get_db_connection()
+        try:
+            analytics = cross_tabs(conn)
+        finally:
+            conn.close()
+
+        response = jsonify({
+            'success': True,
+            'analytics': analytics,
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        })
+        response.headers.update(CORS_HEADERS)
+        return response
+
     except Exception as e:
         return jsonify({
             'success': False,
@@ -1028,8 +1058,17 @@ def api_get_surveys():
             'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }), 500
 
+PROFESSION_COUNTS_SQL = '''
+    SELECT profession, COUNT(*) as count
+    FROM surveys
+    WHERE profession IS NOT NULL AND profession != ''
+    GROUP BY profession
+    ORDER BY count DESC
+'''
+
 @app.route('/api/surveys/stats', methods=['GET', 'OPTIONS'])
 @api_token_required
+@conditional_get('api_survey_stats', current_stats_version, headers=CORS_HEADERS)
 def api_get_survey_stats():
     # 处理OPTIONS预检请求
     if request.method == 'OPTIONS':
@@ -1043,60 +1082,50 @@ def api_get_survey_stats():
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # 基础统计
-        cursor.execute('SELECT COUNT(*) as total FROM surveys')
-        total_surveys = cursor.fetchone()['total']
+        # 基础统计（物化计数器）
+        counters = read_counters(conn)
         
-        cursor.execute('SELECT COUNT(*) as total FROM codes WHERE is_used = TRUE')
-        codes_used = cursor.fetchone()['total']
+        # 按日期统计（读取汇总表）
+        daily_stats = daily_surveys(conn)
         
-        cursor.execute('SELECT COUNT(*) as total FROM codes')
-        total_codes = cursor.fetchone()['total']
+        # 指定 granularity 时返回时间序列：?granularity=day|hour&from=YYYY-MM-DD&to=YYYY-MM-DD
+        series = None
+        granularity = request.args.get('granularity')
+        if granularity:
+            try:
+                series = query_series(conn, granularity, request.args.get('from'), request.args.get('to'))
+            except ValueError as e:
+                conn.close()
+                return jsonify({
+                    'success': False,
+                    'error': str(e),
+                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                }), 400
         
-        # 按日期统计
-        cursor.execute('''
-            SELECT date(created_at) as survey_date, COUNT(*) as count
-            FROM surveys
-            GROUP BY date(created_at)
-            ORDER BY survey_date DESC
-            LIMIT 30
-        ''')
-        daily_stats = cursor.fetchall()
-        
-        # 问题分析
-        cursor.execute('''
-            SELECT problems, COUNT(*) as count
-            FROM surveys
-            WHERE problems IS NOT NULL AND problems != ''
-            GROUP BY problems
-            ORDER BY count DESC
-            LIMIT 10
-        ''')
-        problem_stats = cursor.fetchall()
+        # 问题分析（按单个选项计数）
+        problem_stats = problem_counts(conn)
         
         # 职业分析
-        cursor.execute('''
-            SELECT profession, COUNT(*) as count
-            FROM surveys
-            WHERE profession IS NOT NULL AND profession != ''
-            GROUP BY profession
-            ORDER BY count DESC
-        ''')
+        cursor.execute(PROFESSION_COUNTS_SQL)
         profession_stats = cursor.fetchall()
         
         conn.close()
         
+        stats = {
+            'total_surveys': counters['survey_count'],
+            'codes_used': counters['used_codes'],
+            'total_codes': counters['total_codes'],
+            'codes_remaining': counters['remaining_codes'],
+            'daily_surveys': daily_stats,
+            'problem_distribution': problem_stats,
+            'profession_distribution': [dict(row) for row in profession_stats]
+        }
+        if series is not None:
+            stats['series'] = {'granularity': granularity, 'buckets': series}
+
         response = jsonify({
             'success': True,
-            'stats': {
-                'total_surveys': total_surveys,
-                'codes_used': codes_used,
-                'total_codes': total_codes,
-                'codes_remaining': total_codes - codes_used,
-                'daily_surveys': [dict(row) for row in daily_stats],
-                'problem_distribution': [dict(row) for row in problem_stats],
-                'profession_distribution': [dict(row) for row in profession_stats]
-            },
+            'stats': stats,
             'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         })
         
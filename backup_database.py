@@ -25,8 +25,12 @@ def backup_database(db_path="gift_codes.db", backup_dir="database_backups"):
     json_backup = os.path.join(backup_dir, f"gift_codes_backup_{timestamp}.json")
     
     try:
-        # 1. 复制数据库文件
-        shutil.copy2(db_path, backup_file)
+        # 1. 备份数据库文件（WAL模式下最近的提交可能还在-wal文件中，使用SQLite在线备份而不是直接复制）
+        source = sqlite3.connect(db_path)
+        target = sqlite3.connect(backup_file)
+        source.backup(target)
+        target.close()
+        source.close()
         print(f"✅ 数据库文件已备份到: {backup_file}")
         
         # 2. 导出为JSON格式（便于查看和跨平台）
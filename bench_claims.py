@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+领取吞吐量对比：每个请求单独提交 vs 组提交
+
+在临时数据库上用多个线程并发调用领取流程（process_claim），
+分别测量逐个提交（synchronous=FULL / NORMAL）和组提交（synchronous=FULL）时的
+每秒领取数和延迟分位数。
+
+用法：
+    python bench_claims.py                       默认 32 个线程、共 3000 次领取
+    python bench_claims.py --threads 64 --claims 10000 --json
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# 添加项目路径到系统路径
+project_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_path)
+
+import app as app_module
+from claim_writer import ClaimWriter
+from rate_limiter import RateLimiter
+
+SURVEY = {
+    'name': 'bench', 'country': '中国', 'has_used_digital_human': 'no', 'problems': '做直播,制作课程',
+    'profession': 'teacher', 'custom_profession': ''
+}
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(mode, threads, claims, tmp_dir):
+    """运行一轮，返回统计结果"""
+    path = os.path.join(tmp_dir, f'{mode}.db')
+    app_module.DATABASE_PATH = path
+    app_module.db_pool.synchronous = 'NORMAL' if mode == 'direct-normal' else 'FULL'
+    app_module.rate_limiter = RateLimiter(10 ** 9, 10 ** 9, path=os.path.join(tmp_dir, f'{mode}.bin'),
+                                          slots=4096, checkpoint_interval=0)
+    app_module.init_database()
+    conn = app_module.get_db_connection()
+    conn.executemany('INSERT INTO codes (code) VALUES (?)', [(f'{mode}-{i}',) for i in range(claims)])
+    conn.commit()
+    conn.close()
+
+    writer = ClaimWriter(lambda: app_module.get_db_connection()) if mode == 'group' else None
+    app_module.claim_writer = writer
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    per_thread = claims // threads
+
+    def worker(index):
+        local = []
+        for i in range(per_thread):
+            n = index * per_thread + i
+            start = time.perf_counter()
+            try:
+                _, _, result = app_module.process_claim(
+                    f'{mode}-fp{n}', f'{mode}{n}@example.com', f'10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}', 'bench', SURVEY
+                )
+                if not result or not result['success']:
+                    raise RuntimeError('领取失败')
+            except Exception as e:
+                with lock:
+                    errors.append(type(e).__name__)
+                continue
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    app_module.claim_writer = None
+    result = {
+        'mode': mode,
+        'claims': len(latencies),
+        'errors': len(errors),
+        'claims_per_sec': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+    }
+    if writer is not None:
+        result['avg_batch'] = writer.stats()['avg_batch']
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='领取吞吐量对比（逐个提交 / 组提交）')
+    parser.add_argument('--threads', type=int, default=32, help='并发线程数')
+    parser.add_argument('--claims', type=int, default=3000, help='总领取次数')
+    parser.add_argument('--modes', default='direct-full,direct-normal,group', help='要测试的模式（逗号分隔）')
+    parser.add_argument('--json', action='store_true', help='以JSON输出')
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for mode in args.modes.split(','):
+            results.append(run(mode, args.threads, args.claims, tmp_dir))
+        app_module.db_pool.close_all()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            batch = f"  平均每批 {result['avg_batch']}" if 'avg_batch' in result else ''
+            print(f"{result['mode']:14s} {result['claims_per_sec']:9.1f} 次/秒  "
+                  f"p50 {result['p50_ms']:7.2f}ms  p95 {result['p95_ms']:7.2f}ms  p99 {result['p99_ms']:7.2f}ms  "
+                  f"错误 {result['errors']}{batch}")
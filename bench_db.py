@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据库热点函数的规模基准测试
+
+按不同规模（默认 10³、10⁴、10⁵ 行，最多 10⁷）生成合成数据库：
+    codes      N 行，其中一半已领取
+    users      N/2 行
+    surveys    N/2 行（含 survey_problems 拆分）
+    ip_limits  N 行
+然后分别测量每个热点函数/查询单次调用的耗时（中位数、p95），并根据最小和最大规模的耗时
+估算随表大小增长的阶数（0 ≈ 与表大小无关，1 ≈ 线性），提前发现会随数据量线性变慢的接口。
+
+结果可以保存为JSON基线，之后与基线对比：中位数超过基线 --threshold 倍
+（且绝对差值超过 --min-delta-us 微秒）视为性能回退，以非0状态退出。
+
+用法：
+    python bench_db.py                                   默认规模，输出表格
+    python bench_db.py --sizes 1000,100000,10000000 --data-dir /data/bench   大规模（数据库保留复用）
+    python bench_db.py --save                            写入基线 bench_db_baseline.json
+    python bench_db.py --check --threshold 1.5           与基线对比
+    python bench_db.py --json                            以JSON输出
+"""
+
+import argparse
+import datetime
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+# 添加项目路径到系统路径
+project_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_path)
+
+import app as app_module
+from data_version import DataVersion
+from exports import CODES_SQL, SURVEYS_SQL, iter_codes, iter_surveys, json_array_stream, survey_csv_stream
+from migrations import migrate
+from rate_limiter import RateLimiter
+from rollup import EventBuffer
+
+BASELINE_PATH = os.path.join(project_path, 'bench_db_baseline.json')
+DEFAULT_SIZES = '1000,10000,100000'
+PROBLEMS = ('打造个人IP', '短视频获客', '制作课程', '短视频带货', '做直播', '其它')
+PROFESSIONS = ('企业老板', '创业者', '销售人员', '短视频创作者', '其它岗位')
+
+# 耗时主要取决于共享内存中的限流槽位（65536个），与表大小无关，不参与增长阶数估算
+FIXED_COST = {'ip_limits_checkpoint'}
+
+# 递归CTE生成 0..N-1 的序列
+SEQUENCE = 'WITH RECURSIVE seq(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM seq WHERE i + 1 < ?1)'
+
+
+# ---------------------------------------------------------------- 生成数据
+
+def seed_database(path, size):
+    """生成规模为 size 的合成数据库（数据经过触发器，计数器和统计汇总与线上一致）"""
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.execute('PRAGMA cache_size=-262144')
+    migrate(conn)
+
+    half = size // 2
+    with conn:
+        # 领取时间分布在30天内，每分钟一条
+        conn.execute(f'''
+            {SEQUENCE}
+            INSERT INTO codes (code, is_used, created_at, claimed_at, claimed_by_fingerprint)
+            SELECT printf('BENCH%010d', i), i < ?1 / 2, '2025-01-01 00:00:00',
+                   CASE WHEN i < ?1 / 2 THEN datetime('2025-01-01', '+' || (i % 43200) || ' minutes') END,
+                   CASE WHEN i < ?1 / 2 THEN 'fp' || i END
+            FROM seq
+        ''', (size,))
+        conn.execute(f'''
+            {SEQUENCE}
+            INSERT INTO users (device_fingerprint, email, ip_address, user_agent, created_at, last_claim_attempt)
+            SELECT 'fp' || i, 'u' || i || '@bench.example.com',
+                   printf('10.%d.%d.%d', (i >> 16) & 255, (i >> 8) & 255, i & 255), 'bench',
+                   datetime('2025-01-01', '+' || (i % 43200) || ' minutes'),
+                   datetime('2025-01-01', '+' || (i % 43200) || ' minutes')
+            FROM seq
+        ''', (half,))
+        conn.execute(f'''
+            {SEQUENCE}
+            INSERT INTO surveys (device_fingerprint, email, name, country, has_used_digital_human, problems,
+                                 profession, custom_profession, created_at)
+            SELECT 'fp' || i, 'u' || i || '@bench.example.com', 'user' || i, '中国',
+                   CASE WHEN i % 2 THEN '是' ELSE '否' END,
+                   ?2, CASE i % 5 WHEN 0 THEN ?3 WHEN 1 THEN ?4 WHEN 2 THEN ?5 WHEN 3 THEN ?6 ELSE ?7 END, '',
+                   datetime('2025-01-01', '+' || (i % 43200) || ' minutes')
+            FROM seq
+        ''', (half, f'{PROBLEMS[1]},{PROBLEMS[4]}') + PROFESSIONS)
+        conn.execute('INSERT INTO survey_problems (survey_id, problem) SELECT id, ? FROM surveys', (PROBLEMS[1],))
+        conn.execute('INSERT INTO survey_problems (survey_id, problem) SELECT id, ? FROM surveys', (PROBLEMS[4],))
+        # 最近10天的IP记录
+        conn.execute(f'''
+            {SEQUENCE}
+            INSERT INTO ip_limits (ip_address, attempt_count, success_count, first_attempt, last_attempt)
+            SELECT printf('172.%d.%d.%d', 16 + ((i >> 16) & 15), (i >> 8) & 255, i & 255), 1 + i % 3, i % 2,
+                   datetime('now', 'localtime', '-' || (i % 14400) || ' minutes'),
+                   datetime('now', 'localtime', '-' || (i % 14400) || ' minutes')
+            FROM seq
+        ''', (size,))
+    conn.execute('ANALYZE')
+    conn.close()
+
+
+def prepare_database(data_dir, size):
+    """返回规模为 size 的数据库路径；--data-dir 下已生成的数据库直接复用"""
+    path = os.path.join(data_dir, f'bench_db_{size}.db')
+    if os.path.exists(path):
+        conn = sqlite3.connect(path)
+        try:
+            counts = conn.execute('SELECT total_codes, used_codes FROM counters WHERE id = 1').fetchone()
+        except sqlite3.Error:
+            counts = None
+        conn.close()
+        # 每次运行都会领取兑换码，剩余不足四分之一时重新生成
+        if counts and counts[0] >= size * 0.99 and counts[1] <= size * 0.75:
+            return path, 0.0
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    start = time.perf_counter()
+    seed_database(path, size)
+    return path, time.perf_counter() - start
+
+
+# ---------------------------------------------------------------- 测量
+
+def time_calls(func, repeat, warmup=3):
+    """调用 func(i) repeat 次，返回每次的耗时（秒）"""
+    for i in range(warmup):
+        func(-1 - i)
+    timings = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func(i)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def summarize(timings):
+    timings = sorted(timings)
+    return {
+        'calls': len(timings),
+        'median_us': round(timings[len(timings) // 2] * 1e6, 1),
+        'p95_us': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1e6, 1),
+    }
+
+
+def benchmarks(size, run_id):
+    """每个被测函数：(名称, func(i), 是否为全表导出)"""
+    rng = random.Random(size)
+    half = max(1, size // 2)
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['admin_logged_in'] = True
+    api_headers = {'Authorization': 'Bearer bench'}
+
+    def existing_or_new(i):
+        # 一半是已领取的老用户（第1层即被拦下），一半是新用户（走完四层检查）
+        if i % 2:
+            n = rng.randrange(half)
+            return f'fp{n}', f'u{n}@bench.example.com'
+        return f'new-{run_id}-{i}', f'new{i}.{run_id}@bench.example.com'
+
+    def validate(i):
+        fingerprint, email = existing_or_new(i)
+        app_module.validate_claim_eligibility(fingerprint, email, f'192.0.2.{i % 256}')
+
+    def claim(i):
+        # 线上的领取流程：一个写事务中保存用户和调研，再用 CLAIM_SQL 领取兑换码
+        eligible, message, result = app_module.process_claim(
+            f'claim-{run_id}-{i}', f'claim{i}.{run_id}@bench.example.com', f'100.64.{(i >> 8) & 255}.{i & 255}',
+            'bench', {'name': 'bench', 'country': '中国', 'has_used_digital_human': '是',
+                      'problems': PROBLEMS[0], 'profession': PROFESSIONS[0], 'custom_profession': ''}
+        )
+        assert eligible and result['success'], message
+
+    def record_attempt(i):
+        app_module.record_ip_attempt(f'198.51.{(i >> 8) & 255}.{i & 255}')
+
+    def checkpoint(i):
+        # 已有当天记录的IP走UPDATE，新IP走INSERT
+        n = rng.randrange(size)
+        app_module.record_ip_attempt(f'172.{16 + ((n >> 16) & 15)}.{(n >> 8) & 255}.{n & 255}')
+        app_module.record_ip_attempt(f'203.0.{(i >> 8) & 255}.{i & 255}')
+        app_module.rate_limiter.checkpoint(force=True)
+
+    def admin_stats(i):
+        assert client.get('/admin/stats').status_code == 200
+
+    def survey_stats(i):
+        assert client.get('/api/surveys/stats', headers=api_headers).status_code == 200
+
+    def survey_list(i):
+        assert client.get('/api/surveys?limit=100', headers=api_headers).status_code == 200
+
+    def codes_page(i):
+        # 导出中途的一批（随机游标，之后至少还有一整批）
+        conn = app_module.get_db_connection()
+        try:
+            conn.execute(CODES_SQL, (rng.randrange(max(1, size - 1000)), 1000)).fetchall()
+        finally:
+            conn.close()
+
+    def surveys_page(i):
+        n = rng.randrange(min(1000, half - 1), half)
+        cursor = (datetime.datetime(2025, 1, 1) + datetime.timedelta(minutes=n % 43200)).strftime('%Y-%m-%d %H:%M:%S')
+        conn = app_module.get_db_connection()
+        try:
+            conn.execute(SURVEYS_SQL, (cursor, n, 1000)).fetchall()
+        finally:
+            conn.close()
+
+    def drain(chunks):
+        for _ in chunks:
+            pass
+
+    return [
+        ('validate_claim_eligibility', validate, False),
+        ('process_claim', claim, False),
+        ('record_ip_attempt', record_attempt, False),
+        ('ip_limits_checkpoint', checkpoint, False),
+        ('admin_stats', admin_stats, False),
+        ('api_get_survey_stats', survey_stats, False),
+        ('api_get_surveys', survey_list, False),
+        ('export_codes_page', codes_page, False),
+        ('export_surveys_page', surveys_page, False),
+        ('export_codes', lambda i: drain(json_array_stream(iter_codes(app_module.get_db_connection))), True),
+        ('export_surveys', lambda i: drain(json_array_stream(iter_surveys(app_module.get_db_connection))), True),
+        ('export_surveys_csv', lambda i: drain(survey_csv_stream(iter_surveys(app_module.get_db_connection))), True),
+    ]
+
+
+def run_size(size, data_dir, repeat, full_repeat, full_max, only):
+    """在一个规模上运行全部基准，返回 ({名称: 统计}, 生成数据耗时)"""
+    path, seed_seconds = prepare_database(data_dir, size)
+    run_id = f'{os.getpid()}-{int(time.time())}'
+
+    shm = os.path.join(data_dir, f'bench_db_{size}.rate_limit')
+    if os.path.exists(shm):
+        os.remove(shm)
+
+    # 基准期间把 app 指向合成数据库，结束后恢复原来的全局对象
+    previous = {name: getattr(app_module, name)
+                for name in ('DATABASE_PATH', 'data_version', 'rate_limiter', 'rollup_events')}
+    app_module.DATABASE_PATH = path
+    app_module.data_version = DataVersion(os.path.join(data_dir, f'bench_db_{size}.version'))
+    app_module.rate_limiter = RateLimiter(10 ** 9, 10 ** 9, path=shm, checkpoint_interval=0,
+                                          connect=lambda: app_module.get_db_connection())
+    app_module.rollup_events = EventBuffer(lambda: app_module.get_db_connection(), interval=0)
+    try:
+        results = {}
+        for name, func, full in benchmarks(size, run_id):
+            if only and name not in only:
+                continue
+            if full and size > full_max:
+                continue
+            timings = time_calls(func, full_repeat if full else repeat, warmup=0 if full else 3)
+            results[name] = summarize(timings)
+    finally:
+        # 领取尝试次数写入合成数据库，不留到恢复之后
+        app_module.rollup_events.flush()
+        app_module.db_pool.close_all()
+        for name, value in previous.items():
+            setattr(app_module, name, value)
+    return results, seed_seconds
+
+
+# ---------------------------------------------------------------- 汇总和基线
+
+def scaling(results):
+    """按最小和最大规模的中位数估算增长阶数：耗时 ∝ N^k（FIXED_COST 中的函数除外）"""
+    orders = {}
+    names = {name for by_size in results.values() for name in by_size} - FIXED_COST
+    for name in sorted(names):
+        points = sorted((int(size), by_size[name]['median_us']) for size, by_size in results.items() if name in by_size)
+        if len(points) < 2 or points[0][1] <= 0:
+            continue
+        (n1, t1), (n2, t2) = points[0], points[-1]
+        orders[name] = round(math.log(max(t2, 1e-3) / t1) / math.log(n2 / n1), 2)
+    return orders
+
+
+def growth_label(order):
+    if order < 0.15:
+        return '与规模无关'
+    if order < 0.7:
+        return '亚线性'
+    return '线性增长'
+
+
+def compare(report, baseline, threshold, min_delta_us):
+    """与基线对比，返回回退列表 [(名称, 规模, 基线us, 当前us, 倍数)]"""
+    regressions = []
+    for size, by_name in report['results'].items():
+        for name, current in by_name.items():
+            base = baseline.get('results', {}).get(size, {}).get(name)
+            if not base or base['median_us'] <= 0:
+                continue
+            ratio = current['median_us'] / base['median_us']
+            if ratio > threshold and current['median_us'] - base['median_us'] > min_delta_us:
+                regressions.append((name, int(size), base['median_us'], current['median_us'], round(ratio, 2)))
+    return regressions
+
+
+def print_table(report):
+    sizes = sorted(report['results'], key=int)
+    names = []
+    for size in sizes:
+        names.extend(name for name in report['results'][size] if name not in names)
+
+    header = f"{'函数/查询':28s}" + ''.join(f'{"N=" + format(int(size), ","):>16s}' for size in sizes) + '   增长阶数'
+    print(header)
+    print('-' * len(header.encode('gbk', 'replace')))
+    for name in names:
+        cells = []
+        for size in sizes:
+            stats = report['results'][size].get(name)
+            cells.append(f"{stats['median_us'] / 1000:13.3f}ms" if stats else f"{'-':>15s}")
+        order = report['scaling'].get(name)
+        label = f'  {order:5.2f} {growth_label(order)}' if order is not None else ''
+        print(f'{name:28s}' + ' '.join(cells) + label)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='数据库热点函数的规模基准测试')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='数据规模（逗号分隔，每个规模一个数据库）')
+    parser.add_argument('--repeat', type=int, default=200, help='每个函数的调用次数')
+    parser.add_argument('--full-repeat', type=int, default=1, help='全表导出的执行次数')
+    parser.add_argument('--full-max', type=int, default=1000000, help='超过该规模时跳过全表导出')
+    parser.add_argument('--only', help='只测这些函数（逗号分隔）')
+    parser.add_argument('--data-dir', help='数据库保存目录（保留并复用已生成的数据库，默认用临时目录）')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='基线文件')
+    parser.add_argument('--save', action='store_true', help='把本次结果写入基线文件')
+    parser.add_argument('--check', action='store_true', help='与基线对比，有回退时以非0状态退出')
+    parser.add_argument('--threshold', type=float, default=1.5, help='中位数超过基线多少倍视为回退')
+    parser.add_argument('--min-delta-us', type=float, default=200, help='绝对差值小于该值（微秒）时不算回退')
+    parser.add_argument('--json', action='store_true', help='以JSON输出')
+    args = parser.parse_args()
+
+    sizes = [int(float(size)) for size in args.sizes.split(',')]
+    only = set(args.only.split(',')) if args.only else None
+    report = {
+        'meta': {
+            'created_at': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+        },
+        'results': {},
+        'seed_seconds': {},
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = args.data_dir or tmp_dir
+        os.makedirs(data_dir, exist_ok=True)
+        for size in sizes:
+            if not args.json:
+                print(f'N={size:,} ...', file=sys.stderr)
+            results, seed_seconds = run_size(size, data_dir, args.repeat, args.full_repeat, args.full_max, only)
+            report['results'][str(size)] = results
+            report['seed_seconds'][str(size)] = round(seed_seconds, 2)
+    report['scaling'] = scaling(report['results'])
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_table(report)
+
+    if args.save:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+        print(f'✓ 基线已写入 {args.baseline}', file=sys.stderr)
+
+    if args.check:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold, args.min_delta_us)
+        if regressions:
+            for name, size, before, after, ratio in regressions:
+                print(f'✗ {name} N={size:,}: {before:.1f}us -> {after:.1f}us ({ratio}x)', file=sys.stderr)
+            sys.exit(1)
+        print(f'✓ 与基线相比没有超过 {args.threshold}x 的回退', file=sys.stderr)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+翻译查找性能对比
+
+对比原来的逐层查找（每次 key.split('.') 后遍历嵌套字典）和展开后的索引查找，
+以及首次加载时解析JSON和读取编译文件的耗时。
+
+用法：
+    python bench_translations.py                  中文，默认 200000 次查找
+    python bench_translations.py --lang en -n 1000000
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+# 添加项目路径到系统路径
+project_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_path)
+
+from language import LanguageSupport, flatten_translations, load_compiled
+from translation_bundles import TRANSLATIONS_DIR
+
+
+def nested_lookup(translations, key, lang='zh'):
+    """原 get_translation 的实现"""
+    if lang not in translations:
+        lang = 'zh'
+
+    keys = key.split('.')
+    value = translations[lang]
+
+    try:
+        for k in keys:
+            value = value[k]
+        return value
+    except (KeyError, TypeError):
+        return key
+
+
+def lookups_per_second(func, keys, count):
+    rounds = max(1, count // len(keys))
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for key in keys:
+            func(key)
+    elapsed = time.perf_counter() - start
+    return rounds * len(keys) / elapsed
+
+
+def load_seconds(func, repeat=50):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='翻译查找性能对比')
+    parser.add_argument('--lang', default='zh', help='语言')
+    parser.add_argument('-n', '--count', type=int, default=200000, help='查找次数')
+    args = parser.parse_args()
+
+    json_path = os.path.join(TRANSLATIONS_DIR, f'{args.lang}.json')
+    with open(json_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    keys = [key for key, value in flatten_translations(data).items() if not isinstance(value, dict)]
+    keys.append('index.missing_key')
+
+    translations = {'zh': data, args.lang: data}
+    support = LanguageSupport(check_interval=-1)
+
+    before = lookups_per_second(lambda key: nested_lookup(translations, key, args.lang), keys, args.count)
+    after = lookups_per_second(lambda key: support.get_translation(key, args.lang), keys, args.count)
+    print(f"逐层查找:   {before:12,.0f} 次/秒")
+    print(f"展开索引:   {after:12,.0f} 次/秒  ({after / before:.1f}x)")
+
+    def parse_json():
+        with open(json_path, 'r', encoding='utf-8') as f:
+            flatten_translations(json.load(f))
+
+    # 在临时目录中比较，不改动 translations 目录
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_json = os.path.join(tmp_dir, os.path.basename(json_path))
+        with open(tmp_json, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        load_compiled(tmp_json)
+        parsed = load_seconds(parse_json)
+        compiled = load_seconds(lambda: load_compiled(tmp_json))
+    print(f"加载JSON并展开: {parsed * 1000:8.3f} 毫秒")
+    print(f"读取编译文件:   {compiled * 1000:8.3f} 毫秒")
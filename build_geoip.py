@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+离线IP库构建工具
+把CSV格式的IP段数据（db-ip / ip2location lite 等）转换为 language.py 使用的二进制索引
+
+CSV每行前三列为：起始IP, 结束IP, 国家码
+IP可以是点分/冒号格式，也可以是整数；表头、注释行和无效国家码（-、ZZ）会被跳过
+
+用法：
+    python build_geoip.py dbip-country-lite.csv [更多csv...] -o data/ip_country.bin
+"""
+
+import argparse
+import csv
+import ipaddress
+import os
+import sys
+
+# 添加项目路径到系统路径
+project_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_path)
+
+from language import GEOIP_DB_PATH, GEOIP_HEADER, GEOIP_MAGIC, GEOIP_VERSION
+
+# ip2location IPv6库中IPv4地址以 ::ffff:0:0/96 形式出现
+IPV4_MAPPED_START = 0xFFFF00000000
+IPV4_MAPPED_END = 0xFFFFFFFFFFFF
+
+
+def parse_ip(value):
+    """解析IP（字符串或整数），返回 (版本, 整数值)"""
+    value = value.strip().strip('"')
+    if value.isdigit():
+        number = int(value)
+        if number <= 0xFFFFFFFF:
+            return 4, number
+        if IPV4_MAPPED_START <= number <= IPV4_MAPPED_END:
+            return 4, number - IPV4_MAPPED_START
+        if number <= (1 << 128) - 1:
+            return 6, number
+        raise ValueError(f'IP超出范围: {value}')
+
+    ip = ipaddress.ip_address(value)
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.version, int(ip)
+
+
+def read_ranges(paths):
+    """读取CSV文件，返回 {4: [...], 6: [...]}，元素为 (start, end, 国家码)"""
+    ranges = {4: [], 6: []}
+    skipped = 0
+
+    for path in paths:
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            for row in csv.reader(f):
+                if len(row) < 3 or not row[0].strip() or row[0].lstrip().startswith('#'):
+                    continue
+
+                country = row[2].strip().strip('"').upper()
+                if len(country) != 2 or not country.isalpha() or country == 'ZZ':
+                    skipped += 1
+                    continue
+
+                try:
+                    start_version, start = parse_ip(row[0])
+                    end_version, end = parse_ip(row[1])
+                except ValueError:
+                    # 表头或无法解析的行
+                    skipped += 1
+                    continue
+
+                if start_version != end_version or start > end:
+                    skipped += 1
+                    continue
+
+                ranges[start_version].append((start, end, country))
+
+    return ranges, skipped
+
+
+def normalize(ranges):
+    """排序、检查重叠并合并国家相同的相邻IP段"""
+    ranges.sort()
+    merged = []
+    for start, end, country in ranges:
+        if merged:
+            last_start, last_end, last_country = merged[-1]
+            if start <= last_end:
+                if country != last_country:
+                    raise ValueError(
+                        f'IP段重叠且国家不同: {last_start}-{last_end} {last_country} / {start}-{end} {country}'
+                    )
+                merged[-1] = (last_start, max(last_end, end), country)
+                continue
+            if start == last_end + 1 and country == last_country:
+                merged[-1] = (last_start, end, country)
+                continue
+        merged.append((start, end, country))
+    return merged
+
+
+def write_index(v4, v6, output):
+    """写入二进制索引（先写临时文件再原子替换，运行中的worker不受影响）"""
+    output_dir = os.path.dirname(os.path.abspath(output))
+    os.makedirs(output_dir, exist_ok=True)
+
+    tmp_path = output + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(GEOIP_HEADER.pack(GEOIP_MAGIC, GEOIP_VERSION, 0, len(v4), len(v6)))
+        for width, table in ((4, v4), (16, v6)):
+            for start, end, country in table:
+                f.write(start.to_bytes(width, 'big'))
+                f.write(end.to_bytes(width, 'big'))
+                f.write(country.encode('ascii'))
+    os.replace(tmp_path, output)
+
+
+def build(paths, output):
+    """构建离线IP库，返回 (IPv4段数, IPv6段数, 跳过行数)"""
+    ranges, skipped = read_ranges(paths)
+    v4 = normalize(ranges[4])
+    v6 = normalize(ranges[6])
+    write_index(v4, v6, output)
+    return len(v4), len(v6), skipped
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='把CSV格式的IP段数据转换为离线IP库')
+    parser.add_argument('csv_files', nargs='+', help='CSV文件（起始IP, 结束IP, 国家码）')
+    parser.add_argument('-o', '--output', default=GEOIP_DB_PATH, help='输出文件路径')
+    args = parser.parse_args()
+
+    try:
+        v4_count, v6_count, skipped = build(args.csv_files, args.output)
+    except (OSError, ValueError) as e:
+        print(f"✗ 构建失败：{e}")
+        sys.exit(1)
+
+    size = os.path.getsize(args.output)
+    print(f"✓ 离线IP库已生成：{args.output} (大小: {size} bytes)")
+    print(f"  - IPv4段：{v4_count}")
+    print(f"  - IPv6段：{v6_count}")
+    print(f"  - 跳过行：{skipped}")
@@ -0,0 +1,168 @@
+# 管理后台的批量删除和批量重置
+#
+# 大批量的兑换码、设备指纹或邮箱先写入本连接的临时表（temp.bulk_keys，只写临时库，
+# 不占用主库的写锁），再按 BULK_CHUNK_SIZE 分批处理：每批一个 BEGIN IMMEDIATE 事务，
+# 批与批之间释放写锁并稍作停顿，等待中的领取请求可以插进来提交。
+# 不再拼接 IN (?,?,...)，不受 SQLite 参数个数上限的限制。
+# 按条件删除（未使用 / 已使用 / 全部）同样每次只删除 BULK_CHUNK_SIZE 行。
+
+import os
+import time
+
+import change_log
+from change_log import record_change
+from db import run_in_transaction
+
+BULK_CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE', 5000))  # 每个写事务处理的行数
+BULK_CHUNK_PAUSE = float(os.environ.get('BULK_CHUNK_PAUSE', 0.01))  # 两批之间释放写锁的时间（秒）
+BULK_STAGE_BATCH = 50000  # 写入临时表时每次 executemany 的行数
+
+# 按条件删除兑换码
+DELETE_CONDITIONS = {
+    'delete_unused': 'is_used = FALSE',
+    'delete_used': 'is_used = TRUE',
+    'delete_all': '1',
+}
+
+STAGED_CHUNK = 'SELECT key FROM temp.bulk_keys WHERE id > ? AND id <= ?'
+
+# 按临时表中的一批键（参数为 id 区间）删除或重置
+DELETE_STAGED_CODES_SQL = f'DELETE FROM codes WHERE code IN ({STAGED_CHUNK})'
+RESET_RELEASED_SQL = f'''
+    SELECT claimed_by_fingerprint, code FROM codes WHERE claimed_by_fingerprint IN ({STAGED_CHUNK})
+'''
+RESET_SURVEY_COUNTS_SQL = f'''
+    SELECT device_fingerprint, COUNT(*) FROM surveys WHERE device_fingerprint IN ({STAGED_CHUNK})
+    GROUP BY device_fingerprint
+'''
+RESET_CODES_SQL = f'''
+    UPDATE codes
+    SET is_used = FALSE, claimed_at = NULL, claimed_by_fingerprint = NULL
+    WHERE claimed_by_fingerprint IN ({STAGED_CHUNK})
+'''
+RESET_SURVEYS_SQL = f'DELETE FROM surveys WHERE device_fingerprint IN ({STAGED_CHUNK})'
+RESET_USERS_SQL = f'DELETE FROM users WHERE device_fingerprint IN ({STAGED_CHUNK})'
+
+
+def _settings(chunk_size, pause):
+    return (chunk_size or BULK_CHUNK_SIZE, BULK_CHUNK_PAUSE if pause is None else pause)
+
+
+def stage_keys(conn, keys):
+    """把键写入临时表（去重），返回不重复的键数"""
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute('DROP TABLE IF EXISTS temp.bulk_keys')
+    conn.execute('CREATE TEMP TABLE bulk_keys (id INTEGER PRIMARY KEY, key TEXT UNIQUE NOT NULL)')
+
+    batch = []
+    for key in keys:
+        key = key.strip() if isinstance(key, str) else key
+        if key:
+            batch.append((key,))
+        if len(batch) >= BULK_STAGE_BATCH:
+            conn.executemany('INSERT OR IGNORE INTO temp.bulk_keys (key) VALUES (?)', batch)
+            batch = []
+    if batch:
+        conn.executemany('INSERT OR IGNORE INTO temp.bulk_keys (key) VALUES (?)', batch)
+    conn.commit()
+    return conn.execute('SELECT COUNT(*) FROM temp.bulk_keys').fetchone()[0]
+
+
+def drop_staged(conn):
+    if conn.in_transaction:
+        conn.rollback()
+    conn.execute('DROP TABLE IF EXISTS temp.bulk_keys')
+
+
+def _staged_ranges(conn, chunk_size):
+    # id 是连续的自增值（去重被忽略的行不占用id），按区间分批
+    last = conn.execute('SELECT MAX(id) FROM temp.bulk_keys').fetchone()[0] or 0
+    for low in range(0, last, chunk_size):
+        yield low, min(low + chunk_size, last)
+
+
+def delete_codes_where(conn, action, chunk_size=None, pause=None):
+    """按条件分批删除兑换码，返回删除数量"""
+    chunk_size, pause = _settings(chunk_size, pause)
+    condition = DELETE_CONDITIONS[action]
+    sql = f'DELETE FROM codes WHERE id IN (SELECT id FROM codes WHERE {condition} LIMIT ?)'
+    deleted = 0
+    while True:
+        count = run_in_transaction(conn, lambda conn: conn.execute(sql, (chunk_size,)).rowcount)
+        deleted += count
+        if count < chunk_size:
+            return deleted
+        time.sleep(pause)
+
+
+def delete_staged_codes(conn, codes, chunk_size=None, pause=None):
+    """分批删除指定的兑换码，返回删除数量"""
+    chunk_size, pause = _settings(chunk_size, pause)
+    stage_keys(conn, codes)
+    deleted = 0
+    try:
+        for index, (low, high) in enumerate(_staged_ranges(conn, chunk_size)):
+            if index:
+                time.sleep(pause)
+            deleted += run_in_transaction(
+                conn, lambda conn: conn.execute(DELETE_STAGED_CODES_SQL, (low, high)).rowcount
+            )
+    finally:
+        drop_staged(conn)
+    return deleted
+
+
+def _reset_chunk(conn, low, high):
+    cursor = conn.cursor()
+    released = {}
+    for fingerprint, code in cursor.execute(RESET_RELEASED_SQL, (low, high)).fetchall():
+        released.setdefault(fingerprint, []).append(code)
+    surveys = dict(cursor.execute(RESET_SURVEY_COUNTS_SQL, (low, high)).fetchall())
+
+    # 将这些用户的兑换码重置为未使用状态，并清除调研数据和用户记录
+    cursor.execute(RESET_CODES_SQL, (low, high))
+    codes = cursor.rowcount
+    cursor.execute(RESET_SURVEYS_SQL, (low, high))
+    deleted_surveys = cursor.rowcount
+    cursor.execute(RESET_USERS_SQL, (low, high))
+    users = cursor.rowcount
+
+    for fingerprint in sorted(set(released) | set(surveys)):
+        record_change(cursor, change_log.RESET, fingerprint, {
+            'codes': released.get(fingerprint, []), 'deleted_surveys': surveys.get(fingerprint, 0)
+        })
+    return {'users': users, 'codes': codes, 'surveys': deleted_surveys, 'reset': len(set(released) | set(surveys))}
+
+
+def reset_users(conn, fingerprints=(), emails=(), chunk_size=None, pause=None):
+    """
+    分批重置用户（释放兑换码、删除调研和用户记录），邮箱先换成对应的设备指纹。
+    返回 {'users': 删除的用户数, 'codes': 释放的兑换码数, 'surveys': 删除的调研数, 'reset': 有记录被重置的设备数}
+    """
+    chunk_size, pause = _settings(chunk_size, pause)
+    stage_keys(conn, fingerprints)
+    totals = {'users': 0, 'codes': 0, 'surveys': 0, 'reset': 0}
+    try:
+        emails = list(emails)
+        if emails:
+            conn.execute('CREATE TEMP TABLE IF NOT EXISTS bulk_emails (email TEXT PRIMARY KEY)')
+            conn.execute('DELETE FROM temp.bulk_emails')
+            conn.executemany('INSERT OR IGNORE INTO temp.bulk_emails (email) VALUES (?)',
+                             ((email.strip(),) for email in emails if email and email.strip()))
+            conn.execute('''
+                INSERT OR IGNORE INTO temp.bulk_keys (key)
+                SELECT device_fingerprint FROM users WHERE email IN (SELECT email FROM temp.bulk_emails)
+            ''')
+            conn.execute('DROP TABLE temp.bulk_emails')
+            conn.commit()
+
+        for index, (low, high) in enumerate(_staged_ranges(conn, chunk_size)):
+            if index:
+                time.sleep(pause)
+            result = run_in_transaction(conn, lambda conn: _reset_chunk(conn, low, high))
+            for name in totals:
+                totals[name] += result[name]
+    finally:
+        drop_staged(conn)
+    return totals
@@ -0,0 +1,56 @@
+# 变更日志（/api/surveys/changes 的数据来源）
+#
+# 新增调研、领取兑换码、重置用户时，在同一个事务中向 change_log 追加一行，
+# 事务回滚时日志也一起回滚，不会出现只有日志没有数据（或反过来）的情况。
+# change_log.id 是单调递增的变更序号（AUTOINCREMENT，删除后也不会复用），
+# 客户端记住读到的最后一个序号，下次用 ?since= 只取之后的变更。
+# SQLite 同一时间只有一个写事务，序号的分配顺序就是提交顺序，不会出现
+# 较小的序号晚于较大的序号可见而被客户端跳过的情况。
+
+import json
+import os
+
+CHANGE_FEED_LIMIT = int(os.environ.get('CHANGE_FEED_LIMIT', 1000))  # 每次最多返回的变更数
+CHANGE_FEED_MAX_LIMIT = int(os.environ.get('CHANGE_FEED_MAX_LIMIT', 10000))
+
+# 变更类型
+SURVEY = 'survey'  # 新增调研
+CLAIM = 'claim'  # 领取兑换码
+RESET = 'reset'  # 重置用户（释放兑换码、删除调研和用户记录）
+
+READ_CHANGES_SQL = '''
+    SELECT id, kind, device_fingerprint, payload, created_at
+    FROM change_log
+    WHERE id > ?
+    ORDER BY id
+    LIMIT ?
+'''
+
+
+def record_change(cursor, kind, fingerprint, payload):
+    """在调用方的事务中追加一条变更"""
+    cursor.execute('''
+        INSERT INTO change_log (kind, device_fingerprint, payload, created_at)
+        VALUES (?, ?, ?, datetime('now', 'localtime'))
+    ''', (kind, fingerprint, json.dumps(payload, ensure_ascii=False, separators=(',', ':'))))
+
+
+def read_changes(conn, since, limit=None):
+    """读取序号大于 since 的变更，按序号升序"""
+    limit = min(limit or CHANGE_FEED_LIMIT, CHANGE_FEED_MAX_LIMIT)
+    return conn.execute(READ_CHANGES_SQL, (since, limit)).fetchall()
+
+
+def latest_seq(conn):
+    """当前最大的变更序号"""
+    return conn.execute('SELECT COALESCE(MAX(id), 0) FROM change_log').fetchone()[0]
+
+
+def to_ndjson(rows):
+    """把变更转换为紧凑的NDJSON"""
+    lines = []
+    for seq, kind, fingerprint, payload, created_at in rows:
+        record = {'seq': seq, 'type': kind, 'device_fingerprint': fingerprint, 'at': created_at}
+        record.update(json.loads(payload))
+        lines.append(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+    return ''.join(line + '\n' for line in lines)
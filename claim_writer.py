@@ -0,0 +1,157 @@
+# 领取请求的组提交（group commit）
+#
+# 活动上线时大量领取请求同时到达，每个请求各自 BEGIN IMMEDIATE / COMMIT，
+# 提交次数等于请求数，写锁在请求之间反复交接。开启 CLAIM_GROUP_COMMIT 后，
+# 请求线程只把领取事务函数交给本进程的写入线程，写入线程收集一小批
+# （最多 CLAIM_BATCH_SIZE 个，或第一个到达后等待 CLAIM_BATCH_WAIT_MS 毫秒），
+# 在一个事务中依次执行、只提交一次，提交成功后才唤醒等待的请求返回结果。
+#
+# 每个请求的修改放在各自的 SAVEPOINT 中：某个请求抛出异常或 Rollback 时
+# 只回滚它自己的修改，同一批的其他请求不受影响。批内按到达顺序串行执行，
+# 后面的请求能看到前面请求的写入（同一设备重复提交仍能被识别）。
+# 写入线程的连接使用 CLAIM_WRITER_SYNCHRONOUS（默认 FULL）：一批只 fsync 一次，
+# 返回给用户的结果在断电后也不会丢失。
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from db import Rollback, is_busy_error, run_in_transaction
+
+CLAIM_BATCH_SIZE = int(os.environ.get('CLAIM_BATCH_SIZE', 64))  # 每批最多合并的领取请求数
+CLAIM_BATCH_WAIT_MS = float(os.environ.get('CLAIM_BATCH_WAIT_MS', 5))  # 第一个请求到达后最多等待的时间（毫秒）
+CLAIM_WRITER_TIMEOUT = float(os.environ.get('CLAIM_WRITER_TIMEOUT', 30))  # 请求等待提交结果的最长时间（秒）
+CLAIM_WRITER_SYNCHRONOUS = os.environ.get('CLAIM_WRITER_SYNCHRONOUS', 'FULL')  # 写入线程连接的 synchronous 级别
+
+
+def group_commit_enabled():
+    """是否开启组提交：CLAIM_GROUP_COMMIT=1（调用时读取，.env 中的值同样生效）"""
+    return os.environ.get('CLAIM_GROUP_COMMIT', '0') == '1'
+
+
+class _Job:
+    __slots__ = ('func', 'done', 'result', 'error', 'state')
+
+    def __init__(self, func):
+        self.func = func
+        self.state = 'queued'  # queued -> running，或者等待超时后 abandoned
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ClaimWriter:
+    """本进程的领取写入线程：合并多个领取事务一次提交"""
+
+    def __init__(self, connect, batch_size=None, wait_ms=None, timeout=None, synchronous=None):
+        self.connect = connect
+        self.batch_size = batch_size or CLAIM_BATCH_SIZE
+        self.wait = (CLAIM_BATCH_WAIT_MS if wait_ms is None else wait_ms) / 1000.0
+        self.timeout = timeout or CLAIM_WRITER_TIMEOUT
+        self.synchronous = synchronous or CLAIM_WRITER_SYNCHRONOUS
+        self._lock = threading.Lock()
+        self._queue = None
+        self._pid = None
+        self._stats = {'batches': 0, 'jobs': 0, 'max_batch': 0, 'failed_batches': 0, 'abandoned': 0}
+
+    def _start(self):
+        # 首次提交时启动写入线程（fork之后在子进程中重新启动）
+        self._pid = os.getpid()
+        self._queue = queue.Queue()
+        thread = threading.Thread(target=self._run, args=(self._queue,), name='claim-writer', daemon=True)
+        thread.start()
+
+    def submit(self, func):
+        """提交事务函数 func(conn)，等待所在批次提交后返回它的返回值（或抛出它的异常）"""
+        job = _Job(func)
+        with self._lock:
+            if self._pid != os.getpid():
+                self._start()
+            self._queue.put(job)
+        if not job.done.wait(self.timeout):
+            with self._lock:
+                abandoned = job.state == 'queued'
+                if abandoned:
+                    job.state = 'abandoned'
+            if abandoned:
+                # 还没开始执行：写入线程会跳过它，不会在返回错误之后又提交
+                raise sqlite3.OperationalError('等待领取写入超时')
+            # 已经在执行的请求等待提交结果，返回给用户的一定是实际提交的结果
+            job.done.wait()
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def _collect(self, jobs):
+        # 第一个请求到达后最多等待 self.wait 秒，凑满一批立即执行
+        batch = [jobs.get()]
+        deadline = time.monotonic() + self.wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(jobs.get(timeout=remaining) if remaining > 0 else jobs.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, jobs):
+        configured = None
+        while True:
+            batch = self._collect(jobs)
+            try:
+                conn = self.connect()
+                if conn is not configured:
+                    conn.execute(f'PRAGMA synchronous={self.synchronous}')
+                    configured = conn
+                outcomes = run_in_transaction(conn, lambda conn: self._execute(conn, batch))
+            except Exception as e:
+                # 整批失败（例如提交时出错）：每个请求都收到同一个异常
+                outcomes = [(None, e)] * len(batch)
+                with self._lock:
+                    self._stats['failed_batches'] += 1
+
+            with self._lock:
+                self._stats['batches'] += 1
+                self._stats['jobs'] += len(batch)
+                self._stats['max_batch'] = max(self._stats['max_batch'], len(batch))
+            for job, (result, error) in zip(batch, outcomes):
+                job.result, job.error = result, error
+                job.done.set()
+
+    def _execute(self, conn, batch):
+        # 在写事务中依次执行，每个请求一个 SAVEPOINT；返回 [(返回值, 异常)]
+        outcomes = []
+        for job in batch:
+            with self._lock:
+                if job.state == 'abandoned':
+                    self._stats['abandoned'] += 1
+                    outcomes.append((None, sqlite3.OperationalError('等待领取写入超时')))
+                    continue
+                job.state = 'running'
+            conn.execute('SAVEPOINT claim')
+            try:
+                result = job.func(conn)
+            except Rollback as e:
+                conn.execute('ROLLBACK TO claim')
+                conn.execute('RELEASE claim')
+                outcomes.append((e.result, None))
+            except Exception as e:
+                if isinstance(e, sqlite3.OperationalError) and is_busy_error(e):
+                    # 锁冲突交给 run_in_transaction 整批重试
+                    raise
+                conn.execute('ROLLBACK TO claim')
+                conn.execute('RELEASE claim')
+                outcomes.append((None, e))
+            else:
+                conn.execute('RELEASE claim')
+                outcomes.append((result, None))
+        return outcomes
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['avg_batch'] = round(stats['jobs'] / stats['batches'], 2) if stats['batches'] else 0.0
+        stats['queued'] = self._queue.qsize() if self._queue is not None else 0
+        return stats
@@ -0,0 +1,68 @@
+# 兑换码发放
+#
+# 用一条 UPDATE ... WHERE id = (SELECT ... LIMIT 1) 语句原子地领取兑换码：
+# SQLite 在执行该语句时已持有写锁，子查询选出的行不会被其他进程抢走，
+# 因此并发领取时不会再出现“兑换码已被占用，请重试”。
+# 子查询走 idx_codes_used(is_used, claimed_at) 索引，直接定位到第一个未使用的兑换码，
+# 不需要跳过已使用的行（不要加 ORDER BY id，否则会退化为按主键全表扫描）。
+# 遇到 database is locked 时自动退避重试，次数有上限。
+# 领取成功时在同一事务中写入变更日志。
+
+import sqlite3
+
+from change_log import CLAIM, record_change
+from db import run_in_transaction
+
+# RETURNING 需要 SQLite 3.35+，低版本改为在同一事务内按指纹回查
+SUPPORTS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+CLAIM_SQL = '''
+    UPDATE codes
+    SET is_used = TRUE, claimed_at = datetime('now', 'localtime'), claimed_by_fingerprint = ?
+    WHERE id = (
+        SELECT id FROM codes
+        WHERE is_used = FALSE AND claimed_by_fingerprint IS NULL
+        LIMIT 1
+    )
+'''
+
+EXISTING_CODE_SQL = 'SELECT code FROM codes WHERE claimed_by_fingerprint = ?'
+
+
+def _claim(conn, fingerprint):
+    """在当前事务中领取兑换码，返回 (兑换码, 是否为已领取过的兑换码)"""
+    cursor = conn.cursor()
+
+    # 二次检查：确保用户没有已领取的兑换码
+    cursor.execute(EXISTING_CODE_SQL, (fingerprint,))
+    existing = cursor.fetchone()
+    if existing:
+        return existing[0], True
+
+    if SUPPORTS_RETURNING:
+        cursor.execute(CLAIM_SQL + ' RETURNING code', (fingerprint,))
+        row = cursor.fetchone()
+        code = row[0] if row else None
+    else:
+        cursor.execute(CLAIM_SQL, (fingerprint,))
+        code = None
+        if cursor.rowcount:
+            cursor.execute(EXISTING_CODE_SQL, (fingerprint,))
+            code = cursor.fetchone()[0]
+
+    if code:
+        record_change(cursor, CLAIM, fingerprint, {'code': code})
+    return code, False
+
+
+def claim_code(conn, fingerprint, max_retries=None):
+    """
+    为设备指纹领取一个兑换码，返回 (兑换码, 是否为已领取过的兑换码)；
+    兑换码已领完时返回 (None, False)。
+
+    如果连接已处于事务中，则由调用方负责提交和重试；
+    否则在 BEGIN IMMEDIATE 事务中完成，遇到锁冲突自动重试。
+    """
+    if conn.in_transaction:
+        return _claim(conn, fingerprint)
+    return run_in_transaction(conn, lambda c: _claim(c, fingerprint), max_retries)
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+兑换码生成
+
+随机数来自 os.urandom（操作系统的密码学安全随机数）。一次取一大块随机字节，
+用 bytes.translate 把每个字节映射为字母表中的字符，并删掉会造成取模偏差的字节，
+整批映射在C代码中完成，每个字符等概率。
+去重：同一批内用集合去重，与已有兑换码的重复由 codes.code 的唯一索引判定
+（INSERT OR IGNORE），被忽略的部分在下一批补足，内存占用只与批大小有关。
+每批一个事务，批与批之间释放写锁，生成期间领取不受影响。
+
+剩余兑换码低于 CODE_LOW_WATER 时，后台线程自动补充 CODE_REFILL_COUNT 个（0 表示不自动补充）。
+
+用法：
+    python code_generator.py 1000000                     生成100万个兑换码
+    python code_generator.py 1000 --length 12 --alphabet ABCDEFGHJKLMNPQRSTUVWXYZ23456789
+"""
+
+import argparse
+import fcntl
+import os
+import sqlite3
+import string
+import sys
+import threading
+import time
+
+# 添加项目路径到系统路径
+project_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_path)
+
+from db import run_in_transaction
+
+CODE_ALPHABET = os.environ.get('CODE_ALPHABET', string.ascii_letters + string.digits)  # 兑换码字符集
+CODE_LENGTH = int(os.environ.get('CODE_LENGTH', 16))  # 兑换码长度
+GENERATE_BATCH_SIZE = int(os.environ.get('GENERATE_BATCH_SIZE', 100000))  # 每批（每个事务）生成的数量
+GENERATE_MAX_COUNT = int(os.environ.get('GENERATE_MAX_COUNT', 10000000))  # 单次最多生成的数量
+CODE_LOW_WATER = int(os.environ.get('CODE_LOW_WATER', 0))  # 剩余兑换码低于此数时自动补充（0 表示不自动补充）
+CODE_REFILL_COUNT = int(os.environ.get('CODE_REFILL_COUNT', 10000))  # 每次自动补充的数量
+CODE_REFILL_CHECK_INTERVAL = float(os.environ.get('CODE_REFILL_CHECK_INTERVAL', 10))  # 检查剩余数量的间隔（秒）
+
+# 编码空间至少是 (已有 + 新生成) 数量的多少倍，否则重复太多、兑换码也容易被猜中
+MIN_SPACE_RATIO = 10 ** 6
+
+INSERT_SQL = 'INSERT OR IGNORE INTO codes (code) VALUES (?)'
+
+
+def validate_alphabet(alphabet, length):
+    """检查字符集和长度，不合法时抛出 ValueError"""
+    if not alphabet or len(set(alphabet)) != len(alphabet):
+        raise ValueError('字符集不能为空，也不能有重复字符')
+    if not all(32 < ord(char) < 127 and char not in ',"' for char in alphabet):
+        raise ValueError('字符集只能包含可见ASCII字符（不含逗号和引号）')
+    if len(alphabet) < 2 or not 4 <= length <= 32:
+        raise ValueError('字符集至少2个字符，长度应在4到32之间')
+
+
+class CodeFactory:
+    """按字符集和长度批量生成随机兑换码"""
+
+    def __init__(self, alphabet=None, length=None):
+        self.alphabet = alphabet or CODE_ALPHABET
+        self.length = length or CODE_LENGTH
+        validate_alphabet(self.alphabet, self.length)
+
+        # 只使用小于 len(alphabet) 整数倍的字节值，保证每个字符等概率
+        size = len(self.alphabet)
+        usable = 256 - 256 % size
+        table = bytearray(256)
+        for value in range(usable):
+            table[value] = ord(self.alphabet[value % size])
+        self._table = bytes(table)
+        self._rejected = bytes(range(usable, 256))
+        self._accept_ratio = usable / 256
+
+    @property
+    def space(self):
+        """可能的兑换码总数"""
+        return len(self.alphabet) ** self.length
+
+    def random_chars(self, count):
+        """count 个随机字符（ASCII字节串）"""
+        chunks = []
+        remaining = count
+        while remaining > 0:
+            raw = os.urandom(int(remaining / self._accept_ratio) + 64)
+            chunk = raw.translate(self._table, self._rejected)[:remaining]
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        return b''.join(chunks)
+
+    def codes(self, count):
+        """count 个随机兑换码（同一批内不重复）"""
+        length = self.length
+        result = set()
+        while len(result) < count:
+            need = count - len(result)
+            chars = self.random_chars(need * length).decode('ascii')
+            result.update(chars[i:i + length] for i in range(0, need * length, length))
+        return list(result)
+
+
+def check_capacity(conn, factory, count):
+    """检查生成数量和编码空间，不合法时抛出 ValueError"""
+    if count <= 0:
+        raise ValueError('生成数量必须大于0')
+    if count > GENERATE_MAX_COUNT:
+        raise ValueError(f'单次最多生成 {GENERATE_MAX_COUNT} 个兑换码')
+
+    row = conn.execute('SELECT total_codes FROM counters WHERE id = 1').fetchone()
+    existing = row[0] if row else 0
+    if factory.space < (existing + count) * MIN_SPACE_RATIO:
+        raise ValueError('字符集或长度太小，请增加兑换码长度')
+
+
+def iter_generate(conn, count, factory=None, batch_size=None):
+    """分批生成并写入 count 个新兑换码，每批提交后产出进度 {'generated', 'collisions'}"""
+    factory = factory or CodeFactory()
+    batch_size = batch_size or GENERATE_BATCH_SIZE
+    progress = {'generated': 0, 'collisions': 0}
+    if conn.in_transaction:
+        conn.commit()
+
+    while progress['generated'] < count:
+        batch = factory.codes(min(batch_size, count - progress['generated']))
+        batch.sort()
+
+        def insert(conn):
+            return conn.executemany(INSERT_SQL, ((code,) for code in batch)).rowcount
+
+        inserted = run_in_transaction(conn, insert)
+        progress['generated'] += inserted
+        # 与已有兑换码重复而被忽略的，下一批补足
+        progress['collisions'] += len(batch) - inserted
+        yield dict(progress)
+
+
+def generate_codes(conn, count, factory=None, batch_size=None, on_progress=None):
+    """生成 count 个新兑换码并写入 codes 表，返回 {'generated', 'collisions'}"""
+    factory = factory or CodeFactory()
+    check_capacity(conn, factory, count)
+    progress = {'generated': 0, 'collisions': 0}
+    for progress in iter_generate(conn, count, factory, batch_size):
+        if on_progress:
+            on_progress(progress)
+    return progress
+
+
+class CodeRefiller:
+    """剩余兑换码低于低水位时在后台补充（多个worker中同一时间只有一个在补充）"""
+
+    def __init__(self, connect, lock_path, low_water=None, refill_count=None, check_interval=None, on_refill=None):
+        self.connect = connect
+        self.lock_path = lock_path
+        self.low_water = CODE_LOW_WATER if low_water is None else low_water
+        self.refill_count = CODE_REFILL_COUNT if refill_count is None else refill_count
+        self.check_interval = CODE_REFILL_CHECK_INTERVAL if check_interval is None else check_interval
+        self.on_refill = on_refill  # 补充后回调（例如让统计接口的ETag失效）
+        self._lock = threading.Lock()
+        self._running = False
+        self._checked = 0
+        self._stats = {'refills': 0, 'generated': 0, 'errors': 0}
+
+    def check(self):
+        """检查间隔已过时在后台线程中检查剩余数量（不阻塞调用方）"""
+        if self.low_water <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if self._running or now - self._checked < self.check_interval:
+                return
+            self._running = True
+            self._checked = now
+        threading.Thread(target=self._run, name='code-refill', daemon=True).start()
+
+    def _run(self):
+        try:
+            self.refill()
+        except Exception as e:
+            with self._lock:
+                self._stats['errors'] += 1
+            print(f"自动补充兑换码失败: {str(e)}")
+        finally:
+            with self._lock:
+                self._running = False
+
+    def refill(self):
+        """剩余数量低于低水位时补充，返回生成的数量"""
+        with open(self.lock_path, 'a+b') as lock_file:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return 0  # 其他worker正在补充
+
+            conn = self.connect()
+            try:
+                row = conn.execute('SELECT total_codes - used_codes FROM counters WHERE id = 1').fetchone()
+                if row is None or row[0] >= self.low_water:
+                    return 0
+                result = generate_codes(conn, self.refill_count)
+            finally:
+                conn.close()
+
+        with self._lock:
+            self._stats['refills'] += 1
+            self._stats['generated'] += result['generated']
+        if self.on_refill:
+            self.on_refill()
+        return result['generated']
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['low_water'] = self.low_water
+        stats['refill_count'] = self.refill_count
+        return stats
+
+
+if __name__ == '__main__':
+    from app import DATABASE_PATH
+    from data_version import DataVersion
+    from migrations import migrate
+    from shared_memory import shm_path_for_database
+
+    parser = argparse.ArgumentParser(description='生成随机兑换码并写入数据库')
+    parser.add_argument('count', type=int, help='生成数量')
+    parser.add_argument('--length', type=int, default=CODE_LENGTH, help='兑换码长度')
+    parser.add_argument('--alphabet', default=CODE_ALPHABET, help='字符集')
+    parser.add_argument('--db', default=DATABASE_PATH, help='数据库路径')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    start = time.perf_counter()
+
+    def report(progress):
+        print(f"  已生成 {progress['generated']:,} / {args.count:,}", end='\r', flush=True)
+
+    try:
+        migrate(conn)
+        result = generate_codes(conn, args.count, CodeFactory(args.alphabet, args.length), on_progress=report)
+    except (ValueError, sqlite3.Error) as e:
+        print(f"\n✗ 生成失败：{e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - start
+    DataVersion(shm_path_for_database('gift_bihuoai_data_version', args.db)).bump()
+    print(f"\n✓ 已生成 {result['generated']:,} 个兑换码（{result['collisions']} 个与已有兑换码重复后重新生成），"
+          f"耗时 {elapsed:.1f} 秒")
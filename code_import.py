@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+兑换码批量导入
+
+兑换码按行读取（纯文本每行一个，原样保留逗号；CSV取第一列，可带 code 表头），边读边分批写入：
+每批用一次 executemany 执行 INSERT OR IGNORE，重复的兑换码由唯一索引忽略，
+不再逐条捕获 IntegrityError。整个导入在一个事务中完成，中途出错或中断时全部回滚。
+每批写入的行数取自 SQLite 的 changes()，导入数 + 重复数 = 读取的兑换码数。
+批内按兑换码排序后写入，唯一索引按顺序插入，减少随机页访问。
+
+用法：
+    python code_import.py codes.txt              导入文本或CSV文件
+    python code_import.py codes.csv --db gift_codes.db
+"""
+
+import argparse
+import io
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+# 添加项目路径到系统路径
+project_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_path)
+
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 50000))  # 每批写入的兑换码数
+IMPORT_CACHE_SIZE = int(os.environ.get('IMPORT_CACHE_SIZE', 65536))  # 导入期间的页缓存大小（KB）
+IMPORT_SPOOL_MAX_SIZE = int(os.environ.get('IMPORT_SPOOL_MAX_SIZE', 512 * 1024))  # 请求体超过该大小（字节）时写入临时文件
+
+INSERT_SQL = 'INSERT OR IGNORE INTO codes (code) VALUES (?)'
+
+
+def parse_lines(lines):
+    """CSV：从每一行取出第一列，跳过空行和 code 表头"""
+    first = True
+    for line in lines:
+        code = line.split(',', 1)[0].strip().strip('"').strip()
+        if first:
+            first = False
+            code = code.lstrip('\ufeff')
+            if code.lower() == 'code':
+                continue
+        if code:
+            yield code
+
+
+def strip_lines(lines):
+    """纯文本每行一个兑换码：去掉首尾空白，跳过空行（不按CSV拆分）"""
+    for line in lines:
+        code = line.strip()
+        if code:
+            yield code
+
+
+def text_lines(stream, encoding='utf-8-sig'):
+    """把上传的二进制流按行解码（不整体读入内存）"""
+    return io.TextIOWrapper(stream, encoding=encoding, errors='replace', newline=None)
+
+
+def spool_stream(stream):
+    """
+    把请求体完整读到临时文件（小的留在内存）再从头读取。
+    要在开始写事务之前调用：客户端上传慢时不会一直占着数据库写锁。
+    """
+    spooled = tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_MAX_SIZE)
+    shutil.copyfileobj(stream, spooled)
+    spooled.seek(0)
+    return spooled
+
+
+def _batches(codes, batch_size):
+    batch = []
+    for code in codes:
+        batch.append(code)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_import(conn, codes, batch_size=None):
+    """
+    在一个写事务中分批导入，每批写入后产出进度 {'processed', 'imported', 'duplicates'}，
+    最后一次产出的是最终结果（带 done=True）。生成器未读完就被关闭时回滚。
+    """
+    batch_size = batch_size or IMPORT_BATCH_SIZE
+    progress = {'processed': 0, 'imported': 0, 'duplicates': 0}
+
+    previous_cache_size = conn.execute('PRAGMA cache_size').fetchone()[0]
+    conn.execute(f'PRAGMA cache_size=-{int(IMPORT_CACHE_SIZE)}')
+    try:
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute('BEGIN IMMEDIATE')
+        cursor = conn.cursor()
+        for batch in _batches(codes, batch_size):
+            batch.sort()
+            cursor.executemany(INSERT_SQL, ((code,) for code in batch))
+            progress['processed'] += len(batch)
+            progress['imported'] += cursor.rowcount
+            progress['duplicates'] = progress['processed'] - progress['imported']
+            yield dict(progress)
+        conn.commit()
+    except BaseException:
+        # 包括客户端断开导致的 GeneratorExit
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        conn.execute(f'PRAGMA cache_size={int(previous_cache_size)}')
+
+    progress['done'] = True
+    yield progress
+
+
+def import_codes(conn, codes, batch_size=None, on_progress=None):
+    """导入兑换码，返回 {'processed', 'imported', 'duplicates'}"""
+    result = None
+    for result in iter_import(conn, codes, batch_size):
+        if on_progress and not result.get('done'):
+            on_progress(result)
+    return result
+
+
+if __name__ == '__main__':
+    from app import DATABASE_PATH
+    from data_version import DataVersion
+    from migrations import migrate
+    from shared_memory import shm_path_for_database
+
+    parser = argparse.ArgumentParser(description='从文本或CSV文件批量导入兑换码')
+    parser.add_argument('file', help='兑换码文件（每行一个，CSV取第一列）')
+    parser.add_argument('--db', default=DATABASE_PATH, help='数据库路径')
+    parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help='每批写入的兑换码数')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    start = time.perf_counter()
+
+    def report(progress):
+        print(f"  已读取 {progress['processed']:,} 个，导入 {progress['imported']:,} 个", end='\r', flush=True)
+
+    try:
+        migrate(conn)
+        with open(args.file, 'r', encoding='utf-8-sig', errors='replace') as f:
+            result = import_codes(conn, parse_lines(f), args.batch_size, report)
+    except (OSError, sqlite3.Error) as e:
+        print(f"\n✗ 导入失败：{e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - start
+    if result['imported']:
+        DataVersion(shm_path_for_database('gift_bihuoai_data_version', args.db)).bump()
+    rate = result['processed'] / elapsed if elapsed else 0
+    print(f"\n✓ 导入完成：{result['imported']:,} 个新兑换码，{result['duplicates']:,} 个重复，"
+          f"耗时 {elapsed:.1f} 秒（{rate:,.0f} 个/秒）")
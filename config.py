@@ -4,6 +4,10 @@ class Config:
     # 域名配置
     DOMAIN = os.environ.get('DOMAIN', 'https://gift.bihuoai.com')
 
+    # 微信公众号配置
+    WECHAT_APPID = os.environ.get('WECHAT_APPID', '')
+    WECHAT_SECRET = os.environ.get('WECHAT_SECRET', '')
+
     # Flask配置
     SECRET_KEY = os.environ.get('SECRET_KEY', 'your-secret-key-change-me-in-production')
 
@@ -20,20 +24,27 @@ class Config:
     IP_HOURLY_LIMIT = int(os.environ.get('IP_HOURLY_LIMIT', 3))  # 单IP每小时尝试次数
     IP_DAILY_SUCCESS = int(os.environ.get('IP_DAILY_SUCCESS', 5))  # 单IP每天成功领取次数
 
-# 从配置文件加载配置
-def load_config():
-    """从环境变量或配置文件加载配置"""
-    config = Config()
-    
-    # 尝试从本地配置文件加载（如果存在）
+def load_env_file(path='.env'):
+    """把 .env 中的配置写入环境变量，返回读取到的 {键: 值}（文件不存在时返回空字典）"""
+    values = {}
     try:
-        with open('.env', 'r', encoding='utf-8') as f:
+        with open(path, 'r', encoding='utf-8') as f:
             for line in f:
                 if '=' in line and not line.startswith('#'):
                     key, value = line.strip().split('=', 1)
                     os.environ[key] = value
-                    setattr(config, key, value)
+                    values[key] = value
     except FileNotFoundError:
         pass
+    return values
+
+# 从配置文件加载配置
+def load_config():
+    """从环境变量或配置文件加载配置"""
+    config = Config()
+    
+    # 尝试从本地配置文件加载（如果存在）
+    for key, value in load_env_file().items():
+        setattr(config, key, value)
     
-    return config
\ No newline at end of file
+    return config
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+"""测试共用的 app 环境：数据库和共享内存文件放在临时目录，测试结束后恢复 app 的全局对象"""
+
+import contextlib
+import os
+import tempfile
+
+import pytest
+
+import app
+from data_version import DataVersion
+from rate_limiter import RateLimiter
+from rollup import EventBuffer
+
+
+def use_temp_app(monkeypatch, tmp_dir):
+    """把 app 的数据库、版本号、限流和统计汇总换成临时目录中的（由 monkeypatch 负责恢复）"""
+    monkeypatch.setattr(app, 'DATABASE_PATH', os.path.join(tmp_dir, 'gift_codes.db'))
+    monkeypatch.setattr(app, 'data_version', DataVersion(os.path.join(tmp_dir, 'data_version.bin')))
+    monkeypatch.setattr(app, 'stats_version', DataVersion(os.path.join(tmp_dir, 'stats_version.bin')))
+    monkeypatch.setattr(app, 'rate_limiter', RateLimiter(
+        100, 100, path=os.path.join(tmp_dir, 'rate_limit.bin'), checkpoint_interval=0
+    ))
+    monkeypatch.setattr(app, 'rollup_events', EventBuffer(
+        lambda: app.get_db_connection(), interval=0, on_flush=lambda: app.stats_version.bump()
+    ))
+    monkeypatch.setattr(app, 'claim_writer', None)
+    app.init_database()
+    return app
+
+
+def _close_temp_app():
+    # 临时目录删除之前写完统计汇总、关闭连接，退出时不会再写到已删除（或线上）的数据库
+    app.rollup_events.flush()
+    app.db_pool.close_all()
+
+
+@pytest.fixture
+def app_module(monkeypatch, tmp_path):
+    """pytest 使用：每个测试一份临时的 app 环境，返回 app 模块"""
+    yield use_temp_app(monkeypatch, str(tmp_path))
+    _close_temp_app()
+
+
+@contextlib.contextmanager
+def temp_app():
+    """直接运行测试文件（不经过 pytest）时使用，与 app_module 相同"""
+    with tempfile.TemporaryDirectory() as tmp_dir, pytest.MonkeyPatch.context() as monkeypatch:
+        try:
+            yield use_temp_app(monkeypatch, tmp_dir)
+        finally:
+            _close_temp_app()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+物化计数器
+
+counters 表只有一行，保存兑换码总数、已使用数和调研总数，由触发器在 codes / surveys
+的插入、删除、is_used 变化时同步更新（与数据变更在同一个事务中），统计接口只需一次主键查询。
+
+用法：
+    python counters.py            重新统计并修正计数器
+    python counters.py --check    只检查，有偏差时以非0状态退出
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+
+# 添加项目路径到系统路径
+project_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_path)
+
+COUNTERS = ('total_codes', 'used_codes', 'survey_count')
+
+READ_SQL = 'SELECT total_codes, used_codes, survey_count FROM counters WHERE id = 1'
+
+RECOUNT_SQL = '''
+    SELECT (SELECT COUNT(*) FROM codes),
+           (SELECT COUNT(*) FROM codes WHERE is_used = TRUE),
+           (SELECT COUNT(*) FROM surveys)
+'''
+
+
+def read_counters(conn):
+    """读取计数器（一次主键查询）"""
+    row = conn.execute(READ_SQL).fetchone()
+    counters = dict(zip(COUNTERS, row)) if row else dict.fromkeys(COUNTERS, 0)
+    counters['remaining_codes'] = counters['total_codes'] - counters['used_codes']
+    return counters
+
+
+def reconcile(conn, fix=True):
+    """重新统计并与计数器比较，返回偏差 {名称: (计数器的值, 实际值)}；fix 为 True 时修正"""
+    conn.commit()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        row = conn.execute(READ_SQL).fetchone()
+        stored = dict(zip(COUNTERS, row)) if row else dict.fromkeys(COUNTERS)
+        actual = dict(zip(COUNTERS, conn.execute(RECOUNT_SQL).fetchone()))
+        drift = {name: (stored[name], actual[name]) for name in COUNTERS if stored[name] != actual[name]}
+
+        if drift and fix:
+            conn.execute('''
+                INSERT OR REPLACE INTO counters (id, total_codes, used_codes, survey_count)
+                VALUES (1, ?, ?, ?)
+            ''', tuple(actual[name] for name in COUNTERS))
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    return drift
+
+
+if __name__ == '__main__':
+    from app import DATABASE_PATH
+    from data_version import DataVersion
+    from migrations import migrate
+    from shared_memory import shm_path_for_database
+
+    parser = argparse.ArgumentParser(description='重新统计并修正物化计数器')
+    parser.add_argument('--check', action='store_true', help='只检查，不修正')
+    parser.add_argument('--db', default=DATABASE_PATH, help='数据库路径')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        migrate(conn)
+        drift = reconcile(conn, fix=not args.check)
+    except sqlite3.Error as e:
+        print(f"✗ 统计失败：{e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+    if not drift:
+        print("✓ 计数器与实际数据一致")
+        sys.exit(0)
+
+    for name, (stored, actual) in drift.items():
+        print(f"  - {name}：计数器 {stored}，实际 {actual}，偏差 {(stored or 0) - actual:+d}")
+    if args.check:
+        print("✗ 计数器存在偏差（使用 python counters.py 修正）")
+        sys.exit(1)
+    # 统计接口的ETag随之失效
+    DataVersion(shm_path_for_database('gift_bihuoai_data_version', args.db)).bump()
+    print("✓ 计数器已修正")
@@ -0,0 +1,44 @@
+# 全局数据版本号
+#
+# 领取、导入、删除、重置等写操作提交后调用 bump()，版本号加1；
+# 只读接口把版本号和请求参数组合成ETag，版本号没变就直接返回304，
+# 不查询SQLite也不序列化JSON。
+#
+# 版本号保存在共享内存中，所有worker看到的是同一个值。共享内存文件新建时
+# （例如服务器重启后）生成新的随机纪元，ETag中带上纪元，计数从0重新开始也不会与旧ETag冲突。
+
+import os
+import struct
+
+from shared_memory import SharedMemoryFile
+
+LAYOUT = struct.Struct('<QQ')  # 纪元 | 版本号
+
+
+class DataVersion:
+    """跨进程共享的数据版本号"""
+
+    def __init__(self, path):
+        self.path = path
+        self._shm = None
+
+    def _memory(self):
+        if self._shm is None:
+            shm = SharedMemoryFile(self.path, LAYOUT.size)
+            with shm.locked() as mm:
+                epoch, _ = LAYOUT.unpack_from(mm, 0)
+                if epoch == 0:
+                    LAYOUT.pack_into(mm, 0, int.from_bytes(os.urandom(8), 'little') or 1, 0)
+            self._shm = shm
+        return self._shm
+
+    def current(self):
+        """当前版本，格式为 '纪元-版本号'（不加锁读取）"""
+        epoch, counter = LAYOUT.unpack_from(self._memory().view(), 0)
+        return f'{epoch:x}-{counter}'
+
+    def bump(self):
+        """数据已变化（在写事务提交之后调用）"""
+        with self._memory().locked() as mm:
+            epoch, counter = LAYOUT.unpack_from(mm, 0)
+            LAYOUT.pack_into(mm, 0, epoch, counter + 1)
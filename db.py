@@ -0,0 +1,170 @@
+# 数据库连接管理
+#
+# 每个线程持有一个长连接，首次创建时设置一次PRAGMA，之后在请求之间复用：
+#   journal_mode=WAL     读写互不阻塞，后台导出不再挡住领取
+#   synchronous=NORMAL   WAL模式下仍然安全，提交时不必每次fsync
+#   busy_timeout         写锁冲突时等待而不是立即报 database is locked
+#   mmap_size            读操作直接走内存映射
+#   foreign_keys=ON
+# 业务代码里的 conn.close() 只是归还连接（回滚未提交的事务），不会真正关闭。
+
+import os
+import random
+import sqlite3
+import threading
+import time
+import weakref
+
+DB_MAX_RETRIES = int(os.environ.get('DB_MAX_RETRIES', 5))  # 数据库繁忙时的最大重试次数
+DB_BUSY_TIMEOUT = int(os.environ.get('DB_BUSY_TIMEOUT', 5000))  # 等待写锁的最长时间（毫秒）
+DB_MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE', 64 * 1024 * 1024))  # 内存映射大小（字节）
+DB_CACHED_STATEMENTS = int(os.environ.get('DB_CACHED_STATEMENTS', 256))  # 每个连接缓存的预编译语句数
+DB_SYNCHRONOUS = os.environ.get('DB_SYNCHRONOUS', 'NORMAL')
+
+_counter_lock = threading.Lock()
+_counters = {'busy_retries': 0, 'busy_failures': 0}
+
+
+def _count(name, value=1):
+    with _counter_lock:
+        _counters[name] += value
+
+
+class PooledConnection(sqlite3.Connection):
+    """线程独占的长连接，close() 只归还不关闭"""
+
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+
+    def really_close(self):
+        super().close()
+
+
+class ConnectionManager:
+    """每线程一个长连接的连接池"""
+
+    def __init__(self, busy_timeout=None, mmap_size=None, cached_statements=None, synchronous=None):
+        self.busy_timeout = DB_BUSY_TIMEOUT if busy_timeout is None else busy_timeout
+        self.mmap_size = DB_MMAP_SIZE if mmap_size is None else mmap_size
+        self.cached_statements = DB_CACHED_STATEMENTS if cached_statements is None else cached_statements
+        self.synchronous = synchronous or DB_SYNCHRONOUS
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = weakref.WeakSet()
+        self._stats = {'opened': 0, 'checkouts': 0, 'reused': 0}
+
+    def connection(self, path):
+        """获取当前线程到指定数据库的连接"""
+        conns = getattr(self._local, 'conns', None)
+        if conns is None or getattr(self._local, 'pid', None) != os.getpid():
+            # 首次使用，或fork之后不能沿用父进程的连接
+            conns = self._local.conns = {}
+            self._local.pid = os.getpid()
+
+        conn = conns.get(path)
+        with self._lock:
+            self._stats['checkouts'] += 1
+            if conn is not None:
+                self._stats['reused'] += 1
+        if conn is not None:
+            return conn
+
+        conn = conns[path] = self._open(path)
+        return conn
+
+    def _open(self, path):
+        conn = sqlite3.connect(
+            path,
+            timeout=self.busy_timeout / 1000.0,
+            cached_statements=self.cached_statements,
+            factory=PooledConnection
+        )
+        conn.execute("PRAGMA encoding='UTF-8';")
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(f'PRAGMA synchronous={self.synchronous}')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout)}')
+        conn.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+        conn.execute('PRAGMA foreign_keys=ON')
+        conn.row_factory = sqlite3.Row
+
+        with self._lock:
+            self._stats['opened'] += 1
+            self._connections.add(conn)
+        return conn
+
+    def close_all(self):
+        """关闭当前线程的连接（测试或切换数据库时使用）"""
+        conns = getattr(self._local, 'conns', None) or {}
+        for conn in conns.values():
+            conn.really_close()
+        self._local.conns = {}
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['open_connections'] = len(self._connections)
+        with _counter_lock:
+            stats.update(_counters)
+        stats['settings'] = {
+            'busy_timeout_ms': self.busy_timeout,
+            'mmap_size': self.mmap_size,
+            'cached_statements': self.cached_statements,
+            'synchronous': self.synchronous,
+        }
+        return stats
+
+
+pool = ConnectionManager()
+
+
+def is_busy_error(error):
+    """是否为数据库繁忙/锁冲突错误"""
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+
+class Rollback(Exception):
+    """事务函数抛出此异常放弃自己的全部修改，result 作为事务函数的返回值"""
+
+    def __init__(self, result=None):
+        super().__init__(result)
+        self.result = result
+
+
+def run_in_transaction(conn, func, max_retries=None):
+    """
+    在 BEGIN IMMEDIATE 写事务中执行 func(conn) 并提交，返回 func 的返回值。
+
+    事务开始时即获取写锁，事务内的读和写看到的是同一份数据；
+    遇到 database is locked 时整体回滚并退避重试，其他异常回滚后抛出。
+    func 可以抛出 Rollback(返回值) 放弃本次修改（也可以自行 rollback，此时提交为空操作）。
+    """
+    max_retries = DB_MAX_RETRIES if max_retries is None else max_retries
+    attempt = 0
+    while True:
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            result = func(conn)
+            conn.commit()
+            return result
+        except Rollback as e:
+            conn.rollback()
+            return e.result
+        except sqlite3.OperationalError as e:
+            if conn.in_transaction:
+                conn.rollback()
+            if not is_busy_error(e):
+                raise
+            if attempt >= max_retries:
+                _count('busy_failures')
+                raise
+            _count('busy_retries')
+            attempt += 1
+            # 指数退避并加入随机抖动，避免重试时再次撞车
+            time.sleep(random.uniform(0, 0.01 * (2 ** attempt)))
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
@@ -0,0 +1,125 @@
+# 管理后台数据导出
+#
+# 导出不再一次性 fetchall() 整张表再拼成完整的响应体，而是边读边写：
+#   按游标（keyset）分批读取，每批一个独立的短查询，WHERE 条件接着上一批的最后一行，
+#   走索引直接定位，不使用 OFFSET，越往后翻也不会变慢；
+#   每读完一批立即生成对应的 CSV 行 / JSON 片段发给客户端。
+# 内存占用只与批大小有关，第一批数据读出后客户端就能收到第一个字节。
+# 每批之间不持有读事务，长时间的导出不会阻止WAL检查点。
+
+import csv
+import io
+import json
+import os
+
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 1000))  # 导出时每批读取的行数
+
+# 兑换码按id正序
+CODES_SQL = '''
+    SELECT c.id, c.code, c.is_used, c.claimed_at, u.email, u.device_fingerprint, u.ip_address
+    FROM codes c
+    LEFT JOIN users u ON c.claimed_by_fingerprint = u.device_fingerprint
+    WHERE c.id > ?
+    ORDER BY c.id
+    LIMIT ?
+'''
+
+# 调研数据按提交时间倒序，提交时间相同的按id倒序，(created_at, id) 作为游标
+SURVEYS_SQL = '''
+    SELECT s.id, s.device_fingerprint, s.email, s.name, s.country, s.has_used_digital_human, s.problems,
+           s.profession, s.custom_profession, s.created_at, u.ip_address, c.code
+    FROM surveys s
+    LEFT JOIN users u ON s.device_fingerprint = u.device_fingerprint
+    LEFT JOIN codes c ON s.device_fingerprint = c.claimed_by_fingerprint
+    WHERE (s.created_at, s.id) < (?, ?)
+    ORDER BY s.created_at DESC, s.id DESC
+    LIMIT ?
+'''
+
+SURVEY_CSV_HEADERS = ['设备指纹', '邮箱', '昵称', '国家/地区', '是否使用过数字人', '希望解决的问题',
+                      '职业', '自定义职业', '提交时间', 'IP地址', '兑换码']
+
+# 比任何提交时间都大的初始游标
+_SURVEYS_START = ('9999-12-31 23:59:59', 2 ** 63 - 1)
+
+
+def _iter_chunks(connect, sql, cursor, next_cursor, chunk_size):
+    """按游标分批读取，每次产出一批行"""
+    chunk_size = chunk_size or EXPORT_CHUNK_SIZE
+    while True:
+        conn = connect()
+        try:
+            rows = conn.execute(sql, tuple(cursor) + (chunk_size,)).fetchall()
+        finally:
+            conn.close()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < chunk_size:
+            return
+        cursor = next_cursor(rows[-1])
+
+
+def iter_codes(connect, chunk_size=None):
+    """逐批读取兑换码使用情况"""
+    for rows in _iter_chunks(connect, CODES_SQL, (0,), lambda row: (row['id'],), chunk_size):
+        yield [_without_id(row) for row in rows]
+
+
+def iter_surveys(connect, chunk_size=None):
+    """逐批读取调研数据（最新的在前）"""
+    next_cursor = lambda row: (row['created_at'], row['id'])
+    for rows in _iter_chunks(connect, SURVEYS_SQL, _SURVEYS_START, next_cursor, chunk_size):
+        yield [_without_id(row) for row in rows]
+
+
+def _without_id(row):
+    record = dict(row)
+    del record['id']
+    return record
+
+
+def json_array_stream(chunks):
+    """生成JSON数组，每个元素一行"""
+    yield '['
+    first = True
+    for records in chunks:
+        parts = []
+        for record in records:
+            parts.append(('\n' if first else ',\n') + json.dumps(record, ensure_ascii=False))
+            first = False
+        yield ''.join(parts)
+    yield '\n]\n' if not first else ']\n'
+
+
+def ndjson_stream(chunks):
+    """生成NDJSON，每条记录一行"""
+    for records in chunks:
+        yield ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+
+
+def survey_csv_stream(chunks):
+    """生成调研数据CSV（带UTF-8 BOM，确保Excel正确显示中文）"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(SURVEY_CSV_HEADERS)
+    yield '\ufeff' + buffer.getvalue()
+
+    for records in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        for survey in records:
+            writer.writerow([
+                survey['device_fingerprint'] or '',
+                survey['email'] or '未知用户',
+                survey['name'] or '',
+                survey['country'] or '',
+                survey['has_used_digital_human'] or '',
+                survey['problems'] or '',
+                survey['profession'] or '',
+                survey['custom_profession'] or '',
+                survey['created_at'] or '',
+                survey['ip_address'] or '',
+                survey['code'] or ''
+            ])
+        yield buffer.getvalue()
@@ -0,0 +1,219 @@
+# IP -> 语言 检测结果缓存
+#
+# 两级缓存：
+#   L1  进程内 OrderedDict，命中只需一次字典查找
+#   L2  独立的SQLite小库，所有uWSGI进程共享，进程重启后依然有效
+# 两级都带TTL和LRU淘汰；查询失败的结果也会以较短的TTL缓存，避免反复打到在线接口
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+GEO_CACHE_PATH = os.environ.get(
+    'GEO_CACHE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'geo_cache.db')
+)
+GEO_CACHE_TTL = int(os.environ.get('GEO_CACHE_TTL', 86400))  # 成功结果缓存时间（秒）
+GEO_CACHE_FAILURE_TTL = int(os.environ.get('GEO_CACHE_FAILURE_TTL', 60))  # 失败结果缓存时间（秒）
+GEO_CACHE_MAX_ENTRIES = int(os.environ.get('GEO_CACHE_MAX_ENTRIES', 100000))  # 共享缓存最大条数
+GEO_CACHE_LOCAL_ENTRIES = int(os.environ.get('GEO_CACHE_LOCAL_ENTRIES', 4096))  # 进程内缓存最大条数
+
+# 命中时刷新LRU时间戳的最小间隔，避免每次命中都写库
+TOUCH_INTERVAL = 60
+# 每写入多少次检查一次容量
+EVICT_CHECK_EVERY = 64
+
+
+class IPLanguageCache:
+    """跨进程共享的 IP -> 语言 缓存（TTL + LRU）"""
+
+    def __init__(self, path=None, ttl=None, failure_ttl=None, max_entries=None, local_entries=None):
+        self.path = path or GEO_CACHE_PATH
+        self.ttl = GEO_CACHE_TTL if ttl is None else ttl
+        self.failure_ttl = GEO_CACHE_FAILURE_TTL if failure_ttl is None else failure_ttl
+        self.max_entries = GEO_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.local_entries = GEO_CACHE_LOCAL_ENTRIES if local_entries is None else local_entries
+
+        self._local = OrderedDict()  # ip -> (language, is_failure, expires_at)
+        self._lock = threading.Lock()
+        self._conns = threading.local()
+        self._writes = 0
+        self._pending = {'hits': 0, 'misses': 0, 'evictions': 0}  # 尚未写入共享统计表的计数
+        self._counters = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'evictions': 0, 'errors': 0}
+
+    def _connect(self):
+        """获取当前线程的缓存库连接"""
+        conn = getattr(self._conns, 'conn', None)
+        if conn is not None and getattr(self._conns, 'pid', None) == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(self.path, timeout=0.2)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=OFF')  # 缓存数据丢失无影响
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS ip_language_cache (
+                ip TEXT PRIMARY KEY,
+                language TEXT NOT NULL,
+                is_failure INTEGER NOT NULL DEFAULT 0,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_last_access ON ip_language_cache(last_access)')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS cache_stats (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        conn.commit()
+        self._conns.conn = conn
+        self._conns.pid = os.getpid()
+        return conn
+
+    def _count(self, name, shared_name=None):
+        with self._lock:
+            self._counters[name] += 1
+            if shared_name:
+                self._pending[shared_name] += 1
+
+    def _remember(self, ip, language, is_failure, expires_at):
+        """写入进程内缓存"""
+        with self._lock:
+            self._local[ip] = (language, is_failure, expires_at)
+            self._local.move_to_end(ip)
+            while len(self._local) > self.local_entries:
+                self._local.popitem(last=False)
+
+    def get(self, ip):
+        """查询缓存，未命中或已过期返回None"""
+        now = time.time()
+
+        with self._lock:
+            entry = self._local.get(ip)
+            if entry is not None:
+                if entry[2] > now:
+                    self._local.move_to_end(ip)
+                    self._counters['local_hits'] += 1
+                    self._pending['hits'] += 1
+                    return entry[0]
+                del self._local[ip]
+
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                'SELECT language, is_failure, expires_at, last_access FROM ip_language_cache WHERE ip = ?',
+                (ip,)
+            ).fetchone()
+
+            if row is None or row[2] <= now:
+                self._count('misses', 'misses')
+                return None
+
+            if now - row[3] > TOUCH_INTERVAL:
+                conn.execute('UPDATE ip_language_cache SET last_access = ? WHERE ip = ?', (now, ip))
+                self._flush_stats(conn)
+                conn.commit()
+        except sqlite3.Error:
+            self._count('errors')
+            self._count('misses', 'misses')
+            return None
+
+        self._remember(ip, row[0], bool(row[1]), row[2])
+        self._count('shared_hits', 'hits')
+        return row[0]
+
+    def set(self, ip, language, is_failure=False):
+        """写入缓存，失败结果使用较短的TTL"""
+        now = time.time()
+        expires_at = now + (self.failure_ttl if is_failure else self.ttl)
+        self._remember(ip, language, is_failure, expires_at)
+
+        try:
+            conn = self._connect()
+            conn.execute('''
+                INSERT OR REPLACE INTO ip_language_cache (ip, language, is_failure, expires_at, last_access)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (ip, language, 1 if is_failure else 0, expires_at, now))
+
+            with self._lock:
+                self._writes += 1
+                check = self._writes % EVICT_CHECK_EVERY == 0
+            if check:
+                self._evict(conn, now)
+
+            self._flush_stats(conn)
+            conn.commit()
+        except sqlite3.Error:
+            self._count('errors')
+
+    def _evict(self, conn, now):
+        """清理过期条目，并按LRU淘汰超出容量的条目"""
+        conn.execute('DELETE FROM ip_language_cache WHERE expires_at <= ?', (now,))
+
+        total = conn.execute('SELECT COUNT(*) FROM ip_language_cache').fetchone()[0]
+        overflow = total - self.max_entries
+        if overflow > 0:
+            conn.execute('''
+                DELETE FROM ip_language_cache WHERE ip IN (
+                    SELECT ip FROM ip_language_cache ORDER BY last_access LIMIT ?
+                )
+            ''', (overflow,))
+            with self._lock:
+                self._counters['evictions'] += overflow
+                self._pending['evictions'] += overflow
+
+    def _flush_stats(self, conn):
+        """把本进程累计的计数合并到共享统计表（随写操作一起提交）"""
+        with self._lock:
+            pending = {k: v for k, v in self._pending.items() if v}
+            for k in pending:
+                self._pending[k] = 0
+
+        for name, value in pending.items():
+            conn.execute('INSERT OR IGNORE INTO cache_stats (name, value) VALUES (?, 0)', (name,))
+            conn.execute('UPDATE cache_stats SET value = value + ? WHERE name = ?', (value, name))
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._local.clear()
+        try:
+            conn = self._connect()
+            conn.execute('DELETE FROM ip_language_cache')
+            conn.execute('DELETE FROM cache_stats')
+            conn.commit()
+        except sqlite3.Error:
+            self._count('errors')
+
+    def stats(self):
+        """缓存统计：本进程计数 + 所有进程的累计计数"""
+        with self._lock:
+            process = dict(self._counters)
+            process['local_entries'] = len(self._local)
+            pending = dict(self._pending)
+
+        shared = dict(pending)
+        entries = None
+        try:
+            conn = self._connect()
+            for name, value in conn.execute('SELECT name, value FROM cache_stats'):
+                shared[name] = shared.get(name, 0) + value
+            entries = conn.execute('SELECT COUNT(*) FROM ip_language_cache').fetchone()[0]
+        except sqlite3.Error:
+            pass
+
+        lookups = shared.get('hits', 0) + shared.get('misses', 0)
+        return {
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'failure_ttl': self.failure_ttl,
+            'hits': shared.get('hits', 0),
+            'misses': shared.get('misses', 0),
+            'evictions': shared.get('evictions', 0),
+            'hit_rate': round(shared.get('hits', 0) / lookups, 4) if lookups else None,
+            'process': process,
+        }
@@ -0,0 +1,202 @@
+# 在线IP地理位置查询客户端
+#
+# - 连接池：复用keep-alive连接，不再每次请求都重新建立TCP连接
+# - 延迟预算：单次查询超过预算直接放弃，不会让请求线程卡满3秒
+# - 熔断器：连续失败或慢调用达到阈值后直接返回None（调用方使用默认语言），
+#           冷却时间过后放行一次试探请求，成功则恢复
+# - 请求合并：并发查询同一IP时只发出一次请求，其余线程等待共享结果
+
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+GEO_API_URL = os.environ.get('GEO_API_URL', 'http://ip-api.com/json/{ip}?fields=countryCode,status,message')
+GEO_API_BUDGET = float(os.environ.get('GEO_API_BUDGET', 1.0))  # 单次查询延迟预算（秒）
+GEO_API_POOL_SIZE = int(os.environ.get('GEO_API_POOL_SIZE', 8))  # 连接池大小
+GEO_BREAKER_FAILURES = int(os.environ.get('GEO_BREAKER_FAILURES', 5))  # 连续失败多少次后熔断
+GEO_BREAKER_SLOW_CALL = float(os.environ.get('GEO_BREAKER_SLOW_CALL', 0.8))  # 超过该耗时视为慢调用（秒）
+GEO_BREAKER_RESET = float(os.environ.get('GEO_BREAKER_RESET', 30))  # 熔断后多久放行试探请求（秒）
+
+
+class CircuitBreaker:
+    """熔断器（closed -> open -> half_open -> closed）"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=None, slow_call_threshold=None, reset_timeout=None):
+        self.failure_threshold = GEO_BREAKER_FAILURES if failure_threshold is None else failure_threshold
+        self.slow_call_threshold = GEO_BREAKER_SLOW_CALL if slow_call_threshold is None else slow_call_threshold
+        self.reset_timeout = GEO_BREAKER_RESET if reset_timeout is None else reset_timeout
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.trips = 0
+        self.rejected = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def _current_state(self, now):
+        if self._state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def allow(self):
+        """是否放行本次调用"""
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                # 半开状态只放行一个试探请求
+                self._trial_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, ok, elapsed):
+        """记录调用结果，慢调用按失败处理"""
+        failed = not ok or elapsed >= self.slow_call_threshold
+        with self._lock:
+            if not failed:
+                self._state = self.CLOSED
+                self._failures = 0
+                self._trial_in_flight = False
+                return
+
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.trips += 1
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self._current_state(time.monotonic()),
+                'consecutive_failures': self._failures,
+                'trips': self.trips,
+                'rejected': self.rejected,
+            }
+
+
+class SingleFlight:
+    """合并同一key的并发调用"""
+
+    class _Call:
+        def __init__(self):
+            self.event = threading.Event()
+            self.result = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """执行fn，返回 (结果, 是否复用了其他线程的结果)"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                leader = False
+            else:
+                call = self._calls[key] = self._Call()
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            return call.result, True
+
+        try:
+            call.result = fn()
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result, False
+
+
+class GeoProviderClient:
+    """在线IP地理位置查询客户端"""
+
+    def __init__(self, url=None, budget=None, pool_size=None, breaker=None):
+        self.url = url or GEO_API_URL
+        self.budget = GEO_API_BUDGET if budget is None else budget
+        self.breaker = breaker or CircuitBreaker()
+        self.flight = SingleFlight()
+
+        pool_size = GEO_API_POOL_SIZE if pool_size is None else pool_size
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._lock = threading.Lock()
+        self._counters = {
+            'requests': 0, 'successes': 0, 'failures': 0, 'timeouts': 0,
+            'coalesced': 0, 'short_circuited': 0,
+        }
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def lookup_country(self, ip_address):
+        """查询IP所属国家码；失败、超时或熔断时返回None"""
+        result, shared = self.flight.do(ip_address, lambda: self._fetch(ip_address))
+        if shared:
+            self._count('coalesced')
+        return result
+
+    def _fetch(self, ip_address):
+        if not self.breaker.allow():
+            self._count('short_circuited')
+            return None
+
+        self._count('requests')
+        start = time.monotonic()
+        ok = False
+        country = None
+        try:
+            response = self.session.get(self.url.format(ip=ip_address), timeout=(self.budget, self.budget))
+            response.raise_for_status()
+            data = response.json()
+            ok = True
+            if data.get('status') == 'success':
+                country = (data.get('countryCode') or '').upper() or None
+        except requests.Timeout:
+            self._count('timeouts')
+        except (requests.RequestException, ValueError):
+            pass
+
+        elapsed = time.monotonic() - start
+        self.breaker.record(ok, elapsed)
+        with self._lock:
+            self._counters['successes' if ok else 'failures'] += 1
+            self._latency_total += elapsed
+            self._latency_max = max(self._latency_max, elapsed)
+        return country
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            calls = stats['successes'] + stats['failures']
+            stats['avg_latency_ms'] = round(self._latency_total / calls * 1000, 2) if calls else None
+            stats['max_latency_ms'] = round(self._latency_max * 1000, 2)
+        stats['budget'] = self.budget
+        stats['breaker'] = self.breaker.stats()
+        return stats
@@ -0,0 +1,70 @@
+# 只读接口的条件请求（ETag / If-None-Match）
+#
+# ETag由 接口名 + 数据版本 + 路由参数 + 查询参数 计算得到。客户端带着上次的ETag请求时，
+# 只要版本没变就直接返回304，视图函数不会执行。
+# 版本必须在查询数据之前读取：查询期间如果有写入，ETag只会比数据旧，下次请求会重新获取，
+# 不会出现新ETag对应旧数据的情况。
+
+import hashlib
+import threading
+from functools import wraps
+
+from flask import current_app, make_response, request
+
+
+class ConditionalGet:
+    """为视图函数加上ETag，并统计304命中率"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _count(self, scope, not_modified):
+        with self._lock:
+            stats = self._stats.setdefault(scope, {'requests': 0, 'not_modified': 0})
+            stats['requests'] += 1
+            if not_modified:
+                stats['not_modified'] += 1
+
+    @staticmethod
+    def make_etag(scope, version, view_args, query_args):
+        parts = [scope, str(version)]
+        parts.extend(f'{key}={view_args[key]}' for key in sorted(view_args))
+        parts.extend(f'{key}={value}' for key, value in sorted(query_args.items(multi=True)))
+        return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+
+    def __call__(self, scope, version, headers=None):
+        """
+        装饰器：version(**view_args) 返回当前版本；
+        headers 是304响应也需要带上的响应头（例如CORS）
+        """
+        def decorator(f):
+            @wraps(f)
+            def wrapped(*args, **kwargs):
+                if request.method not in ('GET', 'HEAD'):
+                    return f(*args, **kwargs)
+
+                etag = self.make_etag(scope, version(**kwargs), kwargs, request.args)
+                if request.if_none_match.contains(etag):
+                    self._count(scope, True)
+                    response = current_app.response_class(status=304)
+                    response.set_etag(etag)
+                    response.headers.update(headers or {})
+                    return response
+
+                self._count(scope, False)
+                response = make_response(f(*args, **kwargs))
+                if response.status_code == 200:
+                    response.set_etag(etag)
+                    # 允许缓存，但每次使用前都要带ETag验证
+                    response.headers['Cache-Control'] = 'no-cache'
+                return response
+            return wrapped
+        return decorator
+
+    def stats(self):
+        with self._lock:
+            stats = {scope: dict(values) for scope, values in self._stats.items()}
+        for values in stats.values():
+            values['hit_rate'] = round(values['not_modified'] / values['requests'], 4) if values['requests'] else 0.0
+        return stats
@@ -12,7 +12,10 @@ import sys
 project_path = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, project_path)
 
-from app import init_database
+import sqlite3
+
+from app import DATABASE_PATH, init_database
+from migrations import current_version
 
 if __name__ == '__main__':
     try:
@@ -22,9 +25,15 @@ if __name__ == '__main__':
         print("✓ 创建了以下表：")
         print("  - codes（兑换码表）")
         print("  - users（用户表）")
+        print("  - surveys（调研表）")
+        print("  - ip_limits（IP限制表）")
+
+        conn = sqlite3.connect(DATABASE_PATH)
+        print(f"✓ 数据库结构版本：{current_version(conn)}")
+        conn.close()
         
         # 检查数据库文件是否创建
-        db_file = 'gift_codes.db'
+        db_file = DATABASE_PATH
         if os.path.exists(db_file):
             size = os.path.getsize(db_file)
             print(f"✓ 数据库文件已创建：{db_file} (大小: {size} bytes)")
@@ -2,93 +2,392 @@
 
 import json
 import os
+import bisect
+import ipaddress
+import marshal
+import mmap
+import re
+import struct
+import threading
+import time
+
+from geo_cache import IPLanguageCache
+from geo_provider import GeoProviderClient
+from translation_bundles import TRANSLATIONS_DIR, TRANSLATION_CHECK_INTERVAL
+
+# 只有中国大陆、香港、澳门、台湾显示中文
+CHINESE_COUNTRIES = ['CN', 'HK', 'MO', 'TW']  # 移除新加坡
+
+# 离线IP库默认位置（由 build_geoip.py 生成）
+GEOIP_DB_PATH = os.environ.get(
+    'GEOIP_DB_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'ip_country.bin')
+)
+
+# 离线IP库二进制格式：
+#   文件头  magic(4) | version(u16) | reserved(u16) | IPv4条数(u32) | IPv6条数(u32)
+#   IPv4段  start(4字节) | end(4字节) | 国家码(2字节ASCII)，按start升序
+#   IPv6段  start(16字节) | end(16字节) | 国家码(2字节ASCII)，按start升序
+# 地址均为大端字节串，字节序比较即数值比较，可直接在mmap上二分查找
+GEOIP_MAGIC = b'GIPX'
+GEOIP_VERSION = 1
+GEOIP_HEADER = struct.Struct('>4sHHII')
+
+# 翻译的最终回退语言：zh-TW -> zh -> 默认语言
+TRANSLATION_DEFAULT_LANGUAGE = os.environ.get('TRANSLATION_DEFAULT_LANGUAGE', 'zh')  # 缺少翻译时回退到的语言
+
+# 语言代码（对应 translations/<语言>.json），如 zh、en、zh-TW
+LANGUAGE_CODE = re.compile(r'^[A-Za-z]{2,3}(-[A-Za-z0-9]{2,8})*$')
+
+# 展开后的翻译保存在 translations/<语言>.marshal，源文件修改时间和大小一致时直接读取
+COMPILED_SUFFIX = '.marshal'
+
+
+def country_to_language(country_code):
+    """根据国家码判断语言"""
+    if country_code and country_code.upper() in CHINESE_COUNTRIES:
+        return 'zh'
+    # 其他国家默认英文
+    return 'en'
+
+
+class _RangeStarts:
+    """mmap上某一段记录的起始地址视图（供bisect使用）"""
+
+    def __init__(self, buf, offset, count, width):
+        self.buf = buf
+        self.offset = offset
+        self.count = count
+        self.width = width
+        self.record_size = width * 2 + 2
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        pos = self.offset + i * self.record_size
+        return self.buf[pos:pos + self.width]
+
+    def record(self, i):
+        """返回第i条记录的 (end, 国家码)"""
+        pos = self.offset + i * self.record_size + self.width
+        end = self.buf[pos:pos + self.width]
+        country = self.buf[pos + self.width:pos + self.width + 2]
+        return end, country
+
+
+class GeoIPIndex:
+    """离线IP段 -> 国家码索引（内存映射，多个worker共享同一份页缓存）"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, _, v4_count, v6_count = GEOIP_HEADER.unpack_from(self._mm, 0)
+        if magic != GEOIP_MAGIC or version != GEOIP_VERSION:
+            self._mm.close()
+            raise ValueError(f'无效的IP库文件: {path}')
+
+        expected = GEOIP_HEADER.size + v4_count * 10 + v6_count * 34
+        if len(self._mm) != expected:
+            self._mm.close()
+            raise ValueError(f'IP库文件长度不正确: {path}')
+
+        self.v4 = _RangeStarts(self._mm, GEOIP_HEADER.size, v4_count, 4)
+        self.v6 = _RangeStarts(self._mm, GEOIP_HEADER.size + v4_count * 10, v6_count, 16)
+
+    def lookup(self, ip_address):
+        """查询IP所属国家码，未命中返回None"""
+        try:
+            ip = ipaddress.ip_address(ip_address.strip())
+        except (ValueError, AttributeError):
+            return None
+
+        if ip.version == 6 and ip.ipv4_mapped:
+            ip = ip.ipv4_mapped
+
+        table = self.v4 if ip.version == 4 else self.v6
+        key = ip.packed
+        i = bisect.bisect_right(table, key) - 1
+        if i < 0:
+            return None
+
+        end, country = table.record(i)
+        if key > end:
+            return None
+        return country.decode('ascii')
+
+    def close(self):
+        self._mm.close()
+
+    def __len__(self):
+        return len(self.v4) + len(self.v6)
+
+
+def flatten_translations(data, prefix=''):
+    """把嵌套的翻译字典展开为 {'a.b.c': 值}（中间层级也保留，便于取出整组翻译）"""
+    index = {}
+    for key, value in data.items():
+        path = f'{prefix}{key}'
+        index[path] = value
+        if isinstance(value, dict):
+            index.update(flatten_translations(value, f'{path}.'))
+    return index
+
+
+def fallback_chain(language, default=None):
+    """语言的回退顺序，如 zh-TW -> zh -> 默认语言"""
+    default = default or TRANSLATION_DEFAULT_LANGUAGE
+    chain = []
+    parts = language.split('-')
+    while parts:
+        code = '-'.join(parts)
+        if code not in chain:
+            chain.append(code)
+        parts.pop()
+    if default not in chain:
+        chain.append(default)
+    return chain
+
+
+def load_compiled(json_path):
+    """读取语言文件展开后的翻译（优先读取编译好的文件，过期时重新编译），返回 (修改时间, 索引)"""
+    stat = os.stat(json_path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    compiled_path = os.path.splitext(json_path)[0] + COMPILED_SUFFIX
+
+    try:
+        with open(compiled_path, 'rb') as f:
+            compiled_stamp, index = marshal.loads(f.read())
+        if tuple(compiled_stamp) == stamp:
+            return stat.st_mtime_ns, index
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    with open(json_path, 'r', encoding='utf-8') as f:
+        index = flatten_translations(json.load(f))
+
+    # 编译结果写入失败（如目录只读）不影响使用
+    tmp_path = f'{compiled_path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(marshal.dumps((stamp, index)))
+        os.replace(tmp_path, compiled_path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+    return stat.st_mtime_ns, index
+
 
 class LanguageSupport:
-    def __init__(self):
-        self.translations = {}
-        self.load_translations()
+    def __init__(self, translations_dir=None, check_interval=None):
+        self.translations_dir = translations_dir or TRANSLATIONS_DIR
+        # 检查翻译文件是否修改的间隔（秒），小于0时不自动检查
+        self.check_interval = TRANSLATION_CHECK_INTERVAL if check_interval is None else check_interval
+        self.index = {}     # 每种语言展开后的翻译，首次使用时加载
+        self.mtimes = {}
+        self._resolved = {}  # 按回退顺序合并后的翻译（没有翻译文件的语言指向回退语言的结果）
+        self._available = None  # 有翻译文件的语言
+        self._generation = 0  # 翻译重新加载的次数
+        self._checked = time.monotonic()
+        self._lock = threading.Lock()
+        self.geoip = None
+        self._geoip_loaded = False
+        self.cache = IPLanguageCache()
+        self.provider = GeoProviderClient()
+
+    def _translation_file(self, language):
+        return os.path.join(self.translations_dir, f'{language}.json')
+
+    def _load_language(self, language):
+        # 调用方持有 self._lock
+        if language in self.index:
+            return self.index[language]
+        path = self._translation_file(language)
+        if not os.path.exists(path):
+            return None
+        self.mtimes[language], self.index[language] = load_compiled(path)
+        return self.index[language]
 
     def load_translations(self):
-        """加载翻译文件"""
-        translations_dir = os.path.join(os.path.dirname(__file__), 'translations')
+        """清空已加载的翻译，之后按需重新加载"""
+        with self._lock:
+            self.index = {}
+            self.mtimes = {}
+            self._resolved = {}
+            self._available = None
+            self._generation += 1
+
+    def available_languages(self):
+        """translations 目录中的全部语言"""
+        return sorted(
+            name[:-5] for name in os.listdir(self.translations_dir)
+            if name.endswith('.json') and LANGUAGE_CODE.match(name[:-5])
+        )
 
-        # 加载中文
-        zh_file = os.path.join(translations_dir, 'zh.json')
-        if os.path.exists(zh_file):
-            with open(zh_file, 'r', encoding='utf-8') as f:
-                self.translations['zh'] = json.load(f)
+    def _available_set(self):
+        # 调用方持有 self._lock
+        if self._available is None:
+            self._available = set(self.available_languages())
+        return self._available
 
-        # 加载英文
-        en_file = os.path.join(translations_dir, 'en.json')
-        if os.path.exists(en_file):
-            with open(en_file, 'r', encoding='utf-8') as f:
-                self.translations['en'] = json.load(f)
+    def refresh(self):
+        """已加载的翻译文件修改（或增删了语言）后重新加载，返回是否有变化"""
+        self._checked = time.monotonic()
+        with self._lock:
+            changed = []
+            if self._available is not None:
+                available = set(self.available_languages())
+                if available != self._available:
+                    # 新增或删除了语言文件：别名需要重新指向
+                    changed.extend(sorted(available ^ self._available))
+                    self._available = available
+            for language, loaded_mtime in self.mtimes.items():
+                try:
+                    mtime = os.stat(self._translation_file(language)).st_mtime_ns
+                except OSError:
+                    mtime = None
+                if mtime != loaded_mtime:
+                    changed.append(language)
+            for language in changed:
+                self.index.pop(language, None)
+                self.mtimes.pop(language, None)
+            if changed:
+                self._resolved = {}
+                self._generation += 1
+        return bool(changed)
+
+    def _check_files(self):
+        # 每隔 check_interval 秒检查一次翻译文件是否修改
+        if self.check_interval >= 0 and time.monotonic() - self._checked >= self.check_interval:
+            self.refresh()
+
+    def version(self):
+        """翻译的版本号：翻译文件修改并重新加载后改变（按语言缓存的页面据此重新渲染）"""
+        self._check_files()
+        return self._generation
+
+    def resolve(self, language):
+        """按回退顺序合并后的翻译索引（每种语言只合并一次）"""
+        self._check_files()
+
+        resolved = self._resolved.get(language)
+        if resolved is not None:
+            return resolved
+
+        if not language or not LANGUAGE_CODE.match(language):
+            language = TRANSLATION_DEFAULT_LANGUAGE
+            resolved = self._resolved.get(language)
+            if resolved is not None:
+                return resolved
+        with self._lock:
+            available = self._available_set()
+            chain = fallback_chain(language)
+            # 没有翻译文件的语言（如 de）与回退顺序中第一个有文件的语言结果相同
+            target = next((code for code in chain if code in available), chain[-1])
+            resolved = self._resolved.get(target)
+            if resolved is None:
+                indexes = [self._load_language(code) for code in fallback_chain(target)]
+                resolved = {}
+                for index in reversed(indexes):
+                    if index:
+                        resolved.update(index)
+                self._resolved[target] = resolved
+            # 作为别名缓存（共用同一个字典）；别名数不超过已有语言数，任意语言代码不会让缓存无限增长
+            if target != language and len(self._resolved) < 2 * len(available):
+                self._resolved[language] = resolved
+        return resolved
 
     def get_translation(self, key, lang='zh'):
-        """获取翻译"""
-        if lang not in self.translations:
-            lang = 'zh'
+        """获取翻译（按回退顺序合并后的索引中查找，不存在时返回键名）"""
+        return self.resolve(lang).get(key, key)
+
+    def load_geoip(self, path=None):
+        """加载离线IP库（文件不存在时返回None，退回在线查询）"""
+        path = path or GEOIP_DB_PATH
+        self._geoip_loaded = True
+        if self.geoip is not None:
+            self.geoip.close()
+            self.geoip = None
 
-        keys = key.split('.')
-        value = self.translations[lang]
+        if not os.path.exists(path):
+            return None
 
         try:
-            for k in keys:
-                value = value[k]
-            return value
-        except (KeyError, TypeError):
-            # 如果翻译不存在，返回键名
-            return key
+            self.geoip = GeoIPIndex(path)
+        except (OSError, ValueError) as e:
+            print(f"离线IP库加载失败: {str(e)}")
+            self.geoip = None
+        return self.geoip
+
+    def lookup_country_local(self, ip_address):
+        """使用离线IP库查询国家码"""
+        if not self._geoip_loaded:
+            self.load_geoip()
+        if self.geoip is None:
+            return None
+        return self.geoip.lookup(ip_address)
 
     def detect_language_from_ip(self, ip_address):
         """根据IP地址检测语言"""
         if not ip_address:
             return 'en'  # 改为默认英文
 
+        ip_address = ip_address.strip()
+        return (
+            self.detect_language_cached(ip_address)
+            or self.detect_language_local(ip_address)
+            or self.detect_language_remote(ip_address)
+        )
+
+    def detect_language_cached(self, ip_address):
+        """从跨进程共享的检测结果缓存中获取语言，未命中返回None"""
+        return self.cache.get(ip_address)
+
+    def detect_language_local(self, ip_address):
+        """使用离线IP库检测语言（无需网络），无法判断时返回None"""
+        country_code = self.lookup_country_local(ip_address)
+        if country_code:
+            detected = country_to_language(country_code)
+            self.cache.set(ip_address, detected)
+            return detected
+
+        # 内网、保留地址不可能查到国家，直接默认英文
         try:
-            import requests
-
-            # 使用免费的IP地理位置API
-            response = requests.get(f'http://ip-api.com/json/{ip_address}?fields=countryCode,status,message', timeout=3)
-            data = response.json()
-
-            if data.get('status') == 'success':
-                country_code = data.get('countryCode', '').upper()
-
-                # 根据国家码判断语言 - 只有中国大陆、香港、澳门、台湾显示中文
-                chinese_countries = ['CN', 'HK', 'MO', 'TW']  # 移除新加坡
-                english_countries = [
-                    'US', 'GB', 'CA', 'AU', 'NZ', 'IE', 'ZA', 'DE', 'FR', 'IT', 'ES',
-                    'NL', 'BE', 'AT', 'CH', 'SE', 'NO', 'DK', 'FI', 'JP', 'KR', 'IN',
-                    'BR', 'MX', 'AR', 'RU', 'TR', 'AE', 'SA', 'EG', 'ZA', 'NG', 'SG',  # 新加坡放在英文列表
-                    'MY', 'TH', 'ID', 'VN', 'PH', 'VN', 'PH', 'VN', 'PH', 'VN', 'PH',
-                    'PL', 'CZ', 'HU', 'GR', 'PT', 'RO', 'BG', 'HR', 'SI', 'SK',
-                    'CL', 'CO', 'PE', 'UY', 'PY', 'BO', 'EC', 'VE'
-                ]
-
-                if country_code in chinese_countries:
-                    return 'zh'
-                elif country_code in english_countries:
-                    return 'en'
-                else:
-                    # 其他国家默认英文
-                    return 'en'
-            else:
-                # API失败时默认英文
+            if not ipaddress.ip_address(ip_address).is_global:
                 return 'en'
-        except Exception as e:
-            # 异常时默认英文
+        except ValueError:
             return 'en'
+        return None
+
+    def detect_language_remote(self, ip_address):
+        """调用在线接口检测语言，失败时返回默认英文"""
+        country_code = self.lookup_country_remote(ip_address)
+        if country_code is None:
+            # 查询失败也短暂缓存，避免对同一IP反复请求在线接口
+            self.cache.set(ip_address, 'en', is_failure=True)
+            return 'en'
+
+        detected = country_to_language(country_code)
+        self.cache.set(ip_address, detected)
+        return detected
+
+    def lookup_country_remote(self, ip_address):
+        """调用在线IP地理位置API查询国家码，失败、超时或熔断时返回None"""
+        return self.provider.lookup_country(ip_address)
 
 # 全局实例
 lang = LanguageSupport()
 
-def t(key, lang='zh'):
+def t(key, language='zh'):
     """翻译函数的简写"""
-    return lang.get_translation(key, lang)
+    return lang.get_translation(key, language)
 
 # 语言映射
 LANGUAGES = {
     'zh': '中文',
     'en': 'English'
-}
\ No newline at end of file
+}
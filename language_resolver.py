@@ -0,0 +1,173 @@
+# 分级语言识别流水线
+#
+# 按代价从低到高依次尝试，前一级命中即返回：
+#   session         用户显式选择过的语言
+#   accept_language 浏览器 Accept-Language 请求头
+#   policy          爬虫、HEAD请求、健康检查、非HTML请求直接使用默认语言，不做IP查询
+#   geo_cache       跨进程共享的IP检测结果缓存
+#   geo_local       离线IP库
+#   geo_remote      在线IP查询（带熔断）
+# 每一级单独统计调用次数、命中率和耗时
+
+import re
+import threading
+import time
+
+DEFAULT_LANGUAGE = 'en'
+
+# 已知爬虫、监控和命令行客户端
+BOT_USER_AGENT = re.compile(
+    r'bot|crawl|spider|slurp|facebookexternalhit|headless|preview|monitor|probe|'
+    r'healthcheck|uptime|pingdom|curl|wget|python-requests|go-http-client|okhttp|java/',
+    re.IGNORECASE
+)
+HEALTH_CHECK_PATHS = ('/health', '/healthz', '/ping', '/favicon.ico', '/robots.txt')
+
+
+def parse_accept_language(header, supported):
+    """解析 Accept-Language，返回权重最高的受支持语言，没有则返回None"""
+    if not header:
+        return None
+
+    best = None
+    best_q = 0.0
+    for part in header.split(','):
+        pieces = part.strip().split(';')
+        tag = pieces[0].strip().lower()
+        if not tag or tag == '*':
+            continue
+
+        q = 1.0
+        for param in pieces[1:]:
+            param = param.strip()
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+
+        primary = tag.split('-')[0]
+        # 同权重时保留先出现的语言
+        if primary in supported and q > best_q:
+            best = primary
+            best_q = q
+    return best
+
+
+class ResolverStage:
+    """流水线中的一级"""
+
+    def __init__(self, name, func):
+        self.name = name
+        self.func = func
+        self.calls = 0
+        self.hits = 0
+        self.total_time = 0.0
+
+    def stats(self):
+        return {
+            'calls': self.calls,
+            'hits': self.hits,
+            'hit_rate': round(self.hits / self.calls, 4) if self.calls else None,
+            'avg_us': round(self.total_time / self.calls * 1e6, 1) if self.calls else None,
+        }
+
+
+class LanguageResolver:
+    """分级语言识别"""
+
+    def __init__(self, support, supported=('zh', 'en'), default=DEFAULT_LANGUAGE):
+        self.support = support
+        self.supported = tuple(supported)
+        self.default = default
+        self._lock = threading.Lock()
+        self.skip_reasons = {}
+        self.stages = [
+            ResolverStage('session', self._from_session),
+            ResolverStage('accept_language', self._from_accept_language),
+            ResolverStage('policy', self._from_policy),
+            ResolverStage('geo_cache', lambda ctx: support.detect_language_cached(ctx.ip)),
+            ResolverStage('geo_local', lambda ctx: support.detect_language_local(ctx.ip)),
+            ResolverStage('geo_remote', lambda ctx: support.detect_language_remote(ctx.ip)),
+        ]
+
+    def resolve(self, request, session, ip_getter):
+        """识别语言，返回 (语言, 命中的阶段名)"""
+        ctx = _Context(request, session, ip_getter)
+
+        for stage in self.stages:
+            start = time.perf_counter()
+            result = stage.func(ctx)
+            elapsed = time.perf_counter() - start
+
+            hit = result in self.supported
+            with self._lock:
+                stage.calls += 1
+                stage.total_time += elapsed
+                if hit:
+                    stage.hits += 1
+            if hit:
+                return result, stage.name
+
+        return self.default, None
+
+    def _from_session(self, ctx):
+        return ctx.session.get('language')
+
+    def _from_accept_language(self, ctx):
+        return parse_accept_language(ctx.request.headers.get('Accept-Language'), self.supported)
+
+    def _from_policy(self, ctx):
+        """不值得做IP查询的请求直接使用默认语言"""
+        reason = self.skip_reason(ctx.request)
+        if reason is None:
+            if not ctx.ip:
+                reason = 'no_ip'
+            else:
+                return None
+
+        with self._lock:
+            self.skip_reasons[reason] = self.skip_reasons.get(reason, 0) + 1
+        return self.default
+
+    def skip_reason(self, request):
+        """判断请求是否应跳过IP查询，返回原因或None"""
+        if request.method not in ('GET', 'POST'):
+            return 'method'
+        if request.path in HEALTH_CHECK_PATHS:
+            return 'health_check'
+
+        user_agent = request.headers.get('User-Agent', '')
+        if not user_agent or BOT_USER_AGENT.search(user_agent):
+            return 'bot'
+
+        accept = request.headers.get('Accept', '')
+        if accept and 'text/html' not in accept and '*/*' not in accept:
+            return 'non_html'
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'stages': {stage.name: stage.stats() for stage in self.stages},
+                'skip_reasons': dict(self.skip_reasons),
+            }
+
+
+class _Context:
+    """单次识别的上下文，客户端IP只在需要时才获取"""
+
+    def __init__(self, request, session, ip_getter):
+        self.request = request
+        self.session = session
+        self._ip_getter = ip_getter
+        self._ip = None
+        self._ip_resolved = False
+
+    @property
+    def ip(self):
+        if not self._ip_resolved:
+            ip = self._ip_getter()
+            self._ip = ip.strip() if ip else ip
+            self._ip_resolved = True
+        return self._ip
@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+领取流程端到端压测
+
+多个进程（模拟 uWSGI worker，每个进程各自导入 wsgi:app 和 main.py）内多个线程，
+按真实用户的顺序访问 / -> /check_and_claim -> POST /submit_survey -> /result。
+合成用户分三类：
+    new        新用户：独立的设备指纹、邮箱和IP，应当领取成功（兑换码领完时为 sold_out）
+    repeat     重复领取：再次提交本进程之前成功领取的设备和邮箱，应当看到已有兑换码
+    offender   刷量IP：少数几个IP反复用新设备提交，超过 IP_HOURLY_LIMIT 后应被限流
+IP地理位置查询指向本地的假接口（GEO_API_URL），离线IP库和IP缓存使用临时文件，不访问外网。
+
+默认在临时目录中新建数据库并写入兑换码，不读取项目目录下的 .env（避免误用正式数据库）；
+其他配置（IP_HOURLY_LIMIT、CLAIM_GROUP_COMMIT 等）通过环境变量传入。
+也可以用 --url 压测已经部署的服务（此时不统计 SQLITE_BUSY 和假接口的调用次数）。
+合成用户使用公网地址段的IP（内网IP不会查询IP地理位置），没有 Accept-Language 的请求会调用假接口。
+
+结果以JSON输出：吞吐量、各路由和整个流程的 p50/p95/p99 延迟、
+run_in_transaction 中的 SQLITE_BUSY 重试/失败次数（事务之外的 busy 错误表现为 http_500，计入错误明细）、
+假接口收到的查询次数、按用户类型统计的结果分布和错误明细，便于在不同提交之间对比。
+
+用法：
+    python loadtest.py                                   4个进程 x 2个线程，共2000个用户
+    python loadtest.py --processes 8 --threads 4 --users 20000 -o result.json
+    CLAIM_GROUP_COMMIT=1 python loadtest.py
+    python loadtest.py --url http://127.0.0.1:1688 --codes 0
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+# 添加项目路径到系统路径
+project_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_path)
+
+USER_AGENT = 'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148'
+ACCEPT = 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8'
+ROUTES = ('/', '/check_and_claim', '/submit_survey', '/result')
+SCENARIOS = ('new', 'repeat', 'offender')
+
+# 领取失败时结果页和调研页上的提示，用于判断每次提交的结果（领取成功的结果页只显示兑换码）
+OUTCOME_MESSAGES = (
+    ('sold_out', '兑换码已经全部领完了'),
+    ('rate_limited', '请求过于频繁'),
+    ('daily_limited', '今日领取次数已达上限'),
+    ('submit_failed', '提交失败，请重试'),
+)
+CODE_PATTERN = re.compile(r'id="exchangeCode">\s*([^<\s]+)\s*<')
+
+# 各类用户预期的结果，其他结果计入 unexpected
+# （同一设备两次拿到不同的兑换码记为 code_mismatch）
+EXPECTED = {
+    'new': ('claimed', 'sold_out'),
+    'repeat': ('already_claimed', 'sold_out'),
+    'offender': ('claimed', 'sold_out', 'rate_limited', 'daily_limited'),
+}
+
+
+# ---------------------------------------------------------------- 假的IP地理位置接口
+
+class FakeGeoHandler(BaseHTTPRequestHandler):
+    """模拟 ip-api.com：IP最后一段为偶数返回CN，奇数返回US"""
+
+    calls = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with FakeGeoHandler.lock:
+            FakeGeoHandler.calls += 1
+        ip = urlparse(self.path).path.rstrip('/').rsplit('/', 1)[-1]
+        try:
+            last = int(ip.rsplit('.', 1)[-1])
+        except ValueError:
+            last = 1
+        body = json.dumps({'status': 'success', 'countryCode': 'CN' if last % 2 == 0 else 'US'}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_geo():
+    """在后台线程启动假接口，返回 (server, GEO_API_URL)"""
+    FakeGeoHandler.calls = 0
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeGeoHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/json/{{ip}}'
+
+
+# ---------------------------------------------------------------- 客户端
+
+class WSGIClient:
+    """进程内直接调用 wsgi:app（每个合成用户一个新的cookie）"""
+
+    def __init__(self, app):
+        self.app = app
+        self.client = app.test_client()
+
+    def reset(self):
+        self.client = self.app.test_client()
+
+    def request(self, method, path, headers, data=None):
+        response = self.client.open(path, method=method, headers=headers, data=data)
+        return response.status_code, response.get_data(as_text=True)
+
+
+class HTTPClient:
+    """通过HTTP压测已部署的服务"""
+
+    def __init__(self, base_url):
+        import requests
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+
+    def reset(self):
+        self.session.cookies.clear()
+
+    def request(self, method, path, headers, data=None):
+        response = self.session.request(method, self.base_url + path, headers=headers, data=data,
+                                        allow_redirects=False, timeout=30)
+        return response.status_code, response.text
+
+
+# ---------------------------------------------------------------- 合成用户
+
+def build_users(worker, count, seed, repeat_ratio, offender_ratio, offender_ips):
+    """生成本进程的合成用户列表 [(类型, 序号)]，重复领取的用户总是排在对应新用户之后"""
+    rng = random.Random(seed * 1000003 + worker)
+    users = []
+    new_users = 0
+    for _ in range(count):
+        roll = rng.random()
+        if roll < offender_ratio and offender_ips:
+            users.append(('offender', rng.randrange(offender_ips)))
+        elif roll < offender_ratio + repeat_ratio and new_users:
+            users.append(('repeat', rng.randrange(new_users)))
+        else:
+            users.append(('new', new_users))
+            new_users += 1
+    return users
+
+
+def identity(run_id, worker, scenario, index, serial):
+    """合成用户的设备指纹、邮箱、IP（公网地址段，语言识别会走到IP地理位置查询）"""
+    if scenario == 'offender':
+        # 刷量：少数IP，每次换新设备和邮箱
+        return (f'lt{run_id}-w{worker}-o{serial}', f'o{serial}.w{worker}.{run_id}@loadtest.example.com',
+                f'9.9.{index // 256}.{index % 256}')
+    number = worker * 1000000 + index
+    return (f'lt{run_id}-w{worker}-u{index}', f'u{index}.w{worker}.{run_id}@loadtest.example.com',
+            f'1.{number >> 16 & 255}.{number >> 8 & 255}.{number & 255}')
+
+
+def survey_form(fingerprint, email, index):
+    return {
+        'device_fingerprint': fingerprint,
+        'email': email,
+        'name': f'压测用户{index}',
+        'country': '中国',
+        'has_used_digital_human': '是' if index % 2 else '否',
+        'problems': ['短视频获客', '做直播'] if index % 3 else ['制作课程'],
+        'profession': '创业者',
+        'custom_profession': '',
+    }
+
+
+def classify(status, body):
+    """返回 (结果, 兑换码)"""
+    if status >= 500:
+        return f'http_{status}', None
+    match = CODE_PATTERN.search(body)
+    if match:
+        return 'success', match.group(1)
+    for outcome, message in OUTCOME_MESSAGES:
+        if message in body:
+            return outcome, None
+    return ('form_error' if status == 200 else f'http_{status}'), None
+
+
+class Recorder:
+    """线程共享的延迟和结果统计"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {route: [] for route in ROUTES + ('flow',)}
+        self.outcomes = {scenario: {} for scenario in SCENARIOS}
+        self.errors = {}
+        self.codes = {}
+
+    def latency(self, route, seconds):
+        with self.lock:
+            self.latencies[route].append(seconds)
+
+    def claimed(self, scenario, fingerprint, code):
+        """记录设备拿到的兑换码，返回结果分类"""
+        with self.lock:
+            previous = self.codes.setdefault(fingerprint, code)
+        if previous != code:
+            return 'code_mismatch'
+        return 'already_claimed' if scenario == 'repeat' else 'claimed'
+
+    def outcome(self, scenario, outcome):
+        with self.lock:
+            counts = self.outcomes[scenario]
+            counts[outcome] = counts.get(outcome, 0) + 1
+
+    def error(self, name):
+        with self.lock:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+
+def run_user(client, recorder, run_id, worker, scenario, index, serial, accept_language):
+    """一个合成用户走完整个领取流程"""
+    fingerprint, email, ip = identity(run_id, worker, scenario, index, serial)
+    headers = {'User-Agent': USER_AGENT, 'Accept': ACCEPT, 'X-Forwarded-For': ip}
+    if accept_language:
+        headers['Accept-Language'] = 'zh-CN,zh;q=0.9,en;q=0.8'
+    client.reset()
+
+    def call(route, method='GET', data=None):
+        start = time.perf_counter()
+        status, body = client.request(method, route, headers, data)
+        recorder.latency(route, time.perf_counter() - start)
+        if status >= 500:
+            recorder.error(f'{route} http_{status}')
+        return status, body
+
+    flow_start = time.perf_counter()
+    call('/')
+    call('/check_and_claim')
+    status, body = call('/submit_survey', 'POST', survey_form(fingerprint, email, index))
+    if status == 302:
+        status, body = call('/result')
+    outcome, code = classify(status, body)
+    recorder.latency('flow', time.perf_counter() - flow_start)
+
+    if outcome == 'success':
+        outcome = recorder.claimed(scenario, fingerprint, code)
+    recorder.outcome(scenario, outcome)
+    if outcome not in EXPECTED[scenario]:
+        recorder.error(f'{scenario} unexpected {outcome}')
+
+
+def worker_main(worker, options, ready, start, results):
+    """压测进程：导入应用后等待统一开始，结束后把统计结果放入队列"""
+    if options['url']:
+        make_client = lambda: HTTPClient(options['url'])
+        pool = None
+    else:
+        # 与 uWSGI 一样由每个进程自己加载 wsgi:app（main.py 负责初始化数据库）
+        from wsgi import app
+        import main  # noqa: F401
+        from db import pool
+        make_client = lambda: WSGIClient(app)
+
+    users = build_users(worker, options['users'], options['seed'], options['repeat_ratio'],
+                        options['offender_ratio'], options['offender_ips'])
+    recorder = Recorder()
+    next_user = iter(enumerate(users))
+    user_lock = threading.Lock()
+
+    def thread_main():
+        client = make_client()
+        rng = random.Random()
+        while True:
+            with user_lock:
+                item = next(next_user, None)
+            if item is None:
+                return
+            serial, (scenario, index) = item
+            try:
+                run_user(client, recorder, options['run_id'], worker, scenario, index, serial, rng.random() < 0.5)
+            except Exception as e:
+                recorder.outcome(scenario, 'exception')
+                recorder.error(f'{type(e).__name__}: {e}'[:200])
+
+    threads = [threading.Thread(target=thread_main) for _ in range(options['threads'])]
+    ready.wait()
+    start.wait()
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    finished = time.time()
+
+    busy = None
+    if pool is not None:
+        stats = pool.stats()
+        busy = {'busy_retries': stats['busy_retries'], 'busy_failures': stats['busy_failures']}
+    results.put({
+        'started': started, 'finished': finished, 'latencies': recorder.latencies,
+        'outcomes': recorder.outcomes, 'errors': recorder.errors, 'codes': recorder.codes, 'busy': busy,
+    })
+
+
+# ---------------------------------------------------------------- 汇总
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {'count': 0, 'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'max_ms': None}
+
+    def at(fraction):
+        return round(values[min(len(values) - 1, int(len(values) * fraction))] * 1000, 2)
+    return {'count': len(values), 'p50_ms': at(0.50), 'p95_ms': at(0.95), 'p99_ms': at(0.99),
+            'max_ms': round(values[-1] * 1000, 2)}
+
+
+def summarize(parts, settings):
+    elapsed = max(part['finished'] for part in parts) - min(part['started'] for part in parts)
+    latencies = {route: [] for route in ROUTES + ('flow',)}
+    outcomes = {scenario: {} for scenario in SCENARIOS}
+    errors = {}
+    codes = []
+    busy = {'busy_retries': 0, 'busy_failures': 0}
+    for part in parts:
+        for route, values in part['latencies'].items():
+            latencies[route].extend(values)
+        for scenario, counts in part['outcomes'].items():
+            for outcome, count in counts.items():
+                outcomes[scenario][outcome] = outcomes[scenario].get(outcome, 0) + count
+        for name, count in part['errors'].items():
+            errors[name] = errors.get(name, 0) + count
+        codes.extend(part['codes'].values())
+        if part['busy'] is None:
+            busy = None
+        elif busy is not None:
+            for name in busy:
+                busy[name] += part['busy'][name]
+
+    requests_total = sum(len(values) for route, values in latencies.items() if route != 'flow')
+    claimed = sum(counts.get('claimed', 0) for counts in outcomes.values())
+    return {
+        'settings': settings,
+        'elapsed_sec': round(elapsed, 3),
+        'throughput': {
+            'requests_per_sec': round(requests_total / elapsed, 1) if elapsed else None,
+            'flows_per_sec': round(len(latencies['flow']) / elapsed, 1) if elapsed else None,
+            'claims_per_sec': round(claimed / elapsed, 1) if elapsed else None,
+        },
+        'latency': {route: percentiles(values) for route, values in latencies.items()},
+        'outcomes': outcomes,
+        # run_in_transaction 中的 busy 重试/失败次数
+        'transaction_busy': busy,
+        'duplicate_codes': len(codes) - len(set(codes)),
+        'errors': dict(sorted(errors.items(), key=lambda item: -item[1])),
+    }
+
+
+def collect(results, workers):
+    """收集各进程的结果；有进程异常退出时报错而不是一直等待"""
+    parts = []
+    while len(parts) < len(workers):
+        try:
+            parts.append(results.get(timeout=1))
+        except queue.Empty:
+            if results.empty() and any(p.exitcode not in (None, 0) for p in workers):
+                raise RuntimeError('压测进程异常退出')
+    return parts
+
+
+def seed_codes(count, run_id):
+    """在临时数据库中初始化并写入兑换码（在子进程中执行，父进程不导入应用）"""
+    import main  # noqa: F401
+    from app import get_db_connection
+    from code_import import import_codes
+    conn = get_db_connection()
+    try:
+        import_codes(conn, (f'LT{run_id}-{i:08d}' for i in range(count)))
+    finally:
+        conn.close()
+
+
+def run_load_test(processes=4, threads=2, users=2000, codes=None, repeat_ratio=0.1, offender_ratio=0.05,
+                  offender_ips=4, seed=1, url=None):
+    """运行一次压测，返回汇总结果（dict）"""
+    users_per_process = max(1, users // processes)
+    codes = users if codes is None else codes
+    run_id = f'{seed}{int(time.time()) % 100000}'
+    options = {
+        'url': url, 'threads': threads, 'users': users_per_process, 'seed': seed, 'run_id': run_id,
+        'repeat_ratio': repeat_ratio, 'offender_ratio': offender_ratio, 'offender_ips': offender_ips,
+    }
+
+    ctx = multiprocessing.get_context('spawn')
+    geo_server = None
+    saved_env = dict(os.environ)
+    saved_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        try:
+            if not url:
+                geo_server, geo_url = start_fake_geo()
+                os.environ.update({
+                    'DATABASE_PATH': os.path.join(work_dir, 'loadtest.db'),
+                    'GEO_CACHE_PATH': os.path.join(work_dir, 'geo_cache.db'),
+                    'GEOIP_DB_PATH': os.path.join(work_dir, 'missing_ip_country.bin'),
+                    'GEO_API_URL': geo_url,
+                    'SHM_DIR': work_dir,
+                })
+                # 子进程在临时目录中启动，不读取项目目录下的 .env
+                os.chdir(work_dir)
+                setup = ctx.Process(target=seed_codes, args=(codes, run_id))
+                setup.start()
+                setup.join()
+                if setup.exitcode != 0:
+                    raise RuntimeError('初始化压测数据库失败')
+
+            ready = ctx.Barrier(processes + 1)
+            start = ctx.Barrier(processes + 1)
+            results = ctx.Queue()
+            workers = [ctx.Process(target=worker_main, args=(i, options, ready, start, results))
+                       for i in range(processes)]
+            for process in workers:
+                process.start()
+            ready.wait(timeout=300)
+            start.wait()
+            parts = collect(results, workers)
+            for process in workers:
+                process.join()
+        finally:
+            os.chdir(saved_cwd)
+            os.environ.clear()
+            os.environ.update(saved_env)
+            if geo_server is not None:
+                geo_server.shutdown()
+
+    settings = dict(options, processes=processes, codes=codes, users=users_per_process * processes)
+    for name in ('IP_HOURLY_LIMIT', 'IP_DAILY_SUCCESS', 'CLAIM_GROUP_COMMIT', 'DB_SYNCHRONOUS'):
+        if name in os.environ:
+            settings[name] = os.environ[name]
+    report = summarize(parts, settings)
+    report['geo_calls'] = FakeGeoHandler.calls if geo_server is not None else None
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='领取流程端到端压测（输出JSON）')
+    parser.add_argument('--processes', type=int, default=4, help='压测进程数（模拟uWSGI worker）')
+    parser.add_argument('--threads', type=int, default=2, help='每个进程的并发线程数')
+    parser.add_argument('--users', type=int, default=2000, help='合成用户总数')
+    parser.add_argument('--codes', type=int, default=None, help='写入的兑换码数量（默认等于用户数，--url 时不写入）')
+    parser.add_argument('--repeat-ratio', type=float, default=0.1, help='重复领取用户的比例')
+    parser.add_argument('--offender-ratio', type=float, default=0.05, help='刷量IP用户的比例')
+    parser.add_argument('--offender-ips', type=int, default=4, help='刷量IP的数量')
+    parser.add_argument('--seed', type=int, default=1, help='随机种子（相同种子生成相同的用户组合）')
+    parser.add_argument('--url', help='压测已部署的服务，例如 http://127.0.0.1:1688')
+    parser.add_argument('-o', '--output', help='结果同时写入该JSON文件')
+    args = parser.parse_args()
+
+    report = run_load_test(
+        processes=args.processes, threads=args.threads, users=args.users,
+        codes=0 if args.url and args.codes is None else args.codes,
+        repeat_ratio=args.repeat_ratio, offender_ratio=args.offender_ratio, offender_ips=args.offender_ips,
+        seed=args.seed, url=args.url
+    )
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
@@ -0,0 +1,313 @@
+# 数据库结构迁移
+#
+# 每个迁移有一个递增的版本号，已执行的版本记录在 schema_version 表中；
+# init_database() 启动时只执行尚未执行过的迁移，每个迁移在独立的事务中完成。
+# 新增迁移时在 MIGRATIONS 末尾追加，不要修改已经发布的迁移。
+
+import sqlite3
+
+
+def _initial_schema(cursor):
+    """国际版纯净结构（兼容引入版本号之前创建的数据库）"""
+    # 创建兑换码表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS codes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            code VARCHAR(32) UNIQUE NOT NULL,
+            is_used BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            claimed_at TIMESTAMP NULL,
+            claimed_by_fingerprint VARCHAR(64) NULL
+        )
+    ''')
+
+    # 创建用户表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_fingerprint VARCHAR(64) UNIQUE NOT NULL,
+            email VARCHAR(255) UNIQUE NOT NULL,
+            ip_address VARCHAR(45),
+            fingerprint_data TEXT,
+            user_agent TEXT,
+            last_claim_attempt TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 创建调研表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS surveys (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_fingerprint VARCHAR(64) NOT NULL,
+            email VARCHAR(255) NOT NULL,
+            name VARCHAR(100),
+            country VARCHAR(100),
+            has_used_digital_human VARCHAR(10),
+            problems TEXT,
+            profession VARCHAR(50),
+            custom_profession VARCHAR(100),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 创建IP限制表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ip_limits (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ip_address VARCHAR(45) NOT NULL,
+            attempt_count INTEGER DEFAULT 1,
+            success_count INTEGER DEFAULT 0,
+            first_attempt TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_attempt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_ip_address ON ip_limits(ip_address)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_last_attempt ON ip_limits(last_attempt)')
+
+    # 早期版本的surveys表没有name、country字段
+    columns = {row[1] for row in cursor.execute('PRAGMA table_info(surveys)')}
+    if 'name' not in columns:
+        cursor.execute('ALTER TABLE surveys ADD COLUMN name VARCHAR(100)')
+    if 'country' not in columns:
+        cursor.execute('ALTER TABLE surveys ADD COLUMN country VARCHAR(100)')
+
+
+def _hot_query_indexes(cursor):
+    """为 app.py 中的热点查询建立索引"""
+    # 按设备指纹查兑换码（二次检查、已领取查询、导出和接口的JOIN、重置用户），
+    # 带上code列即可直接从索引返回兑换码；未领取的行不进入索引
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_codes_claimed_by ON codes(claimed_by_fingerprint, code)
+        WHERE claimed_by_fingerprint IS NOT NULL
+    ''')
+    # 领取时定位未使用的兑换码、已使用数量统计、最近领取记录（按领取时间倒序）
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_codes_used ON codes(is_used, claimed_at)')
+    # 重置用户时按设备指纹删除调研数据
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_surveys_fingerprint ON surveys(device_fingerprint)')
+    # 导出和接口按提交时间排序、按日期范围过滤
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_surveys_created_at ON surveys(created_at)')
+    # IP限制按 IP + 时间 查询，组合索引覆盖原来的单列索引
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_ip_limits_ip_last ON ip_limits(ip_address, last_attempt)')
+    cursor.execute('DROP INDEX IF EXISTS idx_ip_address')
+
+
+def _change_log(cursor):
+    """变更日志（只追加），供合作方增量同步"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind VARCHAR(16) NOT NULL,
+            device_fingerprint VARCHAR(64),
+            payload TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _materialized_counters(cursor):
+    """兑换码和调研数量的物化计数器，由触发器维护（用 counters.py 核对）"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS counters (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            total_codes INTEGER NOT NULL DEFAULT 0,
+            used_codes INTEGER NOT NULL DEFAULT 0,
+            survey_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+    # is_used 的判断与统计查询 is_used = TRUE 保持一致
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_codes_insert_counters AFTER INSERT ON codes
+        BEGIN
+            UPDATE counters SET total_codes = total_codes + 1,
+                                used_codes = used_codes + IFNULL(NEW.is_used = TRUE, 0)
+            WHERE id = 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_codes_delete_counters AFTER DELETE ON codes
+        BEGIN
+            UPDATE counters SET total_codes = total_codes - 1,
+                                used_codes = used_codes - IFNULL(OLD.is_used = TRUE, 0)
+            WHERE id = 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_codes_used_counters AFTER UPDATE OF is_used ON codes
+        WHEN IFNULL(NEW.is_used = TRUE, 0) != IFNULL(OLD.is_used = TRUE, 0)
+        BEGIN
+            UPDATE counters SET used_codes = used_codes + IFNULL(NEW.is_used = TRUE, 0) - IFNULL(OLD.is_used = TRUE, 0)
+            WHERE id = 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_surveys_insert_counters AFTER INSERT ON surveys
+        BEGIN
+            UPDATE counters SET survey_count = survey_count + 1 WHERE id = 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_surveys_delete_counters AFTER DELETE ON surveys
+        BEGIN
+            UPDATE counters SET survey_count = survey_count - 1 WHERE id = 1;
+        END
+    ''')
+
+    # 用现有数据初始化
+    cursor.execute('''
+        INSERT OR REPLACE INTO counters (id, total_codes, used_codes, survey_count)
+        SELECT 1,
+               (SELECT COUNT(*) FROM codes),
+               (SELECT COUNT(*) FROM codes WHERE is_used = TRUE),
+               (SELECT COUNT(*) FROM surveys)
+    ''')
+
+
+def _survey_problems(cursor):
+    """多选问题拆分为 survey_problems 表，并拆分已有的调研数据"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS survey_problems (
+            survey_id INTEGER NOT NULL,
+            problem VARCHAR(50) NOT NULL,
+            PRIMARY KEY (survey_id, problem)
+        ) WITHOUT ROWID
+    ''')
+    # 按选项计数时只读这个索引
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_survey_problems_problem ON survey_problems(problem)')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_surveys_delete_problems AFTER DELETE ON surveys
+        BEGIN
+            DELETE FROM survey_problems WHERE survey_id = OLD.id;
+        END
+    ''')
+
+    # 用递归CTE按逗号拆分已有数据
+    cursor.execute('''
+        WITH RECURSIVE split(survey_id, problem, rest) AS (
+            SELECT id, '', problems || ',' FROM surveys WHERE problems IS NOT NULL AND problems != ''
+            UNION ALL
+            SELECT survey_id, trim(substr(rest, 1, instr(rest, ',') - 1)), substr(rest, instr(rest, ',') + 1)
+            FROM split WHERE rest != ''
+        )
+        INSERT OR IGNORE INTO survey_problems (survey_id, problem)
+        SELECT survey_id, problem FROM split WHERE problem != ''
+    ''')
+
+
+def _stats_rollup(cursor):
+    """按天、按小时汇总的调研/领取/尝试/拒绝数（调研和领取由触发器维护，用 rollup.py 重建）"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stats_rollup (
+            granularity VARCHAR(8) NOT NULL,
+            bucket VARCHAR(16) NOT NULL,
+            surveys INTEGER NOT NULL DEFAULT 0,
+            claims INTEGER NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            rejections INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (granularity, bucket)
+        ) WITHOUT ROWID
+    ''')
+
+    # 时间戳到桶：天 substr(t, 1, 10)，小时 substr(t, 1, 13) || ':00'
+    def bump(column, timestamp, delta):
+        return f'''
+            INSERT OR IGNORE INTO stats_rollup (granularity, bucket)
+            SELECT 'day', substr({timestamp}, 1, 10) WHERE {timestamp} IS NOT NULL;
+            INSERT OR IGNORE INTO stats_rollup (granularity, bucket)
+            SELECT 'hour', substr({timestamp}, 1, 13) || ':00' WHERE {timestamp} IS NOT NULL;
+            UPDATE stats_rollup SET {column} = {column} + ({delta})
+            WHERE (granularity = 'day' AND bucket = substr({timestamp}, 1, 10))
+               OR (granularity = 'hour' AND bucket = substr({timestamp}, 1, 13) || ':00');
+        '''
+
+    triggers = {
+        'trg_surveys_insert_rollup': ('AFTER INSERT ON surveys', bump('surveys', 'NEW.created_at', 1)),
+        'trg_surveys_delete_rollup': ('AFTER DELETE ON surveys', bump('surveys', 'OLD.created_at', -1)),
+        'trg_codes_insert_rollup': ('AFTER INSERT ON codes WHEN NEW.claimed_at IS NOT NULL',
+                                    bump('claims', 'NEW.claimed_at', 1)),
+        'trg_codes_delete_rollup': ('AFTER DELETE ON codes WHEN OLD.claimed_at IS NOT NULL',
+                                    bump('claims', 'OLD.claimed_at', -1)),
+        # 领取时 claimed_at 从NULL变为领取时间，重置用户时变回NULL
+        'trg_codes_claim_rollup': ('AFTER UPDATE OF claimed_at ON codes WHEN OLD.claimed_at IS NOT NEW.claimed_at',
+                                   bump('claims', 'OLD.claimed_at', -1) + bump('claims', 'NEW.claimed_at', 1)),
+    }
+    for name, (event, body) in triggers.items():
+        cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END')
+
+    # 用现有数据初始化
+    cursor.execute('''
+        INSERT OR REPLACE INTO stats_rollup (granularity, bucket, surveys, claims)
+        SELECT granularity, bucket, SUM(surveys), SUM(claims) FROM (
+            SELECT 'day' AS granularity, substr(created_at, 1, 10) AS bucket, COUNT(*) AS surveys, 0 AS claims
+            FROM surveys WHERE created_at IS NOT NULL GROUP BY 2
+            UNION ALL
+            SELECT 'hour', substr(created_at, 1, 13) || ':00', COUNT(*), 0
+            FROM surveys WHERE created_at IS NOT NULL GROUP BY 2
+            UNION ALL
+            SELECT 'day', substr(claimed_at, 1, 10), 0, COUNT(*)
+            FROM codes WHERE claimed_at IS NOT NULL GROUP BY 2
+            UNION ALL
+            SELECT 'hour', substr(claimed_at, 1, 13) || ':00', 0, COUNT(*)
+            FROM codes WHERE claimed_at IS NOT NULL GROUP BY 2
+        )
+        GROUP BY granularity, bucket
+    ''')
+
+
+def _profession_index(cursor):
+    """统计接口按职业分组计数，从索引读取，不再扫描整个调研表"""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_surveys_profession ON surveys(profession)')
+
+
+# (版本号, 说明, 迁移函数)
+MIGRATIONS = [
+    (1, '初始表结构', _initial_schema),
+    (2, '热点查询索引', _hot_query_indexes),
+    (3, '变更日志', _change_log),
+    (4, '物化计数器', _materialized_counters),
+    (5, '调研问题拆分', _survey_problems),
+    (6, '按天/小时统计汇总', _stats_rollup),
+    (7, '职业统计索引', _profession_index),
+]
+
+
+def current_version(conn):
+    """当前数据库结构版本"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def migrate(conn):
+    """执行所有未执行的迁移，返回执行过的版本号列表"""
+    applied = []
+    version = current_version(conn)
+    conn.commit()
+
+    for number, name, func in MIGRATIONS:
+        if number <= version:
+            continue
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # 并发启动的其他进程可能已经执行了这个迁移
+            if conn.execute('SELECT 1 FROM schema_version WHERE version = ?', (number,)).fetchone():
+                conn.rollback()
+                continue
+            func(conn.cursor())
+            conn.execute('INSERT INTO schema_version (version, name) VALUES (?, ?)', (number, name))
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        applied.append(number)
+
+    return applied
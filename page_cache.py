@@ -0,0 +1,73 @@
+# 静态页面缓存（/ 和 /check_and_claim）
+#
+# 这两个页面的内容只取决于语言：翻译在服务端渲染时直接写入页面，
+# 每个worker按 (页面, 语言) 缓存渲染结果，之后的请求直接返回字符串，不再渲染模板。
+# 缓存项记录渲染时的标记（模板目录的最后修改时间 + 翻译版本号），
+# 标记变化（模板或翻译文件被修改）时重新渲染。
+
+import os
+import threading
+import time
+
+from translation_bundles import TRANSLATION_CHECK_INTERVAL
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+
+class PageCache:
+    """按 (页面, 语言) 缓存渲染好的页面"""
+
+    def __init__(self, templates_dir=None, check_interval=None):
+        self.templates_dir = templates_dir or TEMPLATES_DIR
+        self.check_interval = TRANSLATION_CHECK_INTERVAL if check_interval is None else check_interval
+        self._lock = threading.Lock()
+        self._pages = {}
+        self._templates_mtime = None
+        self._checked = 0
+        self._stats = {'hits': 0, 'renders': 0}
+
+    def templates_mtime(self):
+        """模板目录中最晚的修改时间（超过检查间隔才重新扫描）"""
+        now = time.monotonic()
+        if self._templates_mtime is not None and now - self._checked < self.check_interval:
+            return self._templates_mtime
+
+        latest = 0
+        for root, _, files in os.walk(self.templates_dir):
+            for name in files:
+                try:
+                    latest = max(latest, os.stat(os.path.join(root, name)).st_mtime_ns)
+                except OSError:
+                    continue
+        self._templates_mtime = latest
+        self._checked = now
+        return latest
+
+    def get(self, name, language, translation_version, render):
+        """返回缓存的页面；模板或翻译修改后调用 render() 重新渲染"""
+        stamp = (self.templates_mtime(), translation_version)
+        key = (name, language)
+        cached = self._pages.get(key)
+        if cached is not None and cached[0] == stamp:
+            with self._lock:
+                self._stats['hits'] += 1
+            return cached[1]
+
+        body = render()
+        with self._lock:
+            self._pages[key] = (stamp, body)
+            self._stats['renders'] += 1
+        return body
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+            self._templates_mtime = None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pages'] = len(self._pages)
+        total = stats['hits'] + stats['renders']
+        stats['hit_rate'] = round(stats['hits'] / total, 4) if total else 0.0
+        return stats
@@ -0,0 +1,331 @@
+# IP限流（替代 ip_limits 表上的SQL检查）
+#
+# 计数保存在所有worker共享的内存中，每次检查/记录都是O(1)，不写数据库：
+#   每小时尝试次数  滑动窗口计数：当前小时窗口计数 + 上一窗口计数 × 未过去的比例
+#   每日成功次数    按本地日期计数，跨天自动清零
+# 后台线程定期把有变化的IP计数写回 ip_limits 表（便于查看和重启后恢复）；
+# 写回时在锁内只复制共享内存，查找有变化的槽在锁外进行，不阻塞其他进程的限流检查。
+#
+# 共享内存是一个开放寻址的哈希表，每个槽48字节：
+#   key(16字节，IPv6格式的IP) | window | cur | prev | day | day_attempts | day_success | last_seen | flags
+
+import datetime
+import hashlib
+import ipaddress
+import os
+import re
+import struct
+import threading
+import time
+
+from shared_memory import SharedMemoryFile, shm_path
+
+RATE_LIMIT_SLOTS = int(os.environ.get('RATE_LIMIT_SLOTS', 65536))  # 共享内存中可同时跟踪的IP数
+RATE_LIMIT_WINDOW = int(os.environ.get('RATE_LIMIT_WINDOW', 3600))  # 尝试次数的统计窗口（秒）
+RATE_LIMIT_CHECKPOINT = int(os.environ.get('RATE_LIMIT_CHECKPOINT', 30))  # 写回数据库的间隔（秒）
+
+HEADER = struct.Struct('<4sIId')  # magic | version | 槽数 | 上次写回时间
+HEADER_SIZE = 64
+SLOT = struct.Struct('<16sIIIIIIII')
+MAGIC = b'RLIM'
+VERSION = 1
+MAX_PROBE = 16
+
+FLAG_DIRTY = 1
+FLAG_IP = 2
+# flags 低位字节中带 FLAG_DIRTY 的取值
+DIRTY_FLAGS = re.compile(b'[\x01\x03]')
+FLAG_OFFSET = SLOT.size - 4
+
+# 写回 ip_limits：先更新当天的行，没有时插入新行
+CHECKPOINT_UPDATE_SQL = '''
+    UPDATE ip_limits
+    SET attempt_count = ?, success_count = ?, last_attempt = datetime('now', 'localtime')
+    WHERE ip_address = ? AND last_attempt >= ?
+'''
+CHECKPOINT_INSERT_SQL = '''
+    INSERT INTO ip_limits (ip_address, attempt_count, success_count, first_attempt, last_attempt)
+    VALUES (?, ?, ?, datetime('now', 'localtime'), datetime('now', 'localtime'))
+'''
+
+
+def ip_key(ip_address):
+    """把IP转换为16字节的key，返回 (key, 是否为合法IP)"""
+    try:
+        ip = ipaddress.ip_address(ip_address.strip())
+        if ip.version == 4:
+            ip = ipaddress.IPv6Address(b'\x00' * 10 + b'\xff\xff' + ip.packed)
+        return ip.packed, True
+    except (ValueError, AttributeError):
+        # 代理头里可能出现非IP内容，按哈希计数
+        return hashlib.blake2b(str(ip_address).encode('utf-8'), digest_size=16).digest(), False
+
+
+def key_to_ip(key):
+    ip = ipaddress.IPv6Address(key)
+    return str(ip.ipv4_mapped or ip)
+
+
+class RateLimiter:
+    """跨进程共享的IP限流器"""
+
+    def __init__(self, hourly_limit, daily_success_limit, path=None, slots=None,
+                 window=None, checkpoint_interval=None, connect=None):
+        self.hourly_limit = hourly_limit
+        self.daily_success_limit = daily_success_limit
+        self.slots = RATE_LIMIT_SLOTS if slots is None else slots
+        self.window = RATE_LIMIT_WINDOW if window is None else window
+        self.checkpoint_interval = RATE_LIMIT_CHECKPOINT if checkpoint_interval is None else checkpoint_interval
+        self.connect = connect  # 返回数据库连接的函数，用于写回和预热
+        self.path = path or shm_path('gift_bihuoai_rate_limit.bin')
+
+        self._shm = None
+        self._init_lock = threading.Lock()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._counters = {
+            'attempts': 0, 'successes': 0, 'rejected_hourly': 0, 'rejected_daily': 0,
+            'evictions': 0, 'checkpoints': 0, 'checkpointed_rows': 0,
+        }
+
+    # ---------- 共享内存 ----------
+
+    def _memory(self):
+        if self._shm is not None:
+            return self._shm
+
+        with self._init_lock:
+            if self._shm is None:
+                shm = SharedMemoryFile(self.path, HEADER_SIZE + SLOT.size * self.slots)
+                with shm.locked() as mm:
+                    magic, version, slots, _ = HEADER.unpack_from(mm, 0)
+                    if magic != MAGIC or version != VERSION or slots != self.slots:
+                        # 新建或格式不一致：清空后从数据库恢复当天的计数
+                        mm[:] = b'\x00' * len(mm)
+                        HEADER.pack_into(mm, 0, MAGIC, VERSION, self.slots, time.time())
+                        self._warm_up(mm)
+                self._shm = shm
+                self._start_checkpointer()
+        return self._shm
+
+    def _find_slot(self, mm, key, now_window, today):
+        """查找IP所在的槽，没有则分配一个（必须在加锁状态下调用）"""
+        start = int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little') % self.slots
+        empty = None
+        stalest = None
+        stalest_seen = None
+
+        for i in range(MAX_PROBE):
+            index = (start + i) % self.slots
+            offset = HEADER_SIZE + index * SLOT.size
+            slot_key = mm[offset:offset + 16]
+            if slot_key == key:
+                return offset, False
+            if slot_key == b'\x00' * 16:
+                if empty is None:
+                    empty = offset
+                continue
+
+            fields = SLOT.unpack_from(mm, offset)
+            window, day, last_seen = fields[1], fields[4], fields[7]
+            if empty is None and day != today and window < now_window - 1:
+                # 早已过期的IP，槽可以直接复用
+                empty = offset
+            if stalest_seen is None or last_seen < stalest_seen:
+                stalest = offset
+                stalest_seen = last_seen
+
+        if empty is not None:
+            return empty, True
+
+        with self._lock:
+            self._counters['evictions'] += 1
+        return stalest, True
+
+    def _update(self, ip_address, attempt=False, success=False):
+        """更新IP计数，返回 (每小时尝试估计值, 今日成功次数)"""
+        key, is_ip = ip_key(ip_address)
+        now = time.time()
+        now_window = int(now // self.window)
+        today = datetime.date.today().toordinal()
+        shm = self._memory()
+
+        with shm.locked() as mm:
+            offset, fresh = self._find_slot(mm, key, now_window, today)
+            if fresh:
+                fields = [key, now_window, 0, 0, today, 0, 0, int(now), FLAG_IP if is_ip else 0]
+            else:
+                fields = list(SLOT.unpack_from(mm, offset))
+
+            # 滑动窗口：进入新窗口时当前计数变为上一窗口计数
+            if fields[1] != now_window:
+                fields[3] = fields[2] if fields[1] == now_window - 1 else 0
+                fields[2] = 0
+                fields[1] = now_window
+            if fields[4] != today:
+                fields[4] = today
+                fields[5] = 0
+                fields[6] = 0
+
+            if attempt:
+                fields[2] += 1
+                fields[5] += 1
+            if success:
+                fields[6] += 1
+            if attempt or success:
+                fields[7] = int(now)
+                fields[8] |= FLAG_DIRTY
+                SLOT.pack_into(mm, offset, *fields)
+
+        elapsed = (now % self.window) / self.window
+        hourly = fields[2] + fields[3] * (1 - elapsed)
+        return hourly, fields[6]
+
+    # ---------- 对外接口 ----------
+
+    def record_attempt(self, ip_address):
+        """记录一次领取尝试"""
+        with self._lock:
+            self._counters['attempts'] += 1
+        return self._update(ip_address, attempt=True)
+
+    def record_success(self, ip_address):
+        """记录一次成功领取"""
+        with self._lock:
+            self._counters['successes'] += 1
+        return self._update(ip_address, success=True)
+
+    def check(self, ip_address):
+        """检查IP是否超限，返回 (是否允许, 超限原因 'daily'/'hourly'/None)"""
+        hourly, daily_success = self._update(ip_address)
+
+        if daily_success >= self.daily_success_limit:
+            with self._lock:
+                self._counters['rejected_daily'] += 1
+            return False, 'daily'
+
+        # 本次尝试已先记录，超过上限才拒绝
+        if hourly > self.hourly_limit:
+            with self._lock:
+                self._counters['rejected_hourly'] += 1
+            return False, 'hourly'
+        return True, None
+
+    # ---------- 写回数据库 ----------
+
+    def _warm_up(self, mm):
+        """共享内存新建时，从 ip_limits 恢复当天的计数"""
+        if self.connect is None:
+            return
+        try:
+            conn = self.connect()
+            today_start = datetime.date.today().strftime('%Y-%m-%d 00:00:00')
+            rows = conn.execute('''
+                SELECT ip_address, SUM(attempt_count), SUM(success_count)
+                FROM ip_limits
+                WHERE last_attempt >= ?
+                GROUP BY ip_address
+            ''', (today_start,)).fetchall()
+            conn.close()
+        except Exception as e:
+            print(f"限流计数恢复失败: {str(e)}")
+            return
+
+        now = time.time()
+        now_window = int(now // self.window)
+        today = datetime.date.today().toordinal()
+        for ip_address, attempts, successes in rows:
+            key, is_ip = ip_key(ip_address)
+            offset, _ = self._find_slot(mm, key, now_window, today)
+            SLOT.pack_into(mm, offset, key, now_window, 0, 0, today,
+                           attempts or 0, successes or 0, int(now), FLAG_IP if is_ip else 0)
+
+    def _start_checkpointer(self):
+        if self.connect is None or self.checkpoint_interval <= 0:
+            return
+
+        def run():
+            while True:
+                time.sleep(self.checkpoint_interval)
+                try:
+                    self.checkpoint()
+                except Exception as e:
+                    print(f"限流计数写回失败: {str(e)}")
+
+        self._thread = threading.Thread(target=run, name='rate-limit-checkpoint', daemon=True)
+        self._thread.start()
+
+    def checkpoint(self, force=False):
+        """把有变化的计数写回 ip_limits，返回写回的IP数（多个进程中同一时间只有一个会真正执行）"""
+        shm = self._memory()
+        now = time.time()
+        today = datetime.date.today().toordinal()
+        dirty = []
+
+        with shm.locked() as mm:
+            _, _, _, last_checkpoint = HEADER.unpack_from(mm, 0)
+            if not force and now - last_checkpoint < self.checkpoint_interval:
+                return 0
+            HEADER.pack_into(mm, 0, MAGIC, VERSION, self.slots, now)
+            snapshot = mm[HEADER_SIZE:]
+
+        # 在副本中查找有变化的槽：取出每个槽flags的低位字节，用正则在C层扫描
+        candidates = [match.start() for match in DIRTY_FLAGS.finditer(snapshot[FLAG_OFFSET::SLOT.size])]
+        if not candidates:
+            return 0
+
+        with shm.locked() as mm:
+            # 复制之后槽可能又有变化，按当前内容写回
+            for index in candidates:
+                offset = HEADER_SIZE + index * SLOT.size
+                fields = list(SLOT.unpack_from(mm, offset))
+                if not fields[8] & FLAG_DIRTY:
+                    continue
+                fields[8] &= ~FLAG_DIRTY
+                SLOT.pack_into(mm, offset, *fields)
+                if fields[8] & FLAG_IP and fields[4] == today:
+                    dirty.append((index, fields[0], key_to_ip(fields[0]), fields[5], fields[6]))
+
+        if not dirty:
+            return 0
+
+        today_start = datetime.date.today().strftime('%Y-%m-%d 00:00:00')
+        conn = self.connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for _, _, ip_address, attempts, successes in dirty:
+                cursor = conn.execute(CHECKPOINT_UPDATE_SQL, (attempts, successes, ip_address, today_start))
+                if cursor.rowcount == 0:
+                    conn.execute(CHECKPOINT_INSERT_SQL, (ip_address, attempts, successes))
+            conn.commit()
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            # 没有写回的计数重新标记为有变化，下次写回时再试
+            self._mark_dirty(shm, dirty)
+            raise
+        finally:
+            conn.close()
+
+        with self._lock:
+            self._counters['checkpoints'] += 1
+            self._counters['checkpointed_rows'] += len(dirty)
+        return len(dirty)
+
+    def _mark_dirty(self, shm, dirty):
+        with shm.locked() as mm:
+            for index, key, _, _, _ in dirty:
+                offset = HEADER_SIZE + index * SLOT.size
+                fields = list(SLOT.unpack_from(mm, offset))
+                # 槽位可能已经被其他IP占用
+                if fields[0] == key:
+                    fields[8] |= FLAG_DIRTY
+                    SLOT.pack_into(mm, offset, *fields)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats['hourly_limit'] = self.hourly_limit
+        stats['daily_success_limit'] = self.daily_success_limit
+        stats['slots'] = self.slots
+        return stats
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按天 / 按小时汇总的统计表
+
+stats_rollup 每个时间桶一行（granularity='day' 时桶为 YYYY-MM-DD，'hour' 时为 YYYY-MM-DD HH:00）：
+  surveys     调研数，由 surveys 表的触发器维护
+  claims      领取数（按领取时间），由 codes 表的触发器维护，重置用户时扣回
+  attempts    领取尝试数
+  rejections  被拒绝的领取数（设备/邮箱已领取、IP超限）
+尝试和拒绝不写业务表，先在进程内累加，后台线程每隔几秒合并写入一次。
+时间序列查询只读汇总行，不再对 surveys 全表 GROUP BY。
+
+用法：
+    python rollup.py    按 surveys / codes 重新统计调研数和领取数（保留尝试和拒绝数）
+"""
+
+import argparse
+import atexit
+import datetime
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+# 添加项目路径到系统路径
+project_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_path)
+
+ROLLUP_FLUSH_INTERVAL = float(os.environ.get('ROLLUP_FLUSH_INTERVAL', 5))  # 尝试/拒绝计数写入间隔（秒）
+
+GRANULARITIES = ('day', 'hour')
+MAX_RANGE_DAYS = {'day': 366, 'hour': 31}  # 单次查询的最大天数
+DEFAULT_RANGE_DAYS = {'day': 30, 'hour': 2}
+
+# 时间戳（YYYY-MM-DD HH:MM:SS）到时间桶
+BUCKET_SQL = {
+    'day': "substr({column}, 1, 10)",
+    'hour': "substr({column}, 1, 13) || ':00'",
+}
+
+SERIES_SQL = '''
+    SELECT bucket, surveys, claims, attempts, rejections
+    FROM stats_rollup
+    WHERE granularity = ? AND bucket >= ? AND bucket < ?
+    ORDER BY bucket
+'''
+
+DAILY_SURVEYS_SQL = '''
+    SELECT bucket AS survey_date, surveys AS count
+    FROM stats_rollup
+    WHERE granularity = 'day' AND surveys > 0
+    ORDER BY bucket DESC
+    LIMIT ?
+'''
+
+
+def buckets(moment):
+    """时间对应的 (天, 小时) 桶"""
+    return moment.strftime('%Y-%m-%d'), moment.strftime('%Y-%m-%d %H:00')
+
+
+def add_to_buckets(cursor, deltas):
+    """把 {(天, 小时): {列: 增量}} 累加到汇总表（在调用方的事务中）"""
+    for (day, hour), values in deltas.items():
+        for granularity, bucket in (('day', day), ('hour', hour)):
+            cursor.execute('INSERT OR IGNORE INTO stats_rollup (granularity, bucket) VALUES (?, ?)', (granularity, bucket))
+            cursor.execute('''
+                UPDATE stats_rollup SET attempts = attempts + ?, rejections = rejections + ?
+                WHERE granularity = ? AND bucket = ?
+            ''', (values.get('attempts', 0), values.get('rejections', 0), granularity, bucket))
+
+
+class EventBuffer:
+    """进程内累加领取尝试和拒绝次数，定期写入 stats_rollup"""
+
+    def __init__(self, connect, interval=None, on_flush=None):
+        self.connect = connect
+        self.interval = ROLLUP_FLUSH_INTERVAL if interval is None else interval
+        self.on_flush = on_flush  # 写入后回调（例如让统计接口的ETag失效）
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._pid = None
+
+    def _start(self):
+        # 首次记录时启动后台线程（fork之后在子进程中重新启动）
+        self._pid = os.getpid()
+        self._pending = {}
+        if self.interval > 0:
+            thread = threading.Thread(target=self._run, name='rollup-flush', daemon=True)
+            thread.start()
+        atexit.register(self._flush_quietly)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self._flush_quietly()
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"统计汇总写入失败: {str(e)}")
+
+    def record(self, kind, moment=None):
+        """记录一次事件（kind 为 attempts 或 rejections）"""
+        key = buckets(moment or datetime.datetime.now())
+        with self._lock:
+            if self._pid != os.getpid():
+                self._start()
+            values = self._pending.setdefault(key, {})
+            values[kind] = values.get(kind, 0) + 1
+
+    def flush(self):
+        """把累加的计数写入数据库，返回写入的时间桶数"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        conn = self.connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            add_to_buckets(conn.cursor(), pending)
+            conn.commit()
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            # 写入失败时放回，下次再写
+            with self._lock:
+                for key, values in pending.items():
+                    merged = self._pending.setdefault(key, {})
+                    for kind, count in values.items():
+                        merged[kind] = merged.get(kind, 0) + count
+            raise
+        finally:
+            conn.close()
+
+        if self.on_flush:
+            self.on_flush()
+        return len(pending)
+
+
+def parse_range(granularity, start_date, end_date, today=None):
+    """解析 granularity / from / to 参数，返回 [起始桶, 结束桶) ；参数错误时抛出 ValueError"""
+    if granularity not in GRANULARITIES:
+        raise ValueError('granularity 参数应为 day 或 hour')
+    today = today or datetime.date.today()
+    try:
+        end = datetime.datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else today
+        if start_date:
+            start = datetime.datetime.strptime(start_date, '%Y-%m-%d').date()
+        else:
+            start = end - datetime.timedelta(days=DEFAULT_RANGE_DAYS[granularity] - 1)
+    except ValueError:
+        raise ValueError('日期格式应为 YYYY-MM-DD')
+    if start > end:
+        raise ValueError('from 不能晚于 to')
+    if (end - start).days + 1 > MAX_RANGE_DAYS[granularity]:
+        raise ValueError(f'时间范围不能超过 {MAX_RANGE_DAYS[granularity]} 天')
+    return start.isoformat(), (end + datetime.timedelta(days=1)).isoformat()
+
+
+def query_series(conn, granularity, start_date=None, end_date=None):
+    """读取时间序列（只读汇总行；to 当天包含在内）"""
+    start, end = parse_range(granularity, start_date, end_date)
+    return [
+        {'bucket': row[0], 'surveys': row[1], 'claims': row[2], 'attempts': row[3], 'rejections': row[4]}
+        for row in conn.execute(SERIES_SQL, (granularity, start, end))
+    ]
+
+
+def daily_surveys(conn, limit=30):
+    """最近有调研的天数及每天的调研数（与原 daily_surveys 格式一致）"""
+    return [{'survey_date': row[0], 'count': row[1]} for row in conn.execute(DAILY_SURVEYS_SQL, (limit,))]
+
+
+def rebuild(conn):
+    """按 surveys / codes 重新统计调研数和领取数，尝试和拒绝数保留；返回写入的时间桶数"""
+    conn.commit()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute('UPDATE stats_rollup SET surveys = 0, claims = 0')
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS rollup_rebuild (granularity TEXT, bucket TEXT, surveys INTEGER, claims INTEGER)')
+        conn.execute('CREATE INDEX IF NOT EXISTS temp.idx_rollup_rebuild ON rollup_rebuild(granularity, bucket)')
+        conn.execute('DELETE FROM rollup_rebuild')
+        for granularity in GRANULARITIES:
+            survey_bucket = BUCKET_SQL[granularity].format(column='created_at')
+            claim_bucket = BUCKET_SQL[granularity].format(column='claimed_at')
+            conn.execute(f'''
+                INSERT INTO rollup_rebuild
+                SELECT ?, {survey_bucket}, COUNT(*), 0 FROM surveys WHERE created_at IS NOT NULL GROUP BY 2
+            ''', (granularity,))
+            conn.execute(f'''
+                INSERT INTO rollup_rebuild
+                SELECT ?, {claim_bucket}, 0, COUNT(*) FROM codes WHERE claimed_at IS NOT NULL GROUP BY 2
+            ''', (granularity,))
+
+        conn.execute('''
+            INSERT OR IGNORE INTO stats_rollup (granularity, bucket)
+            SELECT DISTINCT granularity, bucket FROM rollup_rebuild
+        ''')
+        conn.execute('''
+            UPDATE stats_rollup SET
+                surveys = (SELECT SUM(r.surveys) FROM rollup_rebuild r
+                           WHERE r.granularity = stats_rollup.granularity AND r.bucket = stats_rollup.bucket),
+                claims = (SELECT SUM(r.claims) FROM rollup_rebuild r
+                          WHERE r.granularity = stats_rollup.granularity AND r.bucket = stats_rollup.bucket)
+            WHERE (granularity, bucket) IN (SELECT granularity, bucket FROM rollup_rebuild)
+        ''')
+        count = conn.execute('SELECT COUNT(*) FROM (SELECT DISTINCT granularity, bucket FROM rollup_rebuild)').fetchone()[0]
+        conn.execute('DELETE FROM rollup_rebuild')
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    return count
+
+
+if __name__ == '__main__':
+    from app import DATABASE_PATH
+    from data_version import DataVersion
+    from migrations import migrate
+    from shared_memory import shm_path_for_database
+
+    parser = argparse.ArgumentParser(description='按历史数据重建统计汇总表')
+    parser.add_argument('--db', default=DATABASE_PATH, help='数据库路径')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        migrate(conn)
+        count = rebuild(conn)
+    except sqlite3.Error as e:
+        print(f"✗ 重建失败：{e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+    # 统计接口的ETag随之失效
+    DataVersion(shm_path_for_database('gift_bihuoai_data_version', args.db)).bump()
+    print(f"✓ 统计汇总已重建：{count} 个时间桶")
@@ -0,0 +1,82 @@
+# 跨进程共享内存
+#
+# uWSGI 的多个worker之间没有共享的Python对象，这里用一个映射到 /dev/shm（或临时目录）
+# 下的文件实现共享内存：所有进程mmap同一个文件，读写直接作用于同一份内存页；
+# 需要原子读改写时用 locked() 加锁（进程内线程锁 + 文件锁）。
+
+import fcntl
+import hashlib
+import mmap
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+SHM_DIR = os.environ.get('SHM_DIR') or ('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir())
+
+
+def shm_path(name):
+    """共享内存文件的默认路径"""
+    return os.path.join(SHM_DIR, name)
+
+
+def shm_path_for_database(name, database_path):
+    """与数据库一一对应的共享内存文件路径（不同数据库的计数互不影响）"""
+    digest = hashlib.md5(os.path.abspath(database_path).encode('utf-8')).hexdigest()[:8]
+    return shm_path(f'{name}_{digest}.bin')
+
+
+class SharedMemoryFile:
+    """固定大小的共享内存文件"""
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self.created = False
+        self._thread_lock = threading.Lock()
+        self._pid = None
+        self._file = None
+        self.mm = None
+        self._open()
+
+    def _open(self):
+        self._file = open(self.path, 'a+b')
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        try:
+            current = os.fstat(self._file.fileno()).st_size
+            if current < self.size:
+                # 新文件（或旧版本较小的文件）扩展到目标大小，新增部分全部为0
+                self.created = current == 0
+                self._file.truncate(self.size)
+        finally:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self.mm = mmap.mmap(self._file.fileno(), self.size)
+        self._pid = os.getpid()
+
+    def _ensure_open(self):
+        # fork之后文件锁会与父进程共享，需要重新打开
+        if self._pid != os.getpid():
+            self._thread_lock = threading.Lock()
+            self._open()
+
+    @contextmanager
+    def locked(self):
+        """跨进程互斥"""
+        self._ensure_open()
+        with self._thread_lock:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield self.mm
+            finally:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+    def view(self):
+        """不加锁读取（单个对齐字段的读取不会读到半写的值）"""
+        self._ensure_open()
+        return self.mm
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self._file.close()
+            self.mm = None
@@ -0,0 +1,70 @@
+# 调研问题分析
+#
+# 多选的“希望解决的问题”在 surveys.problems 中以逗号拼接保存，按它 GROUP BY 统计的是
+# 选项组合而不是单个选项。提交时同时把每个选项写入 survey_problems(survey_id, problem)，
+# 统计按选项计数；删除调研时由触发器删除对应的选项。
+#
+# 交叉分析只执行一次聚合查询（按 问题 × 职业 × 国家 分组），再在一次遍历中
+# 累加出各选项计数、职业 × 问题、国家 × 问题 三个结果。
+
+PROBLEM_COUNTS_SQL = '''
+    SELECT problem AS problems, COUNT(*) AS count
+    FROM survey_problems
+    GROUP BY problem
+    ORDER BY count DESC, problem
+    LIMIT ?
+'''
+
+CROSS_TAB_SQL = '''
+    SELECT sp.problem, COALESCE(NULLIF(s.profession, ''), '未填写'), COALESCE(NULLIF(s.country, ''), '未填写'), COUNT(*)
+    FROM survey_problems sp
+    JOIN surveys s ON s.id = sp.survey_id
+    GROUP BY sp.problem, s.profession, s.country
+'''
+
+
+def split_problems(problems):
+    """把逗号拼接的问题拆成去重后的选项列表"""
+    options = []
+    for option in (problems or '').split(','):
+        option = option.strip()
+        if option and option not in options:
+            options.append(option)
+    return options
+
+
+def record_survey_problems(cursor, survey_id, problems):
+    """在调用方的事务中写入调研的各个问题选项"""
+    cursor.executemany(
+        'INSERT OR IGNORE INTO survey_problems (survey_id, problem) VALUES (?, ?)',
+        [(survey_id, option) for option in split_problems(problems)]
+    )
+
+
+def problem_counts(conn, limit=10):
+    """各选项被选择的次数（按次数倒序，次数相同时按选项排序）"""
+    return [dict(problems=row[0], count=row[1]) for row in conn.execute(PROBLEM_COUNTS_SQL, (limit,))]
+
+
+def _sorted_counts(counts):
+    return dict(sorted(counts.items(), key=lambda item: (-item[1], item[0])))
+
+
+def cross_tabs(conn):
+    """各选项计数、职业 × 问题、国家 × 问题（一次查询，一次遍历）"""
+    problems = {}
+    by_profession = {}
+    by_country = {}
+
+    for problem, profession, country, count in conn.execute(CROSS_TAB_SQL):
+        problems[problem] = problems.get(problem, 0) + count
+        row = by_profession.setdefault(profession, {})
+        row[problem] = row.get(problem, 0) + count
+        row = by_country.setdefault(country, {})
+        row[problem] = row.get(problem, 0) + count
+
+    return {
+        'problems': _sorted_counts(problems),
+        'profession_by_problem': {key: _sorted_counts(value) for key, value in sorted(by_profession.items())},
+        'country_by_problem': {key: _sorted_counts(value) for key, value in sorted(by_country.items())},
+    }
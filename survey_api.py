@@ -0,0 +1,178 @@
+# /api/surveys 的查询
+#
+# 合作方每天轮询这个接口，原来每次都返回全部历史数据：
+#   分页      ?after=<游标>&limit=，游标是上一页最后一行的 (created_at, id)，对客户端不透明；
+#             下一页直接从索引上的这个位置继续，不使用 OFFSET
+#   字段投影  ?fields=email,created_at，只查询需要的列，不需要的表不JOIN
+#   日期过滤  start_date/end_date 改写为 created_at 上的半开区间 [start 00:00:00, end+1天 00:00:00)，
+#             可以走 idx_surveys_created_at（原来的 date(created_at) 会让索引失效）
+#   总数      ?count=exact 精确计数（只扫描索引），?count=estimate 按id范围估算（两次索引查找），
+#             ?count=none 不计数；默认只在第一页返回精确总数
+
+import base64
+import binascii
+import datetime
+import json
+import os
+
+API_PAGE_SIZE = int(os.environ.get('API_PAGE_SIZE', 100))  # 每页默认条数
+API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', 1000))  # 每页最大条数
+
+# 字段名 -> (SQL表达式, 需要JOIN的表)
+API_FIELDS = {
+    'device_fingerprint': ('s.device_fingerprint', None),
+    'email': ('s.email', None),
+    'ip_address': ('u.ip_address', 'u'),
+    'has_used_digital_human': ('s.has_used_digital_human', None),
+    'problems': ('s.problems', None),
+    'profession': ('s.profession', None),
+    'custom_profession': ('s.custom_profession', None),
+    'created_at': ('s.created_at', None),
+    'exchange_code': ('c.code', 'c'),
+    'exchange_time': ('c.claimed_at', 'c'),
+    'code_used': ('c.is_used', 'c'),
+}
+
+JOINS = {
+    'u': 'LEFT JOIN users u ON s.device_fingerprint = u.device_fingerprint',
+    'c': 'LEFT JOIN codes c ON s.device_fingerprint = c.claimed_by_fingerprint',
+}
+
+
+class QueryError(ValueError):
+    """请求参数错误"""
+
+
+def encode_cursor(created_at, survey_id):
+    raw = json.dumps([created_at, survey_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, survey_id = json.loads(raw.decode('utf-8'))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise QueryError('after 参数无效')
+    if not isinstance(created_at, str) or not isinstance(survey_id, int):
+        raise QueryError('after 参数无效')
+    return created_at, survey_id
+
+
+def parse_fields(value):
+    """解析 fields 参数，未指定时返回全部字段"""
+    if not value:
+        return list(API_FIELDS)
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in API_FIELDS]
+    if unknown:
+        raise QueryError(f"未知字段: {', '.join(unknown)}")
+    return fields
+
+
+def parse_limit(value):
+    if value is None or value == '':
+        return API_PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        raise QueryError('limit 参数无效')
+    return max(1, min(limit, API_MAX_PAGE_SIZE))
+
+
+def date_range(start_date, end_date):
+    """把 YYYY-MM-DD 的日期参数转换为 created_at 上的半开区间条件"""
+    conditions = []
+    params = []
+    try:
+        if start_date:
+            start = datetime.datetime.strptime(start_date, '%Y-%m-%d')
+            conditions.append('s.created_at >= ?')
+            params.append(start.strftime('%Y-%m-%d 00:00:00'))
+        if end_date:
+            end = datetime.datetime.strptime(end_date, '%Y-%m-%d') + datetime.timedelta(days=1)
+            conditions.append('s.created_at < ?')
+            params.append(end.strftime('%Y-%m-%d 00:00:00'))
+    except ValueError:
+        raise QueryError('日期格式应为 YYYY-MM-DD')
+    return conditions, params
+
+
+def build_query(fields, conditions):
+    """生成分页查询SQL"""
+    joins = []
+    columns = ['s.id AS _id', 's.created_at AS _created_at']
+    for field in fields:
+        expression, table = API_FIELDS[field]
+        columns.append(f'{expression} AS {field}')
+        if table and JOINS[table] not in joins:
+            joins.append(JOINS[table])
+
+    sql = 'SELECT ' + ', '.join(columns) + ' FROM surveys s'
+    if joins:
+        sql += ' ' + ' '.join(joins)
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    return sql + ' ORDER BY s.created_at DESC, s.id DESC LIMIT ?'
+
+
+def build_count_query(conditions):
+    """精确计数的SQL"""
+    where = (' WHERE ' + ' AND '.join(conditions)) if conditions else ''
+    return 'SELECT COUNT(*) FROM surveys s' + where
+
+
+def count_surveys(conn, conditions, params, mode):
+    """统计符合日期条件的调研数：exact 精确计数，estimate 按id范围估算"""
+    where = (' WHERE ' + ' AND '.join(conditions)) if conditions else ''
+    if mode == 'exact':
+        return conn.execute(build_count_query(conditions), params).fetchone()[0]
+
+    # 调研按时间顺序写入，时间范围内第一条和最后一条的id之差就是行数的上限
+    first = conn.execute(f'SELECT s.id FROM surveys s{where} ORDER BY s.created_at, s.id LIMIT 1', params).fetchone()
+    if first is None:
+        return 0
+    last = conn.execute(f'SELECT s.id FROM surveys s{where} ORDER BY s.created_at DESC, s.id DESC LIMIT 1', params).fetchone()
+    return abs(last[0] - first[0]) + 1
+
+
+def query_surveys(conn, args):
+    """
+    按请求参数查询一页调研数据，返回响应中的数据部分：
+    {'data': [...], 'next_cursor': ..., 'has_more': ..., 'total': ..., 'total_is_estimate': ...}
+    """
+    fields = parse_fields(args.get('fields'))
+    limit = parse_limit(args.get('limit'))
+    after = args.get('after')
+    count = args.get('count') or ('exact' if not after else None)
+    if count not in (None, 'exact', 'estimate', 'none'):
+        raise QueryError('count 参数应为 exact、estimate 或 none')
+
+    conditions, params = date_range(args.get('start_date'), args.get('end_date'))
+    page_conditions = list(conditions)
+    page_params = list(params)
+    if after:
+        page_conditions.append('(s.created_at, s.id) < (?, ?)')
+        page_params.extend(decode_cursor(after))
+
+    # 多取一条判断是否还有下一页
+    rows = conn.execute(build_query(fields, page_conditions), page_params + [limit + 1]).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    data = []
+    for row in rows:
+        record = {field: row[field] for field in fields}
+        if 'code_used' in record and record['code_used'] is not None:
+            record['code_used'] = bool(record['code_used'])
+        data.append(record)
+
+    result = {
+        'data': data,
+        'next_cursor': encode_cursor(rows[-1]['_created_at'], rows[-1]['_id']) if has_more else None,
+        'has_more': has_more,
+    }
+    if count in ('exact', 'estimate'):
+        result['total'] = count_surveys(conn, conditions, params, count)
+        result['total_is_estimate'] = count == 'estimate'
+    return result
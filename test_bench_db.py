@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""测试规模基准：合成数据与计数器一致、增长阶数估算、与基线对比"""
+
+import os
+import sqlite3
+import tempfile
+
+import app as app_module
+from bench_db import compare, run_size, scaling, seed_database
+from counters import reconcile
+
+
+def test_seed_database():
+    """生成的数据经过触发器，计数器不需要修正"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'bench.db')
+        seed_database(path, 1000)
+        conn = sqlite3.connect(path)
+        counts = [conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                  for table in ('codes', 'users', 'surveys', 'ip_limits', 'survey_problems')]
+        assert counts == [1000, 500, 500, 1000, 1000]
+        assert conn.execute('SELECT COUNT(*) FROM codes WHERE is_used = TRUE').fetchone()[0] == 500
+        assert reconcile(conn, fix=False) == {}
+        conn.close()
+
+
+def test_run_size():
+    database_path, rate_limiter, rollup_events = app_module.DATABASE_PATH, app_module.rate_limiter, app_module.rollup_events
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        results, seed_seconds = run_size(1000, tmp_dir, 3, 1, 1000, None)
+        assert seed_seconds > 0
+        assert {'validate_claim_eligibility', 'process_claim', 'record_ip_attempt', 'admin_stats',
+                'api_get_survey_stats', 'export_codes', 'export_surveys_csv'} <= set(results)
+        assert all(stats['calls'] == 3 and stats['median_us'] > 0 for name, stats in results.items()
+                   if not name.startswith('export_') or name.endswith('_page'))
+
+        # 已生成的数据库直接复用；超过 full_max 的规模跳过全表导出
+        results, seed_seconds = run_size(1000, tmp_dir, 1, 1, 100, {'export_codes', 'admin_stats'})
+        assert seed_seconds == 0.0 and set(results) == {'admin_stats'}
+
+    # 运行结束后恢复 app 的全局对象
+    assert app_module.DATABASE_PATH == database_path and app_module.rate_limiter is rate_limiter
+    assert app_module.rollup_events is rollup_events
+
+
+def test_scaling_and_compare():
+    results = {
+        '1000': {'flat': {'median_us': 100.0}, 'linear': {'median_us': 1000.0},
+                 'ip_limits_checkpoint': {'median_us': 100.0}},
+        '100000': {'flat': {'median_us': 110.0}, 'linear': {'median_us': 100000.0},
+                   'ip_limits_checkpoint': {'median_us': 1000.0}},
+    }
+    orders = scaling(results)
+    assert orders['flat'] < 0.1 and orders['linear'] == 1.0
+    # 与表大小无关的函数不估算增长阶数
+    assert 'ip_limits_checkpoint' not in orders
+
+    baseline = {'results': results}
+    current = {'results': {
+        '1000': {'flat': {'median_us': 160.0}, 'linear': {'median_us': 1200.0}},
+        '100000': {'flat': {'median_us': 110.0}, 'linear': {'median_us': 300000.0}},
+    }}
+    # flat 超过阈值但绝对差值太小，不算回退
+    assert compare(current, baseline, 1.5, 200) == [('linear', 100000, 100000.0, 300000.0, 3.0)]
+
+
+if __name__ == "__main__":
+    test_seed_database()
+    test_run_size()
+    test_scaling_and_compare()
+    print("✅ 规模基准测试通过")
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""测试批量删除和批量重置：超过参数上限的列表、分批提交、变更日志"""
+
+import io
+import os
+import sqlite3
+import tempfile
+import threading
+
+from bulk_admin import delete_codes_where, delete_staged_codes, reset_users
+from change_log import read_changes
+from conftest import temp_app
+from counters import read_counters, reconcile
+from migrations import migrate
+
+
+def _seed(conn, users=0, codes=0):
+    conn.executemany('INSERT INTO codes (code) VALUES (?)', [(f'CODE{i}',) for i in range(codes)])
+    for i in range(users):
+        conn.execute('INSERT INTO users (device_fingerprint, email) VALUES (?, ?)', (f'fp{i}', f'u{i}@x.com'))
+        conn.execute('INSERT INTO surveys (device_fingerprint, email) VALUES (?, ?)', (f'fp{i}', f'u{i}@x.com'))
+        conn.execute('''
+            UPDATE codes SET is_used = TRUE, claimed_at = CURRENT_TIMESTAMP, claimed_by_fingerprint = ?
+            WHERE code = ?
+        ''', (f'fp{i}', f'CODE{i}'))
+    conn.commit()
+
+
+def test_bulk_delete():
+    """删除的兑换码数量超过SQLite参数上限，分批提交"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'gift_codes.db')
+        conn = sqlite3.connect(path)
+        migrate(conn)
+        _seed(conn, users=10, codes=5000)
+
+        codes = [f'CODE{i}' for i in range(0, 4000, 2)] + ['CODE0', 'MISSING', ' ']
+        assert delete_staged_codes(conn, iter(codes), chunk_size=300, pause=0) == 2000
+        assert conn.execute('SELECT COUNT(*) FROM codes').fetchone()[0] == 3000
+        assert conn.execute("SELECT name FROM sqlite_temp_master WHERE name = 'bulk_keys'").fetchone() is None
+
+        # 批与批之间其他连接可以写入
+        inserted = []
+
+        def writer():
+            other = sqlite3.connect(path, timeout=5)
+            for i in range(20):
+                other.execute('INSERT INTO codes (code) VALUES (?)', (f'NEW{i}',))
+                other.commit()
+                inserted.append(i)
+            other.close()
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        deleted = delete_codes_where(conn, 'delete_unused', chunk_size=100, pause=0.001)
+        thread.join()
+        assert len(inserted) == 20
+        assert deleted + conn.execute('SELECT COUNT(*) FROM codes WHERE is_used = FALSE').fetchone()[0] == 2995 + 20
+        assert delete_codes_where(conn, 'delete_used', chunk_size=3, pause=0) == 5
+        assert reconcile(conn, fix=False) == {}
+        conn.close()
+
+
+def test_bulk_reset():
+    """按设备指纹和邮箱批量重置，每个用户一条重置记录"""
+    conn = sqlite3.connect(':memory:')
+    migrate(conn)
+    _seed(conn, users=50, codes=60)
+
+    fingerprints = [f'fp{i}' for i in range(0, 20)]
+    emails = [f'u{i}@x.com' for i in range(15, 30)] + ['nobody@x.com']
+    result = reset_users(conn, fingerprints, emails, chunk_size=7, pause=0)
+    assert result == {'users': 30, 'codes': 30, 'surveys': 30, 'reset': 30}
+
+    counters = read_counters(conn)
+    assert counters['used_codes'] == 20 and counters['survey_count'] == 20
+    changes = read_changes(conn, 0, 100)
+    assert sorted(row[2] for row in changes) == sorted(f'fp{i}' for i in range(30))
+    assert reset_users(conn, ['fp0'], chunk_size=7, pause=0)['reset'] == 0
+
+
+def test_bulk_routes(app_module):
+    """上传文件删除兑换码、批量重置用户"""
+    conn = app_module.get_db_connection()
+    _seed(conn, users=5, codes=20)
+    conn.close()
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['admin_logged_in'] = True
+
+    upload = io.BytesIO('\n'.join(f'CODE{i}' for i in range(10, 15)).encode('utf-8'))
+    response = client.post('/admin/delete', data={'file': (upload, 'codes.txt')}, content_type='multipart/form-data')
+    assert response.get_json()['deleted_count'] == 5
+    # 上传文件时不能按条件删除，兑换码保持不变
+    upload = io.BytesIO(b'CODE17\n')
+    response = client.post('/admin/delete', data={'file': (upload, 'codes.txt'), 'action': 'delete_all'},
+                           content_type='multipart/form-data')
+    assert response.status_code == 400
+    response = client.post('/admin/delete?action=delete_unused', data='CODE17\n', content_type='text/plain')
+    assert response.status_code == 400
+    assert client.get('/admin/stats').get_json()['total_codes'] == 15
+    response = client.post('/admin/delete', json={'action': 'delete_specific', 'codes': ['CODE15', 'CODE16']})
+    assert response.get_json()['deleted_count'] == 2
+    assert client.post('/admin/delete', json={'action': 'delete_specific', 'codes': []}).status_code == 400
+
+    response = client.post('/admin/reset_users', json={'fingerprints': ['fp0', 'fp1'], 'emails': 'u2@x.com\nu9@x.com'})
+    assert response.get_json()['reset_count'] == 3
+    upload = io.BytesIO(b'u3@x.com\n')
+    response = client.post('/admin/reset_users', data={'file': (upload, 'emails.txt'), 'by': 'email'},
+                           content_type='multipart/form-data')
+    assert response.get_json()['released_codes'] == 1
+    assert client.post('/admin/reset_users', json={}).status_code == 400
+
+    response = client.post('/admin/reset_user', json={'fingerprint': 'fp4'})
+    assert response.get_json()['success']
+    assert client.get('/admin/stats').get_json()['used_codes'] == 0
+
+
+if __name__ == "__main__":
+    test_bulk_delete()
+    test_bulk_reset()
+    with temp_app() as app_module:
+        test_bulk_routes(app_module)
+    print("✅ 批量删除和重置测试通过")
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""测试增量变更接口：领取、重置与变更日志在同一事务中写入"""
+
+import json
+
+from conftest import temp_app
+
+SURVEY = {
+    'name': '张三', 'country': '中国', 'has_used_digital_human': 'no', 'problems': '成本',
+    'profession': 'teacher', 'custom_profession': ''
+}
+
+
+def _changes(client, since):
+    response = client.get(f'/api/surveys/changes?since={since}', headers={'Authorization': 'token'})
+    assert response.status_code == 200
+    records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    return records, int(response.headers['X-Next-Since'])
+
+
+def test_change_feed(app_module):
+    """测试增量变更接口"""
+    conn = app_module.get_db_connection()
+    conn.execute("INSERT INTO codes (code) VALUES ('CODE1')")
+    conn.commit()
+    conn.close()
+    client = app_module.app.test_client()
+
+    # 领取成功：新增调研 + 领取兑换码
+    app_module.process_claim('fp1', 'a@example.com', '1.1.1.1', 'ua', SURVEY)
+    records, since = _changes(client, 0)
+    assert [(r['type'], r['device_fingerprint']) for r in records] == [('survey', 'fp1'), ('claim', 'fp1')]
+    assert records[0]['email'] == 'a@example.com' and records[0]['name'] == '张三'
+    assert records[1]['code'] == 'CODE1'
+    assert since == records[-1]['seq']
+
+    # 兑换码领完时整体回滚，变更日志也不写入
+    app_module.process_claim('fp2', 'b@example.com', '1.1.1.1', 'ua', SURVEY)
+    assert _changes(client, since) == ([], since)
+
+    # 重置用户
+    with client.session_transaction() as session:
+        session['admin_logged_in'] = True
+    response = client.post('/admin/reset_user', json={'email': 'a@example.com'})
+    assert response.get_json()['success']
+    records, since = _changes(client, since)
+    assert [(r['type'], r['codes']) for r in records] == [('reset', ['CODE1'])]
+
+
+if __name__ == "__main__":
+    with temp_app() as app_module:
+        test_change_feed(app_module)
+    print("✅ 增量变更接口测试通过")
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""测试领取请求的组提交：合并提交、单个请求回滚不影响同批其他请求"""
+
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from claim_writer import ClaimWriter
+from code_dispenser import claim_code
+from conftest import temp_app
+from db import Rollback, pool
+from migrations import migrate
+
+SURVEY = {
+    'name': '张三', 'country': '中国', 'has_used_digital_human': 'no', 'problems': '成本',
+    'profession': 'teacher', 'custom_profession': ''
+}
+
+
+def test_group_commit():
+    """并发提交合并为少量批次，每个请求拿到自己的结果"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'gift_codes.db')
+        conn = sqlite3.connect(path)
+        migrate(conn)
+        conn.executemany('INSERT INTO codes (code) VALUES (?)', [(f'CODE{i}',) for i in range(32)])
+        conn.commit()
+
+        writer = ClaimWriter(lambda: pool.connection(path), batch_size=16, wait_ms=50)
+        results = {}
+
+        def work(i):
+            def claim(conn):
+                if i % 10 == 0:
+                    conn.execute("INSERT INTO users (device_fingerprint, email) VALUES ('x', 'x')")
+                    raise Rollback('rolled back')
+                if i % 10 == 1:
+                    raise ValueError('bad request')
+                return claim_code(conn, f'fp{i}')[0]
+            try:
+                results[i] = writer.submit(claim)
+            except ValueError as e:
+                results[i] = str(e)
+
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(40)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        claimed = [results[i] for i in range(40) if i % 10 > 1]
+        assert len(set(claimed)) == 32 and all(code.startswith('CODE') for code in claimed)
+        assert all(results[i] == 'rolled back' for i in range(0, 40, 10))
+        assert all(results[i] == 'bad request' for i in range(1, 40, 10))
+        assert conn.execute('SELECT COUNT(*) FROM users').fetchone()[0] == 0
+        assert conn.execute('SELECT COUNT(*) FROM codes WHERE is_used = TRUE').fetchone()[0] == 32
+
+        stats = writer.stats()
+        assert stats['jobs'] == 40 and stats['batches'] < 40 and stats['max_batch'] > 1
+        conn.close()
+
+
+def test_process_claim_with_writer(app_module):
+    """开启组提交后领取流程结果不变（包括兑换码领完时的回滚）"""
+    conn = app_module.get_db_connection()
+    conn.execute("INSERT INTO codes (code) VALUES ('CODE1')")
+    conn.commit()
+    conn.close()
+
+    # 测试结束后 app_module 夹具恢复原来的 claim_writer
+    app_module.claim_writer = ClaimWriter(lambda: app_module.get_db_connection())
+    _, _, result = app_module.process_claim('fp1', 'a@example.com', '1.1.1.1', 'ua', SURVEY)
+    assert result['success'] and result['code'] == 'CODE1'
+    is_eligible, _, result = app_module.process_claim('fp2', 'b@example.com', '1.1.1.1', 'ua', SURVEY)
+    assert is_eligible and not result['success']
+
+    conn = app_module.get_db_connection()
+    assert conn.execute('SELECT COUNT(*) FROM users').fetchone()[0] == 1
+    conn.close()
+
+
+def test_timeout():
+    """排队超时的请求不会再被执行；已经开始执行的请求等待真实的提交结果"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'gift_codes.db')
+        conn = sqlite3.connect(path)
+        migrate(conn)
+        conn.executemany('INSERT INTO codes (code) VALUES (?)', [('CODE1',), ('CODE2',)])
+        conn.commit()
+
+        writer = ClaimWriter(lambda: pool.connection(path), batch_size=1, wait_ms=0, timeout=0.1)
+        started = threading.Event()
+        results = {}
+
+        def slow_claim(conn):
+            started.set()
+            time.sleep(0.3)
+            return claim_code(conn, 'fp1')[0]
+
+        def first():
+            results['first'] = writer.submit(slow_claim)
+
+        thread = threading.Thread(target=first)
+        thread.start()
+        started.wait()
+        try:
+            writer.submit(lambda conn: claim_code(conn, 'fp2')[0])
+        except sqlite3.OperationalError as e:
+            results['second'] = str(e)
+        thread.join()
+
+        assert results['first'] == 'CODE1'
+        assert results['second'] == '等待领取写入超时'
+        time.sleep(0.1)
+        assert conn.execute('SELECT COUNT(*) FROM codes WHERE is_used = TRUE').fetchone()[0] == 1
+        assert writer.stats()['abandoned'] == 1
+        conn.close()
+
+
+def test_group_commit_flag_from_env_file():
+    """.env 中的 CLAIM_GROUP_COMMIT=0 不会开启组提交，=1 才开启"""
+    project_path = os.path.dirname(os.path.abspath(__file__))
+    for value, expected in (('0', 'None'), ('1', 'ClaimWriter')):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with open(os.path.join(tmp_dir, '.env'), 'w', encoding='utf-8') as f:
+                f.write(f'CLAIM_GROUP_COMMIT={value}\nDATABASE_PATH={os.path.join(tmp_dir, "gift_codes.db")}\n')
+            env = dict(os.environ, SHM_DIR=tmp_dir)
+            env.pop('CLAIM_GROUP_COMMIT', None)
+            output = subprocess.run(
+                [sys.executable, '-c', f'import sys; sys.path.insert(0, {project_path!r}); import app; '
+                                       'print(type(app.claim_writer).__name__ if app.claim_writer else None)'],
+                cwd=tmp_dir, env=env, capture_output=True, text=True, check=True
+            ).stdout.split()
+            assert output[-1] == expected
+
+
+if __name__ == "__main__":
+    test_group_commit()
+    with temp_app() as app_module:
+        test_process_claim_with_writer(app_module)
+    test_timeout()
+    test_group_commit_flag_from_env_file()
+    print("✅ 组提交测试通过")
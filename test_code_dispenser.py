@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""多进程并发领取兑换码压力测试：不应出现任何误报失败，也不应重复发放"""
+
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+
+from migrations import migrate
+
+
+def _claim_worker(db_path, worker_id, claims, start_event, result_queue):
+    """子进程：连续为不同设备领取兑换码"""
+    # 数据库和共享内存文件（版本号、限流等）都放在测试的临时目录，导入 app 之前设置
+    os.environ['DATABASE_PATH'] = db_path
+    os.environ['SHM_DIR'] = os.path.dirname(db_path)
+    import app as app_module
+
+    start_event.wait()
+    results = []
+    for i in range(claims):
+        result = app_module.assign_code_to_user(f'fp-{worker_id}-{i}')
+        results.append((result['success'], result['code'], result['message']))
+    result_queue.put(results)
+
+
+def run_claims(db_path, workers, claims_per_worker):
+    """启动多个进程同时领取，返回全部结果"""
+    ctx = multiprocessing.get_context('spawn')
+    start_event = ctx.Event()
+    result_queue = ctx.Queue()
+    processes = [
+        ctx.Process(target=_claim_worker, args=(db_path, w, claims_per_worker, start_event, result_queue))
+        for w in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    # 等待子进程完成导入后同时开始
+    time.sleep(1.5)
+    start_event.set()
+    results = []
+    for _ in processes:
+        results.extend(result_queue.get(timeout=120))
+    for process in processes:
+        process.join(30)
+
+    return results
+
+
+def seed_database(db_path, code_count):
+    """初始化数据库并导入兑换码（不修改本进程 app 的全局配置）"""
+    conn = sqlite3.connect(db_path)
+    migrate(conn)
+    conn.executemany('INSERT INTO codes (code) VALUES (?)', ((f'CODE{i:06d}',) for i in range(code_count)))
+    conn.commit()
+    conn.close()
+
+
+def test_concurrent_claims():
+    """
+    并发领取：零误报失败、兑换码不重复。
+    只检查正确性：写事务由 SQLite 串行执行，进程数增加不会提高领取吞吐量。
+    """
+    claims_per_worker = 50
+
+    for workers in (1, 2, 4):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, 'gift_codes.db')
+            seed_database(db_path, workers * claims_per_worker)
+
+            results = run_claims(db_path, workers, claims_per_worker)
+
+            failures = [r for r in results if not r[0]]
+            assert failures == [], failures[:5]
+            codes = [r[1] for r in results]
+            assert len(codes) == workers * claims_per_worker
+            assert len(set(codes)) == len(codes)
+
+            conn = sqlite3.connect(db_path)
+            used = conn.execute('SELECT COUNT(*) FROM codes WHERE is_used = TRUE').fetchone()[0]
+            conn.close()
+            assert used == len(codes)
+
+
+def test_exhausted_inventory():
+    """库存不足时多出来的请求得到“已领完”，而不是“已被占用”"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'gift_codes.db')
+        seed_database(db_path, 30)
+
+        results = run_claims(db_path, 4, 10)
+        successes = [r for r in results if r[0]]
+        failures = [r for r in results if not r[0]]
+        assert len(successes) == 30
+        assert len(set(r[1] for r in successes)) == 30
+        assert all(r[2] == '抱歉，兑换码已经全部领完了！' for r in failures)
+
+
+if __name__ == "__main__":
+    test_concurrent_claims()
+    test_exhausted_inventory()
+    print("✅ 并发领取测试通过")
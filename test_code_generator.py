@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""测试兑换码生成：字符集、长度、写入数量、自动补充"""
+
+import os
+import sqlite3
+import tempfile
+
+from conftest import temp_app
+from code_generator import CodeFactory, CodeRefiller, generate_codes
+from counters import read_counters
+from migrations import migrate
+
+
+def test_code_factory():
+    """只使用字符集中的字符，各字符出现频率接近"""
+    factory = CodeFactory('ABC', 8)
+    codes = factory.codes(2000)
+    assert len(set(codes)) == 2000
+    assert all(len(code) == 8 and set(code) <= set('ABC') for code in codes)
+
+    chars = factory.random_chars(30000)
+    for char in b'ABC':
+        assert 9000 < chars.count(char) < 11000
+
+    for alphabet, length in (('AA', 8), ('A', 8), ('AB,', 8), ('ABCD', 2)):
+        try:
+            CodeFactory(alphabet, length)
+            assert False
+        except ValueError:
+            pass
+
+
+def test_generate_and_refill():
+    """生成的兑换码写入数据库；剩余数量低于低水位时补充"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'gift_codes.db')
+        conn = sqlite3.connect(path)
+        migrate(conn)
+
+        progress = []
+        result = generate_codes(conn, 250, batch_size=100, on_progress=progress.append)
+        assert result == {'generated': 250, 'collisions': 0}
+        assert [item['generated'] for item in progress] == [100, 200, 250]
+        assert read_counters(conn)['total_codes'] == 250
+        assert conn.execute('SELECT COUNT(*) FROM codes WHERE length(code) = 16').fetchone()[0] == 250
+
+        # 编码空间太小时拒绝
+        try:
+            generate_codes(conn, 10, CodeFactory('0123456789', 6))
+            assert False
+        except ValueError:
+            pass
+
+        refiller = CodeRefiller(lambda: sqlite3.connect(path), os.path.join(tmp_dir, 'refill.lock'),
+                                low_water=100, refill_count=50)
+        assert refiller.refill() == 0
+        conn.execute('UPDATE codes SET is_used = TRUE WHERE id <= 200')
+        conn.commit()
+        assert refiller.refill() == 50
+        assert read_counters(conn)['remaining_codes'] == 100
+        assert refiller.stats()['refills'] == 1
+        conn.close()
+
+
+def test_generate_route(app_module):
+    """管理接口生成兑换码，参数错误返回400"""
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['admin_logged_in'] = True
+
+    response = client.post('/admin/generate', json={'count': 30, 'length': 12})
+    assert response.get_json()['generated_count'] == 30
+    response = client.post('/admin/generate?progress=1', json={'count': 5, 'alphabet': 'ABCDEFGHJKLMNPQRSTUVWXYZ23456789'})
+    assert response.get_data(as_text=True).splitlines()[-1].startswith('{"success": true')
+    assert client.get('/admin/stats').get_json()['total_codes'] == 35
+
+    assert client.post('/admin/generate', json={'count': 0}).status_code == 400
+    assert client.post('/admin/generate', json={'count': 'x'}).status_code == 400
+    assert client.post('/admin/generate', json={'count': 5, 'alphabet': 'AAB'}).status_code == 400
+
+
+if __name__ == "__main__":
+    test_code_factory()
+    test_generate_and_refill()
+    with temp_app() as app_module:
+        test_generate_route(app_module)
+    print("✅ 兑换码生成测试通过")
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""测试兑换码批量导入：分批写入、重复计数、文件上传和进度输出"""
+
+import io
+import json
+import sqlite3
+
+import code_import
+from code_import import import_codes, parse_lines, spool_stream, strip_lines, text_lines
+from conftest import temp_app
+from counters import read_counters
+from migrations import migrate
+
+
+def test_import_batches():
+    """重复的兑换码（已存在或同一批内）计入重复数，计数器同步更新"""
+    conn = sqlite3.connect(':memory:')
+    migrate(conn)
+    conn.execute("INSERT INTO codes (code) VALUES ('EXIST')")
+    conn.commit()
+
+    assert list(parse_lines(['\ufeffcode,batch', 'A1,x', '', '  "A2" ', 'A3'])) == ['A1', 'A2', 'A3']
+    assert list(strip_lines(['code', ' A1,x ', '', 'A3\r'])) == ['code', 'A1,x', 'A3']
+
+    progress = []
+    codes = [f'CODE{i}' for i in range(25)] + ['EXIST', 'CODE3']
+    result = import_codes(conn, iter(codes), batch_size=10, on_progress=progress.append)
+    assert result == {'processed': 27, 'imported': 25, 'duplicates': 2, 'done': True}
+    assert [item['processed'] for item in progress] == [10, 20, 27]
+    assert read_counters(conn)['total_codes'] == 26
+    assert not conn.in_transaction
+
+
+def test_import_rolls_back():
+    """中途出错时整批回滚"""
+    conn = sqlite3.connect(':memory:')
+    migrate(conn)
+
+    def codes():
+        yield from ('A', 'B', 'C')
+        raise ValueError('读取失败')
+
+    try:
+        import_codes(conn, codes(), batch_size=2)
+        assert False
+    except ValueError:
+        pass
+    assert conn.execute('SELECT COUNT(*) FROM codes').fetchone()[0] == 0
+
+
+def test_spool_stream():
+    """请求体先全部读完（超过阈值写入临时文件），之后按行读取不再访问原始流"""
+    source = io.BytesIO('\n'.join(f'S{i}' for i in range(1000)).encode('utf-8'))
+    previous = code_import.IMPORT_SPOOL_MAX_SIZE
+    code_import.IMPORT_SPOOL_MAX_SIZE = 100
+    try:
+        spooled = spool_stream(source)
+    finally:
+        code_import.IMPORT_SPOOL_MAX_SIZE = previous
+    assert source.read() == b''
+    assert spooled._rolled
+    codes = list(parse_lines(text_lines(spooled)))
+    assert len(codes) == 1000 and codes[0] == 'S0' and codes[-1] == 'S999'
+
+
+def test_import_routes(app_module):
+    """JSON、文件上传、请求体三种方式导入，progress=1 时逐批返回进度"""
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['admin_logged_in'] = True
+
+    response = client.post('/admin/import', json={'codes': 'J1\nJ2\nJ1'})
+    assert response.get_json()['imported_count'] == 2 and response.get_json()['duplicate_count'] == 1
+    assert client.post('/admin/import', json={'codes': ' \n '}).status_code == 400
+
+    # JSON 和 text/plain 不按CSV拆分，兑换码中的逗号原样保留
+    response = client.post('/admin/import', json={'codes': 'code\nC,1'})
+    assert response.get_json()['imported_count'] == 2
+    response = client.post('/admin/import', data='P,1\n', content_type='text/plain')
+    assert response.get_json()['imported_count'] == 1
+    conn = app_module.get_db_connection()
+    try:
+        codes = {row[0] for row in conn.execute("SELECT code FROM codes WHERE code IN ('code', 'C,1', 'P,1')")}
+    finally:
+        conn.close()
+    assert codes == {'code', 'C,1', 'P,1'}
+
+    upload = io.BytesIO('code\nF1\nF2\nJ1\n'.encode('utf-8'))
+    response = client.post('/admin/import', data={'file': (upload, 'codes.csv')}, content_type='multipart/form-data')
+    assert response.get_json()['imported_count'] == 2 and response.get_json()['duplicate_count'] == 1
+
+    version = app_module.data_version.current()
+    body = '\n'.join(f'T{i}' for i in range(120))
+    response = client.post('/admin/import?progress=1', data=body, content_type='text/plain')
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert lines[0]['processed'] == 120
+    assert lines[-1]['imported_count'] == 120 and lines[-1]['success']
+    assert app_module.data_version.current() != version
+
+    assert client.get('/admin/stats').get_json()['total_codes'] == 127
+
+
+if __name__ == "__main__":
+    test_import_batches()
+    test_import_rolls_back()
+    test_spool_stream()
+    with temp_app() as app_module:
+        test_import_routes(app_module)
+    print("✅ 兑换码导入测试通过")
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""测试只读接口的ETag / 304：数据没变时不执行查询，写操作后ETag改变"""
+
+import os
+import tempfile
+
+from conftest import temp_app
+from data_version import DataVersion
+
+SURVEY = {
+    'name': '张三', 'country': '中国', 'has_used_digital_human': 'no', 'problems': '成本',
+    'profession': 'teacher', 'custom_profession': ''
+}
+API_HEADERS = {'Authorization': 'token'}
+
+
+def test_data_version():
+    """版本号递增，新的共享内存文件使用新的纪元"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        version = DataVersion(os.path.join(tmp_dir, 'a.bin'))
+        first = version.current()
+        version.bump()
+        assert version.current() != first
+        assert DataVersion(os.path.join(tmp_dir, 'a.bin')).current() == version.current()
+        assert DataVersion(os.path.join(tmp_dir, 'b.bin')).current().split('-')[0] != first.split('-')[0]
+
+
+def test_not_modified(app_module):
+    """数据没变返回304，写操作后重新返回数据"""
+    client = app_module.app.test_client()
+
+    response = client.get('/api/surveys?limit=10', headers=API_HEADERS)
+    etag = response.headers['ETag']
+    assert response.status_code == 200 and etag
+
+    response = client.get('/api/surveys?limit=10', headers=dict(API_HEADERS, **{'If-None-Match': etag}))
+    assert response.status_code == 304 and response.data == b''
+    assert response.headers['Access-Control-Allow-Origin'] == '*'
+
+    # 参数不同，ETag不同
+    response = client.get('/api/surveys?limit=20', headers=dict(API_HEADERS, **{'If-None-Match': etag}))
+    assert response.status_code == 200 and response.headers['ETag'] != etag
+
+    # 导入兑换码后版本号变化
+    with client.session_transaction() as session:
+        session['admin_logged_in'] = True
+    stats_etag = client.get('/admin/stats').headers['ETag']
+    assert client.get('/admin/stats', headers={'If-None-Match': stats_etag}).status_code == 304
+    client.post('/admin/import', json={'codes': 'CODE1\nCODE2'})
+    response = client.get('/admin/stats', headers={'If-None-Match': stats_etag})
+    assert response.status_code == 200 and response.get_json()['total_codes'] == 2
+
+    # 领取后调研接口返回新数据
+    app_module.process_claim('fp1', 'a@example.com', '1.1.1.1', 'ua', SURVEY)
+    response = client.get('/api/surveys?limit=10', headers=dict(API_HEADERS, **{'If-None-Match': etag}))
+    assert response.status_code == 200 and len(response.get_json()['data']) == 1
+
+    # 统计汇总写入只让时间序列的ETag失效
+    etag = client.get('/api/surveys?limit=10', headers=API_HEADERS).headers['ETag']
+    series_url = '/api/surveys/stats?granularity=day'
+    series_etag = client.get(series_url, headers=API_HEADERS).headers['ETag']
+    app_module.rollup_events.record('rejections')
+    assert app_module.rollup_events.flush() == 1
+    response = client.get('/api/surveys?limit=10', headers=dict(API_HEADERS, **{'If-None-Match': etag}))
+    assert response.status_code == 304
+    response = client.get(series_url, headers=dict(API_HEADERS, **{'If-None-Match': series_etag}))
+    assert response.status_code == 200
+
+    stats = app_module.conditional_get.stats()
+    assert stats['api_surveys']['not_modified'] >= 1 and stats['admin_stats']['not_modified'] >= 1
+
+
+if __name__ == "__main__":
+    test_data_version()
+    with temp_app() as app_module:
+        test_not_modified(app_module)
+    print("✅ ETag测试通过")
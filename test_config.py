@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""测试 .env 配置：在其他模块导入之前加载，模块级配置同样生效"""
+
+import os
+import subprocess
+import sys
+import tempfile
+
+from config import load_env_file
+
+PROJECT_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_load_env_file():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, '.env')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('# 注释\nTEST_CONFIG_KEY=a=b\n\nTEST_CONFIG_OTHER=1\n')
+        try:
+            assert load_env_file(path) == {'TEST_CONFIG_KEY': 'a=b', 'TEST_CONFIG_OTHER': '1'}
+            assert os.environ['TEST_CONFIG_KEY'] == 'a=b'
+        finally:
+            os.environ.pop('TEST_CONFIG_KEY', None)
+            os.environ.pop('TEST_CONFIG_OTHER', None)
+        assert load_env_file(os.path.join(tmp_dir, 'missing')) == {}
+
+
+def test_module_settings_from_env_file():
+    """.env 中的 DB_*、BULK_*、CODE_* 等配置在导入 app 时生效"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with open(os.path.join(tmp_dir, '.env'), 'w', encoding='utf-8') as f:
+            f.write(f'DATABASE_PATH={os.path.join(tmp_dir, "gift_codes.db")}\n'
+                    'DB_BUSY_TIMEOUT=1234\nBULK_CHUNK_SIZE=77\nCODE_LENGTH=20\nIP_HOURLY_LIMIT=9\n')
+        env = dict(os.environ, SHM_DIR=tmp_dir)
+        for key in ('DB_BUSY_TIMEOUT', 'BULK_CHUNK_SIZE', 'CODE_LENGTH', 'IP_HOURLY_LIMIT', 'DATABASE_PATH'):
+            env.pop(key, None)
+        script = (f'import sys; sys.path.insert(0, {PROJECT_PATH!r}); import app, db, bulk_admin, code_generator; '
+                  'print(db.pool.busy_timeout, bulk_admin.BULK_CHUNK_SIZE, code_generator.CODE_LENGTH, '
+                  'app.IP_HOURLY_LIMIT)')
+        output = subprocess.run([sys.executable, '-c', script], cwd=tmp_dir, env=env,
+                                capture_output=True, text=True, check=True).stdout.split()
+        assert output[-4:] == ['1234', '77', '20', '9']
+
+
+if __name__ == "__main__":
+    test_load_env_file()
+    test_module_settings_from_env_file()
+    print("✅ 配置加载测试通过")
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""测试物化计数器：触发器维护的计数与实际数据一致，reconcile 能发现并修正偏差"""
+
+import sqlite3
+
+from code_dispenser import claim_code
+from counters import read_counters, reconcile
+from migrations import _initial_schema, migrate
+
+
+def _actual(conn):
+    total, used, surveys = conn.execute('''
+        SELECT (SELECT COUNT(*) FROM codes), (SELECT COUNT(*) FROM codes WHERE is_used = TRUE),
+               (SELECT COUNT(*) FROM surveys)
+    ''').fetchone()
+    return {'total_codes': total, 'used_codes': used, 'remaining_codes': total - used, 'survey_count': surveys}
+
+
+def test_counters_follow_writes():
+    """导入、领取、重置、删除后计数器与实际数据一致"""
+    conn = sqlite3.connect(':memory:')
+    # 已有数据的旧数据库，迁移时用现有数据初始化计数器
+    _initial_schema(conn.cursor())
+    conn.executemany('INSERT INTO codes (code, is_used) VALUES (?, ?)', [(f'OLD{i}', i < 2) for i in range(5)])
+    conn.commit()
+    migrate(conn)
+    assert read_counters(conn) == _actual(conn)
+
+    conn.executemany('INSERT INTO codes (code) VALUES (?)', [(f'CODE{i}',) for i in range(10)])
+    conn.executemany('INSERT INTO surveys (device_fingerprint, email) VALUES (?, ?)', [(f'fp{i}', f'{i}@x.com') for i in range(3)])
+    conn.commit()
+    for i in range(3):
+        claim_code(conn, f'fp{i}')
+    assert read_counters(conn) == _actual(conn)
+
+    # 重置用户、删除兑换码
+    conn.execute('UPDATE codes SET is_used = FALSE, claimed_by_fingerprint = NULL WHERE claimed_by_fingerprint = ?', ('fp0',))
+    conn.execute('DELETE FROM surveys WHERE device_fingerprint = ?', ('fp0',))
+    conn.execute('DELETE FROM codes WHERE is_used = TRUE')
+    conn.commit()
+    counters = read_counters(conn)
+    assert counters == _actual(conn)
+    assert counters['survey_count'] == 2 and counters['used_codes'] == 0
+
+
+def test_reconcile():
+    """reconcile 报告并修正偏差"""
+    conn = sqlite3.connect(':memory:')
+    migrate(conn)
+    conn.executemany('INSERT INTO codes (code) VALUES (?)', [(f'CODE{i}',) for i in range(4)])
+    conn.commit()
+    assert reconcile(conn) == {}
+
+    conn.execute('UPDATE counters SET total_codes = 100, survey_count = 7 WHERE id = 1')
+    conn.commit()
+    assert reconcile(conn, fix=False) == {'total_codes': (100, 4), 'survey_count': (7, 0)}
+    assert read_counters(conn)['total_codes'] == 100
+    assert reconcile(conn) == {'total_codes': (100, 4), 'survey_count': (7, 0)}
+    assert read_counters(conn) == _actual(conn)
+
+
+if __name__ == "__main__":
+    test_counters_follow_writes()
+    test_reconcile()
+    print("✅ 物化计数器测试通过")
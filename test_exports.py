@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""测试流式导出（分批读取结果与一次性查询一致）"""
+
+import csv
+import io
+import json
+import os
+import sqlite3
+import tempfile
+
+from exports import iter_codes, iter_surveys, json_array_stream, ndjson_stream, survey_csv_stream
+from migrations import migrate
+
+
+def _connect(path):
+    def connect():
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        return conn
+    return connect
+
+
+def _seed(path):
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    conn.executemany('INSERT INTO codes (code, is_used, claimed_by_fingerprint) VALUES (?, ?, ?)', [
+        (f'CODE{i}', i < 40, f'fp{i}' if i < 40 else None) for i in range(100)
+    ])
+    conn.executemany('INSERT INTO users (device_fingerprint, email, ip_address) VALUES (?, ?, ?)', [
+        (f'fp{i}', f'u{i}@example.com', '1.1.1.1') for i in range(40)
+    ])
+    # 多条调研提交时间相同，检查游标不会漏行或重复
+    conn.executemany('INSERT INTO surveys (device_fingerprint, email, name, created_at) VALUES (?, ?, ?, ?)', [
+        (f'fp{i}', f'u{i}@example.com', f'名字{i}', f'2024-01-0{1 + i % 3} 10:00:00') for i in range(40)
+    ])
+    conn.commit()
+    conn.close()
+
+
+def test_exports():
+    """测试流式导出"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'gift_codes.db')
+        _seed(path)
+        connect = _connect(path)
+
+        # 兑换码：分批读取与一次性读取一致
+        codes = [record for chunk in iter_codes(connect, chunk_size=7) for record in chunk]
+        assert [record['code'] for record in codes] == [f'CODE{i}' for i in range(100)]
+        assert codes[0]['email'] == 'u0@example.com' and codes[99]['email'] is None
+
+        # 调研数据：按提交时间倒序、同一时间按id倒序，无重复无遗漏
+        surveys = [record for chunk in iter_surveys(connect, chunk_size=4) for record in chunk]
+        conn = sqlite3.connect(path)
+        expected = [row[0] for row in conn.execute('SELECT name FROM surveys ORDER BY created_at DESC, id DESC')]
+        conn.close()
+        assert [record['name'] for record in surveys] == expected
+        assert surveys[0]['code'] is not None
+
+        # JSON数组和NDJSON
+        assert json.loads(''.join(json_array_stream(iter_codes(connect, chunk_size=7)))) == codes
+        assert json.loads(''.join(json_array_stream([]))) == []
+        lines = ''.join(ndjson_stream(iter_codes(connect, chunk_size=7))).splitlines()
+        assert [json.loads(line) for line in lines] == codes
+
+        # CSV：带BOM和表头
+        content = ''.join(survey_csv_stream(iter_surveys(connect, chunk_size=4)))
+        assert content.startswith('\ufeff设备指纹')
+        rows = list(csv.reader(io.StringIO(content.lstrip('\ufeff'))))
+        assert len(rows) == 41
+        assert [row[2] for row in rows[1:]] == expected
+
+
+if __name__ == "__main__":
+    test_exports()
+    print("✅ 流式导出测试通过")
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""测试IP语言检测缓存（TTL、LRU淘汰、跨进程共享）"""
+
+import multiprocessing
+import os
+import tempfile
+import time
+
+from geo_cache import IPLanguageCache
+
+
+def _child_set(path, ip, language):
+    """子进程写入缓存"""
+    IPLanguageCache(path=path).set(ip, language)
+
+
+def test_geo_cache():
+    """测试IP语言检测缓存"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'geo_cache.db')
+
+        # 基本读写
+        cache = IPLanguageCache(path=path, ttl=60, failure_ttl=1)
+        assert cache.get('1.2.4.8') is None
+        cache.set('1.2.4.8', 'zh')
+        assert cache.get('1.2.4.8') == 'zh'
+
+        # 失败结果使用更短的TTL
+        cache.set('9.9.9.9', 'en', is_failure=True)
+        assert cache.get('9.9.9.9') == 'en'
+        time.sleep(1.1)
+        assert cache.get('9.9.9.9') is None
+        assert cache.get('1.2.4.8') == 'zh'
+
+        # 其他进程写入的结果对本进程可见
+        ctx = multiprocessing.get_context('spawn')
+        child = ctx.Process(target=_child_set, args=(path, '8.8.8.8', 'en'))
+        child.start()
+        child.join(30)
+        assert child.exitcode == 0
+        assert IPLanguageCache(path=path).get('8.8.8.8') == 'en'
+
+        stats = cache.stats()
+        assert stats['hits'] >= 3
+        assert stats['misses'] >= 2
+        print(f"   缓存统计: {stats}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # 超出容量时按LRU淘汰
+        path = os.path.join(tmp_dir, 'geo_cache.db')
+        cache = IPLanguageCache(path=path, max_entries=32, local_entries=8)
+        for i in range(64):
+            cache.set(f'10.0.0.{i}', 'en')
+
+        stats = cache.stats()
+        assert stats['entries'] == 32
+        assert stats['evictions'] == 32
+        # 最早写入的条目被淘汰，最近写入的保留
+        fresh = IPLanguageCache(path=path)
+        assert fresh.get('10.0.0.0') is None
+        assert fresh.get('10.0.0.63') == 'en'
+
+
+if __name__ == "__main__":
+    test_geo_cache()
+    print("✅ IP语言检测缓存测试通过")
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""使用本地模拟服务器测试在线IP查询客户端（连接复用、熔断、请求合并）"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from geo_provider import CircuitBreaker, GeoProviderClient
+
+
+class FakeGeoHandler(BaseHTTPRequestHandler):
+    """模拟 ip-api.com：根据 server.mode 返回正常结果、错误或慢响应"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.hits += 1
+            server.peers.add(self.client_address)
+
+        if server.delay:
+            time.sleep(server.delay)
+
+        if server.mode == 'error':
+            body = b'{"status": "fail"}'
+            self.send_response(500)
+        else:
+            ip = self.path.split('/')[-1].split('?')[0]
+            country = 'CN' if ip.startswith('1.2.') else 'US'
+            body = json.dumps({'status': 'success', 'countryCode': country}).encode()
+            self.send_response(200)
+
+        try:
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端超时后已断开连接
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeGeoHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.mode = 'ok'
+    server.delay = 0
+    server.hits = 0
+    server.peers = set()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_client(server, **breaker_options):
+    url = f'http://127.0.0.1:{server.server_address[1]}/json/{{ip}}'
+    breaker = CircuitBreaker(**breaker_options)
+    return GeoProviderClient(url=url, budget=0.5, pool_size=4, breaker=breaker)
+
+
+def test_keep_alive_pool():
+    """连续查询复用同一个keep-alive连接"""
+    server = start_fake_server()
+    try:
+        client = make_client(server)
+        for i in range(20):
+            assert client.lookup_country(f'8.8.8.{i}') == 'US'
+        assert client.lookup_country('1.2.4.8') == 'CN'
+        assert server.hits == 21
+        assert len(server.peers) == 1
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_breaker_trips_and_recovers():
+    """连续失败后熔断、快速失败，冷却后试探成功即恢复"""
+    server = start_fake_server()
+    try:
+        client = make_client(server, failure_threshold=3, slow_call_threshold=0.2, reset_timeout=0.5)
+
+        server.mode = 'error'
+        for _ in range(3):
+            assert client.lookup_country('8.8.8.8') is None
+        assert client.breaker.state == CircuitBreaker.OPEN
+        assert server.hits == 3
+
+        # 熔断期间不再访问服务器，立即返回
+        start = time.monotonic()
+        for _ in range(50):
+            assert client.lookup_country('8.8.4.4') is None
+        assert time.monotonic() - start < 0.1
+        assert server.hits == 3
+        assert client.stats()['short_circuited'] == 50
+
+        # 冷却期过后，若服务仍然异常，试探失败会重新熔断
+        time.sleep(0.6)
+        assert client.breaker.state == CircuitBreaker.HALF_OPEN
+        assert client.lookup_country('8.8.8.8') is None
+        assert client.breaker.state == CircuitBreaker.OPEN
+        assert server.hits == 4
+
+        # 服务恢复后，试探请求成功即关闭熔断器
+        server.mode = 'ok'
+        time.sleep(0.6)
+        assert client.lookup_country('8.8.8.8') == 'US'
+        assert client.breaker.state == CircuitBreaker.CLOSED
+        assert client.lookup_country('1.2.4.8') == 'CN'
+        assert client.breaker.stats()['trips'] == 2
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_slow_calls_trip_breaker():
+    """慢调用和超时同样计入失败"""
+    server = start_fake_server()
+    try:
+        client = make_client(server, failure_threshold=2, slow_call_threshold=0.1, reset_timeout=30)
+
+        server.delay = 0.15
+        assert client.lookup_country('8.8.8.8') == 'US'
+        assert client.lookup_country('8.8.8.8') == 'US'
+        assert client.breaker.state == CircuitBreaker.OPEN
+
+        client = make_client(server, failure_threshold=1, slow_call_threshold=0.4, reset_timeout=30)
+        server.delay = 0.8
+        start = time.monotonic()
+        assert client.lookup_country('8.8.8.8') is None
+        # 超过延迟预算（0.5秒）立即放弃
+        assert time.monotonic() - start < 0.75
+        assert client.stats()['timeouts'] == 1
+        assert client.breaker.state == CircuitBreaker.OPEN
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_singleflight_coalescing():
+    """并发查询同一IP只发出一次请求"""
+    server = start_fake_server()
+    try:
+        client = make_client(server, slow_call_threshold=5)
+        server.delay = 0.3
+
+        results = []
+        barrier = threading.Barrier(10)
+
+        def worker():
+            barrier.wait()
+            results.append(client.lookup_country('1.2.3.4'))
+
+        threads = [threading.Thread(target=worker) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results == ['CN'] * 10
+        assert server.hits == 1
+        assert client.stats()['coalesced'] == 9
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    test_keep_alive_pool()
+    test_breaker_trips_and_recovers()
+    test_slow_calls_trip_breaker()
+    test_singleflight_coalescing()
+    print("✅ 在线IP查询客户端测试通过")
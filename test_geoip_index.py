@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""测试离线IP库的构建和查询"""
+
+import os
+import tempfile
+import time
+
+from build_geoip import build
+from geo_cache import IPLanguageCache
+from language import LanguageSupport
+
+SAMPLE_CSV = '''start_ip,end_ip,country
+# 注释行会被跳过
+1.0.1.0,1.0.3.255,CN
+1.0.4.0,1.0.7.255,AU
+1.0.8.0,1.0.15.255,CN
+8.8.8.0,8.8.8.255,US
+16777216,16777471,AU
+165.21.0.0,165.21.255.255,SG
+202.175.0.0,202.175.127.255,MO
+240e::,240e:ffff:ffff:ffff:ffff:ffff:ffff:ffff,CN
+2001:4860::,2001:4860:ffff:ffff:ffff:ffff:ffff:ffff,US
+10.0.0.0,10.255.255.255,ZZ
+'''
+
+
+def test_geoip_index():
+    """测试离线IP库的构建和查询"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, 'ranges.csv')
+        bin_path = os.path.join(tmp_dir, 'ip_country.bin')
+        with open(csv_path, 'w', encoding='utf-8') as f:
+            f.write(SAMPLE_CSV)
+
+        v4_count, v6_count, skipped = build([csv_path], bin_path)
+        # 1.0.1.0-1.0.3.255 与 1.0.8.0-1.0.15.255 不相邻，不会合并
+        assert v4_count == 7
+        assert v6_count == 2
+        # 表头与ZZ行被跳过
+        assert skipped == 2
+
+        support = LanguageSupport()
+        support.cache = IPLanguageCache(path=os.path.join(tmp_dir, 'geo_cache.db'))
+        index = support.load_geoip(bin_path)
+        assert index is not None
+
+        test_cases = [
+            # (IP地址, 期望国家码, 期望语言)
+            ("1.0.1.1", "CN", "zh"),
+            ("1.0.0.5", "AU", "en"),
+            ("1.0.5.9", "AU", "en"),
+            ("8.8.8.8", "US", "en"),
+            ("165.21.83.245", "SG", "en"),
+            ("202.175.3.3", "MO", "zh"),
+            ("240e:3b0::1", "CN", "zh"),
+            ("2001:4860:4860::8888", "US", "en"),
+            ("::ffff:1.0.2.3", "CN", "zh"),
+        ]
+
+        for ip, expected_country, expected_lang in test_cases:
+            assert index.lookup(ip) == expected_country, ip
+            assert support.detect_language_from_ip(ip) == expected_lang, ip
+
+        # 未收录的段、内网地址、非法输入
+        assert index.lookup("9.9.9.9") is None
+        assert index.lookup("10.1.2.3") is None
+        assert index.lookup("0.0.0.0") is None
+        assert index.lookup("not-an-ip") is None
+        assert support.detect_language_from_ip("10.1.2.3") == 'en'
+
+        # 查询耗时应在微秒级
+        rounds = 20000
+        start = time.perf_counter()
+        for _ in range(rounds):
+            index.lookup("165.21.83.245")
+        per_lookup = (time.perf_counter() - start) / rounds
+        print(f"   单次查询耗时: {per_lookup * 1e6:.2f} µs")
+        assert per_lookup < 0.001
+
+        index.close()
+
+
+if __name__ == "__main__":
+    test_geoip_index()
+    print("✅ 离线IP库测试通过")
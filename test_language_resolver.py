@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""测试分级语言识别流水线"""
+
+from language_resolver import LanguageResolver, parse_accept_language
+
+
+class FakeRequest:
+    def __init__(self, headers=None, method='GET', path='/'):
+        self.headers = headers or {}
+        self.method = method
+        self.path = path
+
+
+class FakeSupport:
+    """记录每一级IP查询的调用，模拟缓存/离线库/在线查询"""
+
+    def __init__(self, cached=None, local=None, remote='en'):
+        self.cached = cached
+        self.local = local
+        self.remote = remote
+        self.calls = []
+
+    def detect_language_cached(self, ip):
+        self.calls.append('cache')
+        return self.cached
+
+    def detect_language_local(self, ip):
+        self.calls.append('local')
+        return self.local
+
+    def detect_language_remote(self, ip):
+        self.calls.append('remote')
+        return self.remote
+
+
+BROWSER = 'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15'
+
+
+def test_parse_accept_language():
+    """测试 Accept-Language 解析"""
+    supported = ('zh', 'en')
+    assert parse_accept_language('zh-CN,zh;q=0.9,en;q=0.8', supported) == 'zh'
+    assert parse_accept_language('en-US,en;q=0.9,zh-CN;q=0.8', supported) == 'en'
+    assert parse_accept_language('fr-FR,fr;q=0.9,zh-TW;q=0.5', supported) == 'zh'
+    assert parse_accept_language('ja;q=1.0, en;q=0', supported) is None
+    assert parse_accept_language('*', supported) is None
+    assert parse_accept_language('', supported) is None
+
+
+def test_resolver_stages():
+    """测试各级按顺序短路"""
+    def ip_getter():
+        return '8.8.8.8'
+
+    # session 优先
+    support = FakeSupport()
+    resolver = LanguageResolver(support)
+    request = FakeRequest({'User-Agent': BROWSER, 'Accept-Language': 'en-US'})
+    assert resolver.resolve(request, {'language': 'zh'}, ip_getter) == ('zh', 'session')
+
+    # Accept-Language 命中，不做任何IP查询
+    assert resolver.resolve(request, {}, ip_getter) == ('en', 'accept_language')
+    assert support.calls == []
+
+    # 爬虫、HEAD请求、非HTML请求直接使用默认语言
+    bot = FakeRequest({'User-Agent': 'Googlebot/2.1 (+http://www.google.com/bot.html)'})
+    assert resolver.resolve(bot, {}, ip_getter) == ('en', 'policy')
+    head = FakeRequest({'User-Agent': BROWSER}, method='HEAD')
+    assert resolver.resolve(head, {}, ip_getter) == ('en', 'policy')
+    api = FakeRequest({'User-Agent': BROWSER, 'Accept': 'application/json'})
+    assert resolver.resolve(api, {}, ip_getter) == ('en', 'policy')
+    assert support.calls == []
+
+    # 没有更便宜的信号时才依次查询缓存、离线库、在线接口
+    browser = FakeRequest({'User-Agent': BROWSER, 'Accept': 'text/html,*/*'})
+    support = FakeSupport(cached=None, local='zh')
+    resolver = LanguageResolver(support)
+    assert resolver.resolve(browser, {}, ip_getter) == ('zh', 'geo_local')
+    assert support.calls == ['cache', 'local']
+
+    support = FakeSupport(cached='zh')
+    resolver = LanguageResolver(support)
+    assert resolver.resolve(browser, {}, ip_getter) == ('zh', 'geo_cache')
+    assert support.calls == ['cache']
+
+    support = FakeSupport(remote='zh')
+    resolver = LanguageResolver(support)
+    assert resolver.resolve(browser, {}, ip_getter) == ('zh', 'geo_remote')
+    assert support.calls == ['cache', 'local', 'remote']
+
+    stats = resolver.stats()
+    assert stats['stages']['geo_remote']['hits'] == 1
+    assert stats['stages']['session']['calls'] == 1
+    assert stats['stages']['session']['hits'] == 0
+
+
+if __name__ == "__main__":
+    test_parse_accept_language()
+    test_resolver_stages()
+    print("✅ 分级语言识别测试通过")
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""测试端到端压测：多进程跑完整个领取流程，结果分类和统计正确"""
+
+from loadtest import build_users, classify, run_load_test
+
+
+def test_build_users():
+    """重复领取的用户总是排在对应的新用户之后"""
+    users = build_users(0, 500, 1, 0.2, 0.1, 3)
+    seen = set()
+    for scenario, index in users:
+        if scenario == 'new':
+            seen.add(index)
+        elif scenario == 'repeat':
+            assert index in seen
+        else:
+            assert 0 <= index < 3
+    assert {scenario for scenario, _ in users} == {'new', 'repeat', 'offender'}
+    assert users == build_users(0, 500, 1, 0.2, 0.1, 3)
+
+
+def test_classify():
+    assert classify(200, '<div id="exchangeCode">\n   ABC123\n  </div>') == ('success', 'ABC123')
+    assert classify(200, '<h2>抱歉，兑换码已经全部领完了！</h2>') == ('sold_out', None)
+    assert classify(200, '<p>请求过于频繁，请稍后再试</p>') == ('rate_limited', None)
+    assert classify(500, '') == ('http_500', None)
+
+
+def test_load_test_run():
+    """兑换码少于用户数：先到的领取成功，之后显示已领完，没有重复发放"""
+    report = run_load_test(processes=2, threads=2, users=80, codes=50, repeat_ratio=0.1,
+                           offender_ratio=0.1, offender_ips=2)
+    outcomes = report['outcomes']
+    claimed = sum(counts.get('claimed', 0) for counts in outcomes.values())
+    assert claimed == 50
+    assert outcomes['new'].get('sold_out', 0) > 0
+    assert set(outcomes['repeat']) <= {'already_claimed', 'sold_out'}
+    assert report['duplicate_codes'] == 0
+    assert set(report['transaction_busy']) == {'busy_retries', 'busy_failures'}
+    # 没有 Accept-Language 的用户经过IP地理位置查询（本地假接口）
+    assert report['geo_calls'] > 0
+    assert report['latency']['/submit_survey']['count'] == 80
+    assert report['throughput']['requests_per_sec'] > 0
+    assert report['errors'] == {}
+
+
+if __name__ == "__main__":
+    test_build_users()
+    test_classify()
+    test_load_test_run()
+    print("✅ 端到端压测测试通过")
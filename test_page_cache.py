@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""测试服务端翻译渲染与静态页面缓存"""
+
+import os
+import tempfile
+
+import app as app_module
+from language import flatten_translations, lang
+from page_cache import PageCache
+
+
+def test_flattened_translations():
+    """展开后的索引与逐层查找结果一致"""
+    index = flatten_translations({'survey': {'title': '调研', 'questions': {'q1': '问题1'}}})
+    assert index['survey.questions.q1'] == '问题1'
+    assert index['survey.questions'] == {'q1': '问题1'}
+
+    assert lang.get_translation('index.title', 'en') == lang.resolve('en')['index']['title']
+    assert lang.get_translation('index.title', 'fr') == lang.resolve('zh')['index']['title']
+    assert lang.get_translation('index.missing', 'zh') == 'index.missing'
+
+
+def test_page_cache_invalidation():
+    """模板修改或翻译版本变化后重新渲染"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'index.html')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('v1')
+
+        cache = PageCache(tmp_dir, check_interval=0)
+        renders = []
+
+        def render():
+            renders.append(1)
+            return f'page{len(renders)}'
+
+        assert cache.get('index.html', 'zh', 'a', render) == 'page1'
+        assert cache.get('index.html', 'zh', 'a', render) == 'page1'
+        assert cache.get('index.html', 'en', 'a', render) == 'page2'
+        assert cache.get('index.html', 'zh', 'b', render) == 'page3'
+
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000))
+        assert cache.get('index.html', 'zh', 'b', render) == 'page4'
+        assert cache.stats()['hits'] == 1
+
+
+def test_pages_rendered_with_translations():
+    """页面标题和正文都在服务端翻译，不再请求翻译数据"""
+    client = app_module.app.test_client()
+    app_module.page_cache.clear()
+
+    for language in ('zh', 'en'):
+        with client.session_transaction() as sess:
+            sess['language'] = language
+        response = client.get('/')
+        html = response.get_data(as_text=True)
+        assert response.status_code == 200
+        assert f"<title>{lang.get_translation('index.title', language)} - Free Code</title>" in html
+        assert '/api/translations/' not in html
+        assert lang.get_translation('index.slogan', language) in html
+        assert 'data-t=' not in html
+
+        html = client.get('/check_and_claim').get_data(as_text=True)
+        assert f"<title>{lang.get_translation('survey.title', language)}</title>" in html
+        assert '<html lang="%s">' % lang.get_translation('common.html_lang', language) in html
+        assert lang.get_translation('survey.questions.q1', language) in html
+        assert lang.get_translation('survey.options.personal_brand', language) in html
+
+    renders = app_module.page_cache.stats()['renders']
+    client.get('/')
+    assert app_module.page_cache.stats()['renders'] == renders
+
+
+if __name__ == "__main__":
+    test_flattened_translations()
+    test_page_cache_invalidation()
+    test_pages_rendered_with_translations()
+    print("✅ 页面缓存测试通过")
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""检查热点查询的执行计划：任何一条退化为全表扫描即失败"""
+
+import os
+import re
+import sqlite3
+import tempfile
+
+from app import CODE_BY_EMAIL_SQL, EMAIL_USED_SQL, FINGERPRINT_USED_SQL, PROFESSION_COUNTS_SQL, RECENT_CLAIMS_SQL
+from bulk_admin import (DELETE_STAGED_CODES_SQL, RESET_CODES_SQL, RESET_RELEASED_SQL, RESET_SURVEY_COUNTS_SQL,
+                        RESET_SURVEYS_SQL, RESET_USERS_SQL, stage_keys)
+from change_log import READ_CHANGES_SQL
+from code_dispenser import CLAIM_SQL, EXISTING_CODE_SQL
+from counters import READ_SQL as READ_COUNTERS_SQL
+from exports import CODES_SQL, SURVEYS_SQL
+from rate_limiter import CHECKPOINT_UPDATE_SQL
+from rollup import DAILY_SURVEYS_SQL, SERIES_SQL
+from survey_analytics import PROBLEM_COUNTS_SQL
+from survey_api import API_FIELDS, build_count_query, build_query
+from migrations import MIGRATIONS, current_version, migrate
+
+# 全表扫描的执行计划（兼容 "SCAN codes" 与旧版本的 "SCAN TABLE codes"）
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?(\w+)( AS \w+)?$')
+
+DATE_CONDITIONS = ['s.created_at >= ?', 's.created_at < ?']
+
+# (说明, SQL, 参数)；SQL 都从业务代码导入，与实际执行的语句一致
+HOT_QUERIES = [
+    ('领取-检查已有兑换码', EXISTING_CODE_SQL, ('fp',)),
+    ('领取-分配兑换码', CLAIM_SQL, ('fp',)),
+    ('资格-设备指纹', FINGERPRINT_USED_SQL, ('fp',)),
+    ('资格-邮箱', EMAIL_USED_SQL, ('a@b.com',)),
+    ('限流-写回今日计数', CHECKPOINT_UPDATE_SQL, (1, 0, '1.1.1.1', '2024-01-01 00:00:00')),
+    ('已领取-按邮箱查兑换码', CODE_BY_EMAIL_SQL, ('a@b.com',)),
+    ('统计-最近领取记录', RECENT_CLAIMS_SQL, ()),
+    ('重置-查询释放的兑换码', RESET_RELEASED_SQL, (0, 1)),
+    ('重置-统计调研数', RESET_SURVEY_COUNTS_SQL, (0, 1)),
+    ('重置-释放兑换码', RESET_CODES_SQL, (0, 1)),
+    ('重置-删除调研', RESET_SURVEYS_SQL, (0, 1)),
+    ('重置-删除用户', RESET_USERS_SQL, (0, 1)),
+    ('删除-指定兑换码', DELETE_STAGED_CODES_SQL, (0, 1)),
+    ('导出-兑换码', CODES_SQL, (0, 1000)),
+    ('导出-调研数据', SURVEYS_SQL, ('2024-01-01 00:00:00', 100, 1000)),
+    ('接口-调研分页', build_query(list(API_FIELDS), DATE_CONDITIONS + ['(s.created_at, s.id) < (?, ?)']),
+     ('2024-01-01 00:00:00', '2024-02-01 00:00:00', '2024-01-15 00:00:00', 100, 101)),
+    ('接口-调研计数', build_count_query(DATE_CONDITIONS), ('2024-01-01 00:00:00', '2024-02-01 00:00:00')),
+    ('接口-增量变更', READ_CHANGES_SQL, (0, 1000)),
+    ('统计-物化计数器', READ_COUNTERS_SQL, ()),
+    ('统计-问题选项计数', PROBLEM_COUNTS_SQL, (10,)),
+    ('统计-职业分布', PROFESSION_COUNTS_SQL, ()),
+    ('统计-按天调研数', DAILY_SURVEYS_SQL, (30,)),
+    ('统计-时间序列', SERIES_SQL, ('hour', '2024-01-01', '2024-01-03')),
+]
+
+def seed(conn):
+    """写入少量数据并收集统计信息，让查询计划接近线上"""
+    conn.executemany('INSERT INTO codes (code, is_used, claimed_by_fingerprint) VALUES (?, ?, ?)', [
+        (f'CODE{i}', i % 3 == 0, f'fp{i}' if i % 3 == 0 else None) for i in range(3000)
+    ])
+    conn.executemany('INSERT INTO users (device_fingerprint, email, ip_address) VALUES (?, ?, ?)', [
+        (f'fp{i}', f'u{i}@example.com', f'10.0.{i % 256}.{i % 7}') for i in range(0, 3000, 3)
+    ])
+    conn.executemany('INSERT INTO surveys (device_fingerprint, email, problems, profession) VALUES (?, ?, ?, ?)', [
+        (f'fp{i}', f'u{i}@example.com', 'a,b', f'p{i % 5}') for i in range(0, 3000, 3)
+    ])
+    conn.executemany('INSERT INTO ip_limits (ip_address) VALUES (?)', [
+        (f'10.0.{i % 256}.{i % 7}',) for i in range(2000)
+    ])
+    conn.commit()
+    conn.execute('ANALYZE')
+    # 批量删除和重置按临时表中的键执行
+    stage_keys(conn, ['fp0', 'fp3'])
+
+
+def full_scans(conn, sql, params):
+    """返回执行计划中的全表扫描步骤"""
+    plan = conn.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+    scans = []
+    for row in plan:
+        detail = row[-1]
+        if FULL_SCAN.match(detail):
+            scans.append(detail)
+    return scans
+
+
+def test_migrations_are_versioned():
+    """迁移按版本号执行且可重复运行"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        conn = sqlite3.connect(os.path.join(tmp_dir, 'gift_codes.db'))
+        assert migrate(conn) == [number for number, _, _ in MIGRATIONS]
+        assert migrate(conn) == []
+        assert current_version(conn) == MIGRATIONS[-1][0]
+        conn.close()
+
+
+def test_hot_queries_use_indexes():
+    """热点查询不允许退化为全表扫描"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        conn = sqlite3.connect(os.path.join(tmp_dir, 'gift_codes.db'))
+        migrate(conn)
+        seed(conn)
+
+        failures = []
+        for description, sql, params in HOT_QUERIES:
+            scans = full_scans(conn, sql, params)
+            if scans:
+                failures.append(f'{description}: {scans}')
+            print(f"   {'❌' if scans else '✅'} {description}")
+
+        conn.close()
+        assert failures == [], '\n'.join(failures)
+
+
+if __name__ == "__main__":
+    test_migrations_are_versioned()
+    test_hot_queries_use_indexes()
+    print("✅ 执行计划检查通过")
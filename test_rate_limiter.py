@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""测试共享内存IP限流（每小时尝试、每日成功、跨进程共享、写回数据库）"""
+
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+
+from migrations import migrate
+from rate_limiter import RateLimiter
+
+
+def _child_attempts(path, ip, count):
+    """子进程记录尝试"""
+    limiter = RateLimiter(3, 5, path=path, slots=64, checkpoint_interval=0)
+    for _ in range(count):
+        limiter.record_attempt(ip)
+
+
+def test_rate_limiter():
+    """测试IP限流"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'rate_limit.bin')
+        limiter = RateLimiter(3, 2, path=path, slots=64, checkpoint_interval=0)
+
+        # 每小时最多3次尝试，第4次被拒绝
+        for _ in range(3):
+            limiter.record_attempt('1.2.3.4')
+            assert limiter.check('1.2.3.4') == (True, None)
+        limiter.record_attempt('1.2.3.4')
+        assert limiter.check('1.2.3.4') == (False, 'hourly')
+
+        # 其他IP不受影响
+        limiter.record_attempt('5.6.7.8')
+        assert limiter.check('5.6.7.8') == (True, None)
+
+        # 每日成功次数达到上限
+        limiter.record_success('5.6.7.8')
+        limiter.record_success('5.6.7.8')
+        assert limiter.check('5.6.7.8') == (False, 'daily')
+
+        # 非IP内容按哈希计数
+        limiter.record_attempt('unknown')
+        assert limiter.check('unknown') == (True, None)
+
+        # 其他进程记录的尝试对本进程可见
+        ctx = multiprocessing.get_context('spawn')
+        child = ctx.Process(target=_child_attempts, args=(path, '9.9.9.9', 4))
+        child.start()
+        child.join()
+        assert limiter.check('9.9.9.9') == (False, 'hourly')
+
+        stats = limiter.stats()
+        assert stats['rejected_hourly'] == 2
+        assert stats['rejected_daily'] == 1
+
+
+def test_sliding_window():
+    """滑动窗口：上一窗口的计数按比例衰减"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        limiter = RateLimiter(2, 5, path=os.path.join(tmp_dir, 'rate_limit.bin'),
+                              slots=64, window=1, checkpoint_interval=0)
+        for _ in range(3):
+            limiter.record_attempt('1.2.3.4')
+        assert limiter.check('1.2.3.4') == (False, 'hourly')
+
+        time.sleep(2.1)
+        assert limiter.check('1.2.3.4') == (True, None)
+
+
+def test_checkpoint():
+    """计数写回 ip_limits，新的共享内存从数据库恢复"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'gift_codes.db')
+        conn = sqlite3.connect(db_path)
+        migrate(conn)
+        conn.close()
+
+        limiter = RateLimiter(3, 2, path=os.path.join(tmp_dir, 'a.bin'), slots=64,
+                              checkpoint_interval=0, connect=lambda: sqlite3.connect(db_path))
+        limiter.record_attempt('1.2.3.4')
+        limiter.record_success('1.2.3.4')
+        limiter.record_attempt('1.2.3.4')
+        limiter.record_success('1.2.3.4')
+        # 非IP内容按哈希计数，不写回
+        limiter.record_attempt('unknown')
+        assert limiter.checkpoint(force=True) == 1
+        assert limiter.checkpoint(force=True) == 0
+
+        conn = sqlite3.connect(db_path)
+        rows = conn.execute('SELECT ip_address, attempt_count, success_count FROM ip_limits').fetchall()
+        conn.close()
+        assert rows == [('1.2.3.4', 2, 2)]
+
+        # 写回失败（数据库被锁）时计数保留为有变化，下次写回
+        locker = sqlite3.connect(db_path)
+        locker.execute('BEGIN IMMEDIATE')
+        busy = RateLimiter(3, 2, path=os.path.join(tmp_dir, 'c.bin'), slots=64,
+                           checkpoint_interval=0, connect=lambda: sqlite3.connect(db_path, timeout=0))
+        busy.record_attempt('5.6.7.8')
+        try:
+            busy.checkpoint(force=True)
+            assert False, '数据库被锁时应当抛出异常'
+        except sqlite3.OperationalError:
+            pass
+        locker.rollback()
+        locker.close()
+        assert busy.checkpoint(force=True) == 1
+
+        # 重启后（新的共享内存文件）从数据库恢复今日成功次数
+        restored = RateLimiter(3, 2, path=os.path.join(tmp_dir, 'b.bin'), slots=64,
+                               checkpoint_interval=0, connect=lambda: sqlite3.connect(db_path))
+        assert restored.check('1.2.3.4') == (False, 'daily')
+
+
+if __name__ == "__main__":
+    test_rate_limiter()
+    test_sliding_window()
+    test_checkpoint()
+    print("✅ IP限流测试通过")
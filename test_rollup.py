@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""测试按天/小时统计汇总：触发器增量维护与重建结果一致，尝试和拒绝数定期写入"""
+
+import datetime
+import sqlite3
+
+from code_dispenser import claim_code
+from migrations import migrate
+from rollup import EventBuffer, daily_surveys, parse_range, query_series, rebuild
+
+
+class _Connection(sqlite3.Connection):
+    """close() 不关闭，模拟连接池"""
+
+    def close(self):
+        pass
+
+
+def _snapshot(conn):
+    return conn.execute('SELECT granularity, bucket, surveys, claims, attempts, rejections FROM stats_rollup '
+                        'WHERE surveys != 0 OR claims != 0 OR attempts != 0 OR rejections != 0 '
+                        'ORDER BY granularity, bucket').fetchall()
+
+
+def test_rollup():
+    """测试统计汇总"""
+    conn = sqlite3.connect(':memory:', factory=_Connection)
+    migrate(conn)
+    conn.executemany('INSERT INTO surveys (device_fingerprint, email, created_at) VALUES (?, ?, ?)', [
+        (f'fp{i}', f'{i}@x.com', f'2024-01-0{1 + i % 2} 1{i % 3}:30:00') for i in range(12)
+    ])
+    conn.executemany('INSERT INTO codes (code) VALUES (?)', [(f'CODE{i}',) for i in range(5)])
+    conn.commit()
+    for i in range(3):
+        claim_code(conn, f'fp{i}')
+    # 重置一个用户：释放兑换码并删除调研
+    conn.execute("UPDATE codes SET is_used = FALSE, claimed_at = NULL, claimed_by_fingerprint = NULL WHERE claimed_by_fingerprint = 'fp0'")
+    conn.execute("DELETE FROM surveys WHERE device_fingerprint = 'fp0'")
+    conn.commit()
+
+    today = datetime.date.today().isoformat()
+    day = dict((row[0], row[1:]) for row in conn.execute("SELECT bucket, surveys, claims FROM stats_rollup WHERE granularity = 'day'"))
+    assert day['2024-01-01'] == (5, 0) and day['2024-01-02'] == (6, 0) and day[today] == (0, 2)
+    assert daily_surveys(conn) == [{'survey_date': '2024-01-02', 'count': 6}, {'survey_date': '2024-01-01', 'count': 5}]
+
+    # 尝试和拒绝数在进程内累加，flush 时写入
+    events = EventBuffer(lambda: conn, interval=0)
+    moment = datetime.datetime(2024, 1, 1, 10, 5)
+    events.record('attempts', moment)
+    events.record('attempts', moment)
+    events.record('rejections', moment)
+    assert events.flush() == 1 and events.flush() == 0
+
+    series = query_series(conn, 'hour', '2024-01-01', '2024-01-01')
+    assert series[0] == {'bucket': '2024-01-01 10:00', 'surveys': 1, 'claims': 0, 'attempts': 2, 'rejections': 1}
+    assert [row['bucket'] for row in series] == ['2024-01-01 10:00', '2024-01-01 11:00', '2024-01-01 12:00']
+
+    # 重建结果与增量维护一致，尝试和拒绝数保留
+    before = _snapshot(conn)
+    conn.execute('UPDATE stats_rollup SET surveys = surveys + 7, claims = 0')
+    conn.commit()
+    rebuild(conn)
+    assert _snapshot(conn) == before
+
+
+def test_parse_range():
+    """时间范围参数"""
+    today = datetime.date(2024, 3, 10)
+    assert parse_range('day', None, None, today) == ('2024-02-10', '2024-03-11')
+    assert parse_range('hour', '2024-03-01', '2024-03-01', today) == ('2024-03-01', '2024-03-02')
+    for args in (('week', None, None), ('day', '2024-03-05', '2024-03-01'), ('hour', '2024-01-01', '2024-03-01'),
+                 ('day', '2024/03/01', None)):
+        try:
+            parse_range(*args, today=today)
+        except ValueError:
+            continue
+        raise AssertionError(f'参数应被拒绝: {args}')
+
+
+if __name__ == "__main__":
+    test_rollup()
+    test_parse_range()
+    print("✅ 统计汇总测试通过")
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""测试调研问题拆分与交叉分析"""
+
+import sqlite3
+
+from migrations import _initial_schema, migrate
+from survey_analytics import cross_tabs, problem_counts, record_survey_problems, split_problems
+
+
+def test_survey_problems():
+    """已有数据迁移拆分、新提交写入、删除调研同步删除"""
+    conn = sqlite3.connect(':memory:')
+    _initial_schema(conn.cursor())
+    conn.executemany('INSERT INTO surveys (device_fingerprint, email, profession, country, problems) VALUES (?, ?, ?, ?, ?)', [
+        ('fp1', 'a@x.com', 'teacher', '中国', '做直播,制作课程'),
+        ('fp2', 'b@x.com', 'teacher', 'Singapore', '做直播'),
+        ('fp3', 'c@x.com', '', '中国', ''),
+    ])
+    conn.commit()
+    migrate(conn)
+
+    cursor = conn.execute("INSERT INTO surveys (device_fingerprint, email, profession, country) VALUES ('fp4', 'd@x.com', 'sales', '中国')")
+    record_survey_problems(cursor, cursor.lastrowid, '短视频带货, 做直播,做直播')
+    conn.commit()
+
+    assert split_problems(' a, b,,a ') == ['a', 'b']
+    assert problem_counts(conn) == [
+        {'problems': '做直播', 'count': 3}, {'problems': '制作课程', 'count': 1}, {'problems': '短视频带货', 'count': 1}
+    ]
+    # 次数相同时按选项排序，截断的结果是确定的
+    assert problem_counts(conn, 2) == [{'problems': '做直播', 'count': 3}, {'problems': '制作课程', 'count': 1}]
+
+    analytics = cross_tabs(conn)
+    assert analytics['problems'] == {'做直播': 3, '制作课程': 1, '短视频带货': 1}
+    assert analytics['profession_by_problem'] == {
+        'sales': {'做直播': 1, '短视频带货': 1},
+        'teacher': {'做直播': 2, '制作课程': 1},
+    }
+    assert analytics['country_by_problem']['中国'] == {'做直播': 2, '制作课程': 1, '短视频带货': 1}
+
+    conn.execute("DELETE FROM surveys WHERE device_fingerprint = 'fp1'")
+    conn.commit()
+    assert cross_tabs(conn)['problems'] == {'做直播': 2, '短视频带货': 1}
+
+
+if __name__ == "__main__":
+    test_survey_problems()
+    print("✅ 调研问题分析测试通过")
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""测试翻译数据包：预压缩、内容哈希ETag、文件修改后自动重新加载"""
+
+import gzip
+import json
+import os
+import tempfile
+
+import app as app_module
+from translation_bundles import TranslationBundles, accepts
+
+
+def test_bundles_reload():
+    """文件修改后版本号变化，未修改时不重新加载"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'zh.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'title': '你好'}, f, ensure_ascii=False)
+
+        bundles = TranslationBundles(tmp_dir, check_interval=0)
+        bundle = bundles.get('zh')
+        assert json.loads(bundle.body) == {'title': '你好'}
+        assert json.loads(gzip.decompress(bundle.encoded['gzip'])) == {'title': '你好'}
+        assert bundles.get('zh') is bundle
+        assert bundles.get('fr') is None and bundles.get('en') is None
+
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'title': '您好'}, f, ensure_ascii=False)
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000))
+        assert bundles.get('zh').version != bundle.version
+        assert bundles.stats()['loads'] == 2
+
+    assert accepts('gzip, deflate, br', 'br')
+    assert not accepts('gzip;q=0, deflate', 'gzip')
+    assert not accepts('', 'gzip')
+
+
+def test_translation_routes():
+    """带版本号的地址可长期缓存，ETag未变返回304"""
+    client = app_module.app.test_client()
+    version = app_module.translation_bundles.version('zh')
+
+    response = client.get(f'/api/translations/zh/{version}', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert 'immutable' in response.headers['Cache-Control']
+    assert response.headers['Content-Encoding'] == 'gzip'
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'translations', 'zh.json'), encoding='utf-8') as f:
+        assert json.loads(gzip.decompress(response.data)) == json.load(f)
+
+    etag = response.headers['ETag']
+    response = client.get(f'/api/translations/zh/{version}', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert response.status_code == 304
+
+    # 未带版本号：不压缩，每次验证
+    response = client.get('/api/translations/zh')
+    assert response.status_code == 200 and response.headers['Cache-Control'] == 'no-cache'
+    assert 'Content-Encoding' not in response.headers
+    assert client.get('/api/translations/fr').status_code == 400
+
+
+if __name__ == "__main__":
+    test_bundles_reload()
+    test_translation_routes()
+    print("✅ 翻译数据包测试通过")
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""测试翻译的按需加载、回退顺序、编译缓存和自动重新加载"""
+
+import json
+import os
+import tempfile
+
+from language import LanguageSupport, fallback_chain
+
+
+def _write(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def test_fallback_and_lazy_loading():
+    """zh-TW 缺少的键依次从 zh、默认语言取，语言首次使用时才加载"""
+    assert fallback_chain('zh-TW', 'en') == ['zh-TW', 'zh', 'en']
+    assert fallback_chain('en', 'en') == ['en']
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        _write(os.path.join(tmp_dir, 'zh.json'), {'a': {'b': '中文', 'c': '只有中文'}})
+        _write(os.path.join(tmp_dir, 'zh-TW.json'), {'a': {'b': '繁體'}})
+        _write(os.path.join(tmp_dir, 'en.json'), {'a': {'b': 'English'}, 'd': 'only en'})
+
+        support = LanguageSupport(tmp_dir, check_interval=-1)
+        assert support.index == {}
+        assert support.available_languages() == ['en', 'zh', 'zh-TW']
+
+        assert support.get_translation('a.b', 'en') == 'English'
+        assert set(support.index) == {'en', 'zh'}
+        assert support.get_translation('a.c', 'en') == '只有中文'
+
+        assert support.get_translation('a.b', 'zh-TW') == '繁體'
+        assert support.get_translation('a.c', 'zh-TW') == '只有中文'
+        assert support.get_translation('a.b', 'de') == '中文'
+        assert support.get_translation('a.b', '../zh') == '中文'
+        assert support.get_translation('x.y', 'zh') == 'x.y'
+        # 没有翻译文件的语言缓存为回退语言的别名，别名数量有上限
+        assert support._resolved['de'] is support._resolved['zh']
+        for code in ('fr', 'ja', 'ko', 'ru', 'es', 'it', 'pt'):
+            assert support.get_translation('a.b', code) == '中文'
+        assert len(support._resolved) <= 2 * len(support.available_languages())
+
+        # 新增语言文件后别名失效，使用新文件
+        _write(os.path.join(tmp_dir, 'de.json'), {'a': {'b': 'Deutsch'}})
+        assert support.refresh()
+        assert support.get_translation('a.b', 'de') == 'Deutsch'
+        assert support.get_translation('a.c', 'de') == '只有中文'
+
+        # 已编译的文件可直接读取
+        assert os.path.exists(os.path.join(tmp_dir, 'zh-TW.marshal'))
+        assert LanguageSupport(tmp_dir, check_interval=-1).get_translation('a.b', 'zh-TW') == '繁體'
+
+
+def test_reload_after_change():
+    """翻译文件修改后重新加载，编译文件同时更新"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'zh.json')
+        _write(path, {'title': '旧标题'})
+
+        support = LanguageSupport(tmp_dir, check_interval=0)
+        assert support.get_translation('title') == '旧标题'
+        version = support.version()
+        assert support.version() == version
+
+        _write(path, {'title': '新标题'})
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000))
+        # 版本号变化（缓存的页面重新渲染），之后取到的是新翻译
+        assert support.version() != version
+        assert support.get_translation('title') == '新标题'
+        assert LanguageSupport(tmp_dir, check_interval=-1).get_translation('title') == '新标题'
+
+
+if __name__ == "__main__":
+    test_fallback_and_lazy_loading()
+    test_reload_after_change()
+    print("✅ 翻译加载测试通过")
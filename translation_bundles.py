@@ -0,0 +1,120 @@
+# 翻译数据包（/api/translations/<language>）
+#
+# 每个worker只在首次请求或翻译文件修改后读取一次JSON文件，预先序列化为紧凑JSON，
+# 并预先压缩为 gzip 和 brotli（安装了 brotli 包时），请求时直接返回对应的字节串。
+# 内容哈希同时作为ETag和版本号：页面引用 /api/translations/<language>/<版本号>，
+# 这个地址的内容永不改变，可以长期缓存（Cache-Control: immutable）；
+# 翻译文件修改后版本号变化，页面自动引用新的地址。
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+TRANSLATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'translations')
+TRANSLATION_CHECK_INTERVAL = float(os.environ.get('TRANSLATION_CHECK_INTERVAL', 2))  # 检查翻译文件是否修改的间隔（秒）
+
+# 客户端优先使用的编码
+ENCODINGS = ('br', 'gzip')
+
+
+class Bundle:
+    """一种语言的翻译数据包"""
+
+    def __init__(self, language, data, mtime):
+        self.language = language
+        self.mtime = mtime
+        self.body = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self.version = hashlib.sha256(self.body).hexdigest()[:16]
+        self.encoded = {'gzip': gzip.compress(self.body, 9, mtime=0)}
+        if brotli is not None:
+            self.encoded['br'] = brotli.compress(self.body, quality=11)
+
+    def representation(self, accept_encoding):
+        """按 Accept-Encoding 选择表示，返回 (编码或None, 字节串, ETag)"""
+        for encoding in ENCODINGS:
+            if encoding in self.encoded and accepts(accept_encoding, encoding):
+                return encoding, self.encoded[encoding], f'{self.version}-{encoding}'
+        return None, self.body, self.version
+
+
+def accepts(accept_encoding, encoding):
+    """Accept-Encoding 是否接受某种编码（q=0 表示不接受）"""
+    for item in (accept_encoding or '').split(','):
+        name, _, params = item.strip().partition(';')
+        if name.strip().lower() != encoding:
+            continue
+        params = params.replace(' ', '')
+        if not params.startswith('q='):
+            return True
+        try:
+            return float(params[2:]) > 0
+        except ValueError:
+            return False
+    return False
+
+
+class TranslationBundles:
+    """按语言缓存的翻译数据包，文件修改时间变化后自动重新加载"""
+
+    def __init__(self, directory=None, languages=('zh', 'en'), check_interval=None):
+        self.directory = directory or TRANSLATIONS_DIR
+        self.languages = tuple(languages)
+        self.check_interval = TRANSLATION_CHECK_INTERVAL if check_interval is None else check_interval
+        self._lock = threading.Lock()
+        self._bundles = {}
+        self._checked = {}
+        self._stats = {'loads': 0, 'hits': 0, 'not_modified': 0}
+
+    def _path(self, language):
+        return os.path.join(self.directory, f'{language}.json')
+
+    def get(self, language):
+        """获取翻译数据包，语言不支持或文件不存在时返回None"""
+        if language not in self.languages:
+            return None
+
+        bundle = self._bundles.get(language)
+        now = time.monotonic()
+        if bundle is not None and now - self._checked.get(language, 0) < self.check_interval:
+            return bundle
+
+        # 超过检查间隔才 stat 一次文件
+        try:
+            mtime = os.stat(self._path(language)).st_mtime_ns
+        except OSError:
+            return None
+        self._checked[language] = now
+        if bundle is not None and bundle.mtime == mtime:
+            return bundle
+
+        with self._lock:
+            bundle = self._bundles.get(language)
+            if bundle is None or bundle.mtime != mtime:
+                with open(self._path(language), 'r', encoding='utf-8') as f:
+                    bundle = Bundle(language, json.load(f), mtime)
+                self._bundles[language] = bundle
+                self._stats['loads'] += 1
+        return bundle
+
+    def version(self, language):
+        bundle = self.get(language)
+        return bundle.version if bundle else None
+
+    def count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['versions'] = {language: bundle.version for language, bundle in self._bundles.items()}
+        stats['brotli'] = brotli is not None
+        return stats